@@ -9,6 +9,8 @@ from __future__ import annotations
 
 import re
 
+from src.resilience import CircuitOpenError
+
 
 class ProviderError(Exception):
     """A tenant BYOK provider (Gemini/E2B) failed in a way the user must resolve.
@@ -43,6 +45,8 @@ _PROVIDER_SIGNALS = (
 
 def is_provider_error(exc: Exception) -> bool:
     """Heuristically classify an exception as a BYOK provider failure (PRD §5.2)."""
+    if isinstance(exc, CircuitOpenError):
+        return True
     text = str(exc).lower()
     return any(signal in text for signal in _PROVIDER_SIGNALS)
 
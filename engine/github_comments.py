@@ -86,6 +86,49 @@ def render_review_comment(
     return "\n".join(lines)
 
 
+def render_streaming_review(filename: str, partial: dict, done: bool = False) -> str:
+    """Live comment: Agent A findings so far, edited in place while it streams (PRD §3.5)."""
+    lines = [BOT_MARKER, f"## 🤖 RepoRover Review — `{sanitize(filename, 200)}`"]
+    lines.append("")
+    lines.append("### Summary")
+    lines.append(sanitize(partial.get("summary", "")) or "_Reviewing…_")
+    lines.append("")
+
+    lines.append("### Issues Found")
+    issues = [i for i in (partial.get("issues") or []) if isinstance(i, dict) and i.get("description")]
+    if issues:
+        for issue in issues:
+            sev = sanitize(issue.get("severity", "Info"), 20)
+            line_no = issue.get("line_number", "?")
+            desc = sanitize(issue.get("description", ""), 500)
+            lines.append(f"- **[{sev}] line {line_no}** — {desc}")
+    elif done:
+        lines.append("_No blocking issues detected._")
+    lines.append("")
+
+    lines.append("---")
+    if done:
+        lines.append("_Review complete. Preparing the proposed refactor and tests…_")
+    else:
+        lines.append("_RepoRover is still reviewing this file; this comment updates live._")
+    return "\n".join(lines)
+
+
+def render_noop_comment(filename: str, intent_summary: str, review_issues: List[dict]) -> str:
+    """Short closing comment for the fast path: nothing to refactor, test or run."""
+    if review_issues:
+        verdict = "✅ Reviewed — no code changes proposed."
+    else:
+        verdict = "✅ Reviewed — no issues found."
+    lines = [
+        BOT_MARKER,
+        f"## {verdict} `{sanitize(filename, 200)}`",
+        "",
+        sanitize(intent_summary, 500),
+    ]
+    return "\n".join(lines)
+
+
 def render_final_comment(
     filename: str,
     execution_status: str,
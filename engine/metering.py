@@ -0,0 +1,157 @@
+"""Token, latency and cost metering for review graphs.
+
+A :class:`MeteringHandler` rides along in the graph's ``config["callbacks"]``.
+LangChain propagates it to every chat-model call made inside a node, and the
+node name arrives in the run metadata (``langgraph_node``), so the agents
+need no metering code of their own. Sandbox runs are reported by the executor
+as a ``sandbox_run`` custom event. Records are buffered in memory and written
+to :class:`~tenancy.models.NodeMetric` in one ``bulk_create`` per task.
+The task also hands over each graph run's checkpoint (de)serialization
+counters (:func:`src.graph.run_graph`), recorded as one ``checkpoint`` row.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from django.conf import settings
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tenancy.models import NodeMetric, OrganizationConfig, ReviewSession
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_EVENT = "sandbox_run"
+
+
+def _prices() -> Dict[str, list]:
+    """USD per 1M (input, output) tokens by model name, from ``LLM_PRICES_JSON``."""
+    raw = getattr(settings, "LLM_PRICES_JSON", "") or ""
+    try:
+        return json.loads(raw) if raw else {}
+    except ValueError:
+        logger.warning("LLM_PRICES_JSON is not valid JSON; costs will not be estimated.")
+        return {}
+
+
+def estimate_cost_micro_usd(model_name: str, input_tokens: int, output_tokens: int) -> int:
+    price = _prices().get(model_name)
+    if not price:
+        return 0
+    # USD per million tokens == micro-USD per token.
+    return int(round(input_tokens * price[0] + output_tokens * price[1]))
+
+
+def _usage(response) -> tuple:
+    """Pull (input, output) token counts out of an LLMResult, whichever way the provider reports them."""
+    for generations in response.generations or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+
+
+class MeteringHandler(BaseCallbackHandler):
+    """Collects per-node LLM and sandbox measurements for one review session."""
+
+    def __init__(self, session: ReviewSession, org: OrganizationConfig):
+        self.session = session
+        self.org = org
+        self.records: List[NodeMetric] = []
+        self._started: Dict[UUID, tuple] = {}
+        self._lock = threading.Lock()
+
+    # --- chat model runs ---------------------------------------------------
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID,
+                            metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        with self._lock:
+            self._started[run_id] = (
+                time.monotonic(),
+                metadata.get("langgraph_node", ""),
+                metadata.get("ls_provider", ""),
+                metadata.get("ls_model_name", ""),
+            )
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        input_tokens, output_tokens = _usage(response)
+        self._finish(run_id, input_tokens, output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, 0, 0)
+
+    def _finish(self, run_id: UUID, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        start, node, provider, model_name = started
+        self._add(
+            node=node,
+            kind=NodeMetric.Kind.LLM,
+            provider=provider,
+            model_name=model_name,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            wall_ms=int((time.monotonic() - start) * 1000),
+            cost_micro_usd=estimate_cost_micro_usd(model_name, input_tokens, output_tokens),
+        )
+
+    # --- sandbox runs ------------------------------------------------------
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID,
+                        metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        if name != SANDBOX_EVENT:
+            return
+        self._add(
+            node=data.get("node") or (metadata or {}).get("langgraph_node", ""),
+            kind=NodeMetric.Kind.SANDBOX,
+            provider=data.get("provider", ""),
+            wall_ms=int(data.get("wall_ms", 0)),
+            install_saved_ms=int(data.get("install_saved_ms", 0)),
+        )
+
+    # --- checkpoint serialization ------------------------------------------
+    def add_checkpoint_serde(self, stats: dict) -> None:
+        """Record one graph run's checkpoint serde counters (see ``run_graph``)."""
+        if not stats.get("dumps") and not stats.get("loads"):
+            return
+        self._add(
+            node="checkpointer",
+            kind=NodeMetric.Kind.CHECKPOINT,
+            wall_ms=int((stats["dumps_seconds"] + stats["loads_seconds"]) * 1000),
+            raw_bytes=stats["raw_bytes"],
+            stored_bytes=stats["stored_bytes"],
+        )
+
+    # --- persistence -------------------------------------------------------
+    def _add(self, **fields) -> None:
+        record = NodeMetric(session=self.session, org_config=self.org, **fields)
+        with self._lock:
+            self.records.append(record)
+
+    def flush(self) -> int:
+        """Persist buffered records; metering failures never fail the review."""
+        with self._lock:
+            records, self.records = self.records, []
+        if not records:
+            return 0
+        try:
+            NodeMetric.objects.bulk_create(records)
+        except Exception:
+            logger.exception("Failed to persist %d node metrics for session %s", len(records), self.session.pk)
+            return 0
+        return len(records)
+
+
+def attach(config: dict, session: ReviewSession, org: OrganizationConfig) -> MeteringHandler:
+    """Add a metering handler to a graph run config and return it for flushing."""
+    handler = MeteringHandler(session, org)
+    config.setdefault("callbacks", []).append(handler)
+    return handler
+
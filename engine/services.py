@@ -6,15 +6,20 @@ read ONLY from the database, never from PR contents — PRD §6.1).
 """
 from __future__ import annotations
 
+import logging
+import uuid
 from typing import Optional, Tuple
 
 from django.conf import settings
 
 from src.github_tools import GitHubConnector
+from src.governor import MemoryBackend, RateGovernor, RedisBackend
 from tenancy.models import OrganizationConfig, RepoSettings, ReviewSession
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+logger = logging.getLogger(__name__)
+
 def get_tenant_llm(org: OrganizationConfig):
     """
     Dynamic factory initializing any cloud provider or local pipeline 
@@ -90,6 +95,45 @@ def at_capacity(repo: RepoSettings) -> bool:
     return active_session_count(repo) >= repo.max_concurrency
 
 
+def session_superseded(session: ReviewSession) -> bool:
+    """True once a newer session for the same PR targets a different commit (a ``synchronize`` landed)."""
+    try:
+        return ReviewSession.objects.filter(
+            repo_settings_id=session.repo_settings_id,
+            pr_number=session.pr_number,
+            id__gt=session.id,
+        ).exclude(commit_sha=session.commit_sha).exists()
+    except Exception:
+        # A flaky DB must not kill a healthy run; the next poll asks again.
+        logger.warning("Could not check whether session %s was superseded.", session.id, exc_info=True)
+        return False
+
+
+def reclaimable_threads(thread_ids, idle_since) -> Tuple[list, list]:
+    """Split stored checkpoint threads for the retention sweep.
+
+    Returns the thread ids no live session needs (no session, or a completed
+    one) and the live sessions untouched since ``idle_since`` (abandoned).
+    """
+    live = {
+        str(session.langgraph_thread_id): session
+        for session in ReviewSession.objects.select_related("repo_settings__org_config").filter(
+            langgraph_thread_id__in=[thread for thread in thread_ids if _is_uuid(thread)]
+        ).exclude(current_status=ReviewSession.Status.COMPLETED)
+    }
+    abandoned = [session for session in live.values() if session.updated_at < idle_since]
+    keep = set(live) - {str(session.langgraph_thread_id) for session in abandoned}
+    return [thread for thread in thread_ids if thread not in keep], abandoned
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
+
+
 def build_connector(org: OrganizationConfig, repo: RepoSettings) -> GitHubConnector:
     """Authenticate to GitHub as the App installation for this tenant (PRD §3.4)."""
     return GitHubConnector.from_installation(
@@ -100,7 +144,39 @@ def build_connector(org: OrganizationConfig, repo: RepoSettings) -> GitHubConnec
     )
 
 
-def tenant_runtime_config(org, thread_id):
+def resolve_node_models(org: OrganizationConfig, repo: Optional[RepoSettings] = None) -> dict:
+    """Resolve the model each graph node runs on: repo override > org override > org default."""
+    org_models = org.node_models or {}
+    repo_models = (repo.node_models or {}) if repo is not None else {}
+    return {
+        node: repo_models.get(node) or org_models.get(node) or org.llm_model_name
+        for node in OrganizationConfig.TIERED_NODES
+    }
+
+
+_governor_backend = None
+
+
+def _rate_backend():
+    """Process-wide governor backend: Redis when configured, else in-memory."""
+    global _governor_backend
+    if _governor_backend is None:
+        url = getattr(settings, "GOVERNOR_REDIS_URL", "")
+        _governor_backend = RedisBackend.from_url(url) if url else MemoryBackend()
+    return _governor_backend
+
+
+def build_rate_governor(org: OrganizationConfig) -> RateGovernor:
+    """Rate governor shared by every review using this tenant's LLM key."""
+    return RateGovernor(
+        _rate_backend(),
+        org.llm_key_fingerprint,
+        rpm=org.llm_rpm_limit,
+        tpm=org.llm_tpm_limit,
+    )
+
+
+def tenant_runtime_config(org, thread_id, repo=None):
     """
     Builds the state dictionary metadata configuration that LangGraph 
     injects directly into the agent node executors context loop (PRD §3.1).
@@ -114,7 +190,15 @@ def tenant_runtime_config(org, thread_id):
             "llm_model_name": org.llm_model_name,
             "llm_base_url": org.llm_base_url,
             "llm_key": org.get_llm_key(),       # Resolves any active provider key cleanly
+            "llm_key_fingerprint": org.llm_key_fingerprint,  # Scopes circuit breakers per key
             "e2b_api_key": org.get_e2b_key(),   # Resolves sandbox execution credentials
+            "executor_backend": org.executor_backend,  # "" -> EXECUTOR_BACKEND
+
+            # --- MODEL TIERING ---
+            "node_models": resolve_node_models(org, repo),
+            "escalation_model": org.escalation_model if org.auto_escalate else "",
+            "fallback_model": org.fallback_model,
+            "rate_governor": build_rate_governor(org),
             
             # Legacy fallback strings to maintain structural compatibility with other components
             "gemini_api_key": org.get_llm_key(),
@@ -0,0 +1,69 @@
+"""Live, edit-in-place PR comments for streamed agent output (PRD §3.5).
+
+Agent A streams partial structured output while it reviews. Instead of waiting
+for the graph to pause, the first partial opens a single inline comment and
+later partials edit that same comment, throttled so a fast token stream does
+not turn into a burst of GitHub API writes. When the graph pauses, the final
+proposal replaces the live body rather than being posted as a second comment.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Optional
+
+from engine.github_comments import render_streaming_review
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between two edits of the same live comment.
+MIN_EDIT_INTERVAL = 3.0
+
+
+class LiveReviewComment:
+    """Throttled writer for one streamed review comment on one file."""
+
+    def __init__(self, gh, pr_number: int, commit_sha: str, filename: str,
+                 min_interval: float = MIN_EDIT_INTERVAL, clock=time.monotonic):
+        self.gh = gh
+        self.pr_number = pr_number
+        self.commit_sha = commit_sha
+        self.filename = filename
+        self.min_interval = min_interval
+        self.comment_id: Optional[int] = None
+        self._clock = clock
+        self._last_push = 0.0
+        self._last_body = ""
+
+    def update(self, partial: dict, done: bool = False) -> None:
+        """Stream callback handed to Agent A via ``config["configurable"]["review_stream"]``."""
+        if not partial.get("summary") and not partial.get("issues"):
+            return
+        now = self._clock()
+        if not done and self.comment_id is not None and now - self._last_push < self.min_interval:
+            return
+        self._push(render_streaming_review(self.filename, partial, done=done), now)
+
+    def finalize(self, body: str) -> bool:
+        """Replace the live body with ``body``. Returns False if it could not be edited."""
+        if self.comment_id is None:
+            return False
+        return self._push(body, self._clock())
+
+    def _push(self, body: str, now: float) -> bool:
+        if body == self._last_body:
+            return True
+        # A live preview must never break the review itself.
+        try:
+            if self.comment_id is None:
+                self.comment_id = self.gh.post_inline_pr_comment(
+                    self.pr_number, self.commit_sha, self.filename, body
+                )
+            else:
+                self.gh.edit_inline_pr_comment(self.pr_number, self.comment_id, self.filename, body)
+        except Exception:
+            logger.exception("Failed to update live review comment for %s", self.filename)
+            return False
+        self._last_push = now
+        self._last_body = body
+        return True
@@ -4,6 +4,7 @@ Two entry points mirror the two webhook events (PRD §3.3):
 
 * ``handle_pull_request`` — opened/synchronize: open a review job, run Agents
   A→B, pause before the sandbox, and post the proposal to the PR (PRD §3.5).
+  On closed, the PR's open reviews are completed and their checkpoints dropped.
 * ``handle_issue_comment`` — a slash-command reply that resumes the paused graph
   along the /approve, /reject, or /skip path (PRD §3.6).
 
@@ -11,13 +12,20 @@ All heavy work (hydration, LLM, sandbox) lives here, off the request thread, so
 the webhook view can return HTTP 200 within GitHub's 10s budget.
 """
 from __future__ import annotations
+import functools
 import re
 import logging
+from datetime import timedelta
+from typing import Optional
 
 from celery import shared_task
 from django.db import transaction
-from src.graph import get_app, get_conflict_app
-from engine import services
+from django.utils import timezone
+from src import retention
+from src.graph import (
+    get_app, get_conflict_app, run_graph, is_noop, resume_with, checkpoint_store, state_blob_store,
+)
+from engine import metering, services
 from engine.errors import (
     ProviderError,
     is_provider_error,
@@ -25,8 +33,16 @@ from engine.errors import (
     execution_paused_comment,
 )
 from langchain_core.messages import HumanMessage
-from engine.github_comments import render_review_comment, render_final_comment, BOT_MARKER
+from engine.github_comments import (
+    render_review_comment,
+    render_final_comment,
+    render_noop_comment,
+    BOT_MARKER,
+)
 from engine.slash import parse_command, APPROVE, REJECT, SKIP
+from engine.streaming import LiveReviewComment
+from src.executors import discard_session
+from src.suite_discovery import BranchTestSource
 from tenancy.models import OrganizationConfig, RepoSettings, ReviewSession
 
 logger = logging.getLogger(__name__)
@@ -56,6 +72,9 @@ def _trigger_pr_fanout(gh, org, repo, pr_number: int, head_sha: str):
         )
         return
 
+    # A new head makes earlier sessions' sandboxes stale; don't keep them parked until their TTL.
+    _discard_stale_sandboxes(repo, pr_number, head_sha)
+
     # 2. Fan-out: Create a separate session & task for every file
     for target_file in target_files:
         session = ReviewSession.objects.create(
@@ -69,6 +88,20 @@ def _trigger_pr_fanout(gh, org, repo, pr_number: int, head_sha: str):
         process_file_review.delay(session.id)
 
 
+def _discard_stale_sandboxes(repo, pr_number: int, head_sha: str):
+    stale = ReviewSession.objects.filter(repo_settings=repo, pr_number=pr_number).exclude(
+        commit_sha=head_sha
+    ).exclude(current_status=ReviewSession.Status.COMPLETED)
+    api_key = _e2b_key(repo.org_config)
+    for thread_id in stale.values_list("langgraph_thread_id", flat=True):
+        discard_session(str(thread_id), api_key=api_key)
+
+
+def _e2b_key(org) -> Optional[str]:
+    # Sandboxes parked by other worker processes are killed by id, with the tenant's key.
+    return org.get_e2b_key() or None
+
+
 def _trigger_conflict_resolution(gh, org, repo, pr_number: int, target_file: str):
     """Helper: Initiates the dedicated Agent D Conflict Resolution flow."""
     pr_data = gh.get_pr_details(pr_number)
@@ -89,20 +122,13 @@ def _trigger_conflict_resolution(gh, org, repo, pr_number: int, target_file: str
     )
 
     repo_map = gh.get_repo_map(pr_data["files"], pr_data["head_branch"])
-    expected_test_name = f"test_{target_file.split('/')[-1]}"
-    alt_test_name = f"{target_file.split('/')[-1].replace('.py', '')}_test.py"
-    
-    existing_test_path = None
-    existing_test_code = None
-    for filepath, f_content in repo_map.items():
-        if filepath.endswith(expected_test_name) or filepath.endswith(alt_test_name):
-            existing_test_path = filepath
-            existing_test_code = f_content
-            break
-    
+
     thread_id = str(session.langgraph_thread_id)
-    config = services.tenant_runtime_config(org, thread_id)
+    config = services.tenant_runtime_config(org, thread_id, repo)
     config["configurable"]["llm"] = services.get_tenant_llm(org)
+    # The existing suite is located by the graph's test-discovery branch.
+    config["configurable"]["test_source"] = BranchTestSource(gh, pr_data["head_branch"])
+    meter = metering.attach(config, session, org)
 
     initial_state = {
         "repo_path": repo.repository_name,
@@ -112,16 +138,16 @@ def _trigger_conflict_resolution(gh, org, repo, pr_number: int, target_file: str
         "conflict_file_content": conflict_content,
         "repo_files": repo_map,
         "pr_description": f"Title: {pr_data['title']}\nDesc: {pr_data['description']}",
-        "existing_test_path": existing_test_path,
-        "existing_test_code": existing_test_code,
         "iteration_count": 0,
     }
     
     app = get_conflict_app()
     
     # Run Agent D -> Agent T -> pause before Executor
-    for _ in app.stream(initial_state, config=config):
-        pass
+    try:
+        meter.add_checkpoint_serde(run_graph(app, initial_state, config))
+    finally:
+        meter.flush()
         
     snapshot = app.get_state(config)
     proposed_code = snapshot.values.get("refactored_code", "")
@@ -133,6 +159,7 @@ def _trigger_conflict_resolution(gh, org, repo, pr_number: int, target_file: str
     
     session.current_status = ReviewSession.Status.AWAITING_HUMAN
     session.save(update_fields=["current_status", "updated_at"])
+    _trim_checkpoints(session)
 
 
 # --------------------------------------------------------------------------- #
@@ -141,9 +168,9 @@ def _trigger_conflict_resolution(gh, org, repo, pr_number: int, target_file: str
 
 @shared_task(bind=True, max_retries=None)
 def handle_pull_request(self, payload: dict):
-    """Triggered on PR opened or synchronize."""
+    """Triggered on PR opened, synchronize or closed."""
     action = payload.get("action")
-    if action not in ("opened", "synchronize"):
+    if action not in ("opened", "synchronize", "closed"):
         return
 
     installation_id = payload["installation"]["id"]
@@ -155,6 +182,13 @@ def handle_pull_request(self, payload: dict):
     org, repo = services.resolve_tenant(installation_id, repo_full_name)
     if not org or not repo:
         return
+    if action == "closed":
+        # Merged or abandoned: nobody can act on its open reviews any more.
+        for session in ReviewSession.objects.filter(repo_settings=repo, pr_number=pr_number).exclude(
+            current_status=ReviewSession.Status.COMPLETED
+        ):
+            _complete(session)
+        return
     if not org.has_keys:
         return
 
@@ -184,12 +218,16 @@ def process_file_review(self, session_id: int, command: str = None, feedback: st
     gh = services.build_connector(org, repo)
     pr_number = session.pr_number
     filename = session.file_path
+    meter = None
 
     try:
         llm_instance = services.get_tenant_llm(org)
         thread_id = str(session.langgraph_thread_id)
-        config = services.tenant_runtime_config(org, thread_id)
+        config = services.tenant_runtime_config(org, thread_id, repo)
         config["configurable"]["llm"] = llm_instance
+        # A synchronize that supersedes this session's commit cancels its sandbox run.
+        config["configurable"]["cancelled"] = functools.partial(services.session_superseded, session)
+        meter = metering.attach(config, session, org)
         
         # Determine active graph deployment mapping
         if command == "commit_merge":
@@ -205,16 +243,6 @@ def process_file_review(self, session_id: int, command: str = None, feedback: st
             pr_data = gh.get_pr_details(pr_number)
             repo_map = gh.get_repo_map(pr_data["files"], pr_data["head_branch"])
             content = repo_map.get(filename) or gh.get_file_content(filename, branch=pr_data["head_branch"])
-            
-            expected_test_name = f"test_{filename.split('/')[-1]}"
-            alt_test_name = f"{filename.split('/')[-1].replace('.py', '')}_test.py"
-            
-            existing_test_path, existing_test_code = None, None
-            for filepath, f_content in repo_map.items():
-                if filepath.endswith(expected_test_name) or filepath.endswith(alt_test_name):
-                    existing_test_path = filepath
-                    existing_test_code = f_content
-                    break
 
             initial_state = {
                 "repo_path": repo.repository_name,
@@ -224,15 +252,18 @@ def process_file_review(self, session_id: int, command: str = None, feedback: st
                 "repo_files": repo_map,
                 "pr_description": f"Title: {pr_data['title']}\nDesc: {pr_data['description']}",
                 "iteration_count": 0,
-                "existing_test_path": existing_test_path,
-                "existing_test_code": existing_test_code,
             }
+            config["configurable"]["test_source"] = BranchTestSource(gh, pr_data["head_branch"])
             
-            for _ in app.stream(initial_state, config=config): pass
+            # Agent A streams its findings into one live comment, edited in place.
+            live = LiveReviewComment(gh, pr_number, session.commit_sha, filename)
+            config["configurable"]["review_stream"] = live.update
+
+            meter.add_checkpoint_serde(run_graph(app, initial_state, config))
 
             session.current_status = ReviewSession.Status.AWAITING_HUMAN
             session.save(update_fields=["current_status", "updated_at"])
-            _report_pause(gh, session, app, config, filename)
+            _report_pause(gh, session, app, config, filename, live=live)
             
             # CRITICAL: Return here so it does not fall into Phase 2 on initial run
             return
@@ -258,45 +289,46 @@ def process_file_review(self, session_id: int, command: str = None, feedback: st
                 )
                 
             gh.post_pr_comment(pr_number, f"{BOT_MARKER}\nConflict resolved and successfully committed to the branch.")
-            session.current_status = 'COMPLETED'
-            session.save(update_fields=["current_status", "updated_at"])
+            _complete(session)
             return
 
         elif command == "approve":
-            # State implementation for entering E2B Sandbox node loop
-            app.update_state(config, {"execution_status": "APPROVED"}, as_node="executor_tool_node")
+            # Resume the paused step: the sandbox runs while Agent C drafts the docs.
+            # "/approve full" bypasses test impact selection and runs the whole suite.
+            resume_with(app, config, {
+                "execution_status": "APPROVED",
+                "run_full_suite": "full" in (feedback or "").lower().split(),
+            })
 
         elif command == "reject":
-            # 🚀 FIX: Inject human feedback, wipe stale tests, and explicitly route back to refactorer
-            app.update_state(
+            # 🚀 FIX: Inject human feedback; the executor wipes stale tests and routes back to refactorer
+            resume_with(
+                app,
                 config,
                 {
-                    "execution_status": "FAILURE",
+                    "execution_status": "REJECTED",
                     "execution_logs": f"HUMAN REJECTION: {feedback}",
                     "messages": [HumanMessage(content=f"User manually rejected the code. Feedback: {feedback}")],
-                    "final_test_code": "", 
-                    "iteration_count": snapshot.values.get("iteration_count", 0),
-                    "next_node": "refactorer_node",
                 },
-                as_node="executor_tool_node",
             )
 
         elif command == "skip":
-            app.update_state(
-                config,
-                {"execution_status": "SKIPPED_TO_DOCS", "execution_logs": "User skipped."},
-                as_node="executor_tool_node",
-            )
+            resume_with(app, config, {"execution_status": "SKIPPED_TO_DOCS", "execution_logs": "User skipped."})
 
         # ===================================================================
         # PHASE 3: STREAM & COMPLETE
         # ===================================================================
         # Stream resumption through the rest of the node graph steps
-        for _ in app.stream(None, config=config): pass
+        meter.add_checkpoint_serde(run_graph(app, None, config))
 
         # Re-evaluate final state status context
         updated_snapshot = app.get_state(config)
-        
+
+        if updated_snapshot.values.get("execution_status") == "CANCELLED":
+            # A newer commit superseded this session; its own review reports instead.
+            _complete(session)
+            return
+
         if updated_snapshot.values.get("next_node") == "refactorer_node" or updated_snapshot.next:
             # 🔄 LOOP-BACK PATH (Sandbox failure or manual /reject)
             session.current_status = ReviewSession.Status.AWAITING_HUMAN
@@ -305,11 +337,10 @@ def process_file_review(self, session_id: int, command: str = None, feedback: st
             
         else:
             # 🏁 FINAL COMPLETION PATH (Success or Skip)
-            session.current_status = 'COMPLETED'
-            session.save(update_fields=["current_status", "updated_at"])
+            _complete(session)
             
             final_vals = updated_snapshot.values
-            docs = final_vals.get("documentation", "No documentation generated.")
+            docs = final_vals.get("documentation_diff") or "No documentation generated."
             pr_data = gh.get_pr_details(pr_number)
             branch_name = pr_data["head_branch"]
             
@@ -351,6 +382,9 @@ def process_file_review(self, session_id: int, command: str = None, feedback: st
 
     except Exception as exc: 
         _handle_failure(gh, session, pr_number, exc)
+    finally:
+        if meter is not None:
+            meter.flush()
 # --------------------------------------------------------------------------- #
 # Issue comment -> resume a paused review along a slash-command path
 # --------------------------------------------------------------------------- #
@@ -457,6 +491,7 @@ def handle_issue_comment(self, payload: dict):
 
     for s in sessions:
         if latest_sha and latest_sha != s.commit_sha:
+            discard_session(str(s.langgraph_thread_id), api_key=_e2b_key(org))
             msg = f"{BOT_MARKER}\nCommand rejected for `{s.file_path}`. This session targets an outdated commit."
             if is_inline:
                 gh.post_inline_pr_comment(pr_number, latest_sha, inline_file, msg)
@@ -496,42 +531,53 @@ def handle_issue_comment(self, payload: dict):
 # Shared reporting helpers
 # --------------------------------------------------------------------------- #
 
-def _report_pause(gh, session: ReviewSession, app, config, filename: str):
-    """Inspect the graph: if finished, post final; if paused, post a new proposal inline."""
+def _report_pause(gh, session: ReviewSession, app, config, filename: str, live: LiveReviewComment = None):
+    """Inspect the graph: if finished, post final; if paused, post a new proposal inline.
+
+    When Agent A streamed into a live comment, that comment is edited in place
+    instead of posting a second one.
+    """
     snapshot = app.get_state(config)
     values = snapshot.values
 
+    if not snapshot.next and is_noop(values):
+        # Fast path: clean review or unchanged refactor, one short comment and done.
+        _post_or_finalize(gh, session, filename, live, render_noop_comment(
+            filename=filename,
+            intent_summary=values.get("intent_summary", ""),
+            review_issues=values.get("review_issues", []),
+        ))
+        _complete(session)
+        return
+
     if not snapshot.next:
-        gh.post_inline_pr_comment(
-            session.pr_number,
-            session.commit_sha,
-            filename,
-            render_final_comment(
-                filename=filename,
-                execution_status=values.get("execution_status", "UNKNOWN"),
-                execution_logs=values.get("execution_logs", ""),
-                documentation_diff=values.get("documentation_diff", ""),
-            ),
-        )
+        _post_or_finalize(gh, session, filename, live, render_final_comment(
+            filename=filename,
+            execution_status=values.get("execution_status", "UNKNOWN"),
+            execution_logs=values.get("execution_logs", ""),
+            documentation_diff=values.get("documentation_diff", ""),
+        ))
         _complete(session)
         return
 
     # Post an INLINE comment for the specific file
-    gh.post_inline_pr_comment(
-        session.pr_number,
-        session.commit_sha,
-        filename,
-        render_review_comment(
-            filename=filename,
-            intent_summary=values.get("intent_summary", ""),
-            review_issues=values.get("review_issues", []),
-            refactored_code=values.get("refactored_code", ""),
-            code_diff=values.get("code_diff", ""),
-            iteration=values.get("iteration_count", 0),
-        ),
-    )
+    _post_or_finalize(gh, session, filename, live, render_review_comment(
+        filename=filename,
+        intent_summary=values.get("intent_summary", ""),
+        review_issues=values.get("review_issues", []),
+        refactored_code=values.get("refactored_code", ""),
+        code_diff=values.get("code_diff", ""),
+        iteration=values.get("iteration_count", 0),
+    ))
     session.current_status = ReviewSession.Status.AWAITING_HUMAN
     session.save(update_fields=["current_status", "updated_at"])
+    _trim_checkpoints(session)
+
+
+def _post_or_finalize(gh, session: ReviewSession, filename: str, live, body: str):
+    if live is not None and live.finalize(body):
+        return
+    gh.post_inline_pr_comment(session.pr_number, session.commit_sha, filename, body)
 
 
 def _handle_failure(gh, session: ReviewSession, pr_number: int, exc: Exception):
@@ -553,4 +599,59 @@ def _handle_failure(gh, session: ReviewSession, pr_number: int, exc: Exception):
 def _complete(session: ReviewSession):
     session.current_status = ReviewSession.Status.COMPLETED
     session.active_jobs = 0
-    session.save(update_fields=["current_status", "active_jobs", "updated_at"])
\ No newline at end of file
+    session.save(update_fields=["current_status", "active_jobs", "updated_at"])
+    # The review is over; free the sandbox its retry loop was holding, and its checkpoints.
+    discard_session(str(session.langgraph_thread_id), api_key=_e2b_key(session.repo_settings.org_config))
+    try:
+        checkpoint_store().delete([str(session.langgraph_thread_id)])
+    except Exception:
+        # The background sweep retries; completing the session must not fail on it.
+        logger.warning("Could not delete checkpoints of session %s.", session.id, exc_info=True)
+
+
+def _trim_checkpoints(session: ReviewSession):
+    """A session waiting on a human resumes from its latest checkpoint only; drop the rest."""
+    try:
+        checkpoint_store().keep_latest([str(session.langgraph_thread_id)])
+    except Exception:
+        logger.warning("Could not trim checkpoints of session %s.", session.id, exc_info=True)
+
+
+# --------------------------------------------------------------------------- #
+# Checkpoint retention sweep
+# --------------------------------------------------------------------------- #
+
+@shared_task
+def sweep_checkpoints():
+    """Delete checkpoints no session needs, in batches; then expire unreferenced state blobs.
+
+    Scheduled by ``CELERY_BEAT_SCHEDULE``. Threads of completed or unknown
+    sessions are deleted; sessions idle for ``CHECKPOINT_ABANDON_DAYS`` (e.g.
+    awaiting a human on a PR nobody returned to) are completed first.
+    """
+    store = checkpoint_store()
+    idle_since = timezone.now() - timedelta(days=retention.ABANDON_DAYS)
+    after, deleted = "", 0
+    while True:
+        batch = store.thread_ids(after=after, limit=retention.SWEEP_BATCH)
+        if not batch:
+            break
+        after = batch[-1]
+        reclaimable, abandoned = services.reclaimable_threads(batch, idle_since)
+        for session in abandoned:
+            session.current_status = ReviewSession.Status.COMPLETED
+            session.active_jobs = 0
+            session.save(update_fields=["current_status", "active_jobs", "updated_at"])
+            discard_session(str(session.langgraph_thread_id), api_key=_e2b_key(session.repo_settings.org_config))
+        store.delete(reclaimable)
+        deleted += len(reclaimable)
+
+    blobs = state_blob_store()
+    expired = 0
+    while blobs is not None:
+        removed = blobs.prune(retention.BLOB_RETENTION_SECONDS, limit=retention.SWEEP_BATCH)
+        expired += removed
+        if removed < retention.SWEEP_BATCH:
+            break
+    logger.info("Checkpoint sweep: deleted %d thread(s), %d state blob(s).", deleted, expired)
+    return {"threads": deleted, "blobs": expired}
\ No newline at end of file
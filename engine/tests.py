@@ -1,4 +1,9 @@
+import os
+from unittest import mock
+
 from django.test import SimpleTestCase
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable
 
 from engine.slash import parse_command, APPROVE, REJECT, SKIP
 from engine.errors import (
@@ -7,7 +12,13 @@ from engine.errors import (
     extract_diagnostic,
     execution_paused_comment,
 )
-from engine.github_comments import sanitize, render_review_comment, render_final_comment
+from engine.github_comments import (
+    sanitize,
+    render_review_comment,
+    render_final_comment,
+    render_streaming_review,
+)
+from engine.streaming import LiveReviewComment
 
 
 class SlashParserTests(SimpleTestCase):
@@ -69,3 +80,1704 @@ class CommentRenderingTests(SimpleTestCase):
         body = render_final_comment("main.py", "SUCCESS", "ran ok", "## Docs")
         self.assertIn("SUCCESS", body)
         self.assertIn("Docs", body)
+
+
+class LiveReviewCommentTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.gh = mock.Mock()
+        self.gh.post_inline_pr_comment.return_value = 42
+        self.live = LiveReviewComment(self.gh, 7, "sha", "main.py",
+                                      min_interval=5, clock=lambda: self.now)
+
+    def test_first_partial_posts_then_edits_are_throttled(self):
+        self.live.update({"summary": "Parses"})
+        self.gh.post_inline_pr_comment.assert_called_once()
+
+        self.now = 1.0
+        self.live.update({"summary": "Parses config"})
+        self.gh.edit_inline_pr_comment.assert_not_called()
+
+        self.now = 6.0
+        self.live.update({"summary": "Parses config files"})
+        self.gh.edit_inline_pr_comment.assert_called_once()
+
+    def test_done_bypasses_throttle_and_finalize_edits_in_place(self):
+        self.live.update({"summary": "Parses"})
+        self.live.update({"summary": "Parses", "issues": []}, done=True)
+        self.assertEqual(self.gh.edit_inline_pr_comment.call_count, 1)
+
+        self.assertTrue(self.live.finalize("final body"))
+        self.gh.edit_inline_pr_comment.assert_called_with(7, 42, "main.py", "final body")
+        self.assertEqual(self.gh.post_inline_pr_comment.call_count, 1)
+
+    def test_finalize_without_live_comment(self):
+        self.assertFalse(self.live.finalize("final body"))
+
+    def test_fallback_comment_keeps_its_file_header_when_edited(self):
+        from src.github_tools import GitHubConnector
+
+        gh = GitHubConnector(github_client=mock.Mock())
+        gh.repo = mock.Mock()
+        gh.repo.get_pull.return_value.create_review_comment.side_effect = RuntimeError("422")
+        gh.repo.get_pull.return_value.get_review_comment.side_effect = RuntimeError("404")
+        gh.repo.get_issue.return_value.create_comment.return_value.id = 42
+        live = LiveReviewComment(gh, 7, "sha", "main.py", min_interval=0, clock=lambda: self.now)
+        live.update({"summary": "Parses"})
+        live.finalize("final body")
+        posted = gh.repo.get_issue.return_value.create_comment.call_args.args[0]
+        edited = gh.repo.get_issue.return_value.get_comment.return_value.edit.call_args.args[0]
+        self.assertTrue(posted.startswith("**[Inline notice for `main.py`]**"))
+        self.assertEqual(edited, "**[Inline notice for `main.py`]**\n\nfinal body")
+
+    def test_streaming_render_skips_incomplete_issues(self):
+        body = render_streaming_review("main.py", {
+            "summary": "s",
+            "issues": [{"severity": "Warning", "line_number": 2, "description": "leak"}, {"severity": "Info"}],
+        })
+        self.assertIn("leak", body)
+        self.assertIn("updates live", body)
+
+
+class _FakeStructured(Runnable):
+    def __init__(self, schema, llm):
+        self.schema = schema
+        self.llm = llm
+
+    def invoke(self, input, config=None, **kwargs):
+        from src.agents import ReviewOutput, RefactorPatch, TestResult
+        if self.schema is ReviewOutput:
+            self.llm.prompts.append(input)
+            return ReviewOutput(summary="adds numbers", issues=self.llm.issues)
+        if self.schema is RefactorPatch:
+            return self.llm.patch
+        return TestResult(final_test_code="def test_x():\n    pass\n", pypi_dependencies=[])
+
+
+ISSUE = {"filepath": "main.py", "line_number": 1, "severity": "Warning",
+         "description": "wrong constant", "suggestion": "use 2"}
+
+
+class FakeLLM:
+    """Minimal chat model stand-in: canned refactor text and structured outputs."""
+
+    def __init__(self, content="x = 2\n", patch=None, issues=None):
+        self.content = content
+        self.patch = patch
+        self.issues = [ISSUE] if issues is None else issues
+        self.prompts = []
+        self.calls = 0
+
+    def with_structured_output(self, schema, **kwargs):
+        return _FakeStructured(schema, self)
+
+    def invoke(self, *args, **kwargs):
+        self.calls += 1
+        return AIMessage(content=self.content)
+
+    async def ainvoke(self, *args, **kwargs):
+        return AIMessage(content=self.content)
+
+
+def review_state(code="x = 1\n"):
+    return {
+        "repo_path": "o/r",
+        "file_path": "main.py",
+        "file_content": code,
+        "original_code": code,
+        "repo_files": {"main.py": code},
+        "pr_description": "",
+        "iteration_count": 0,
+    }
+
+
+class GraphExecutionTests(SimpleTestCase):
+    def _run(self, mode, llm=None):
+        from src.graph import build_local_app, run_graph
+
+        app = build_local_app()
+        config = {"configurable": {"thread_id": mode, "llm": llm or FakeLLM()}}
+        with mock.patch.dict(os.environ, {"GRAPH_EXECUTION": mode}):
+            run_graph(app, review_state(), config)
+        return app.get_state(config)
+
+    def test_clean_review_skips_refactor_tests_and_sandbox(self):
+        from src.graph import is_noop
+
+        snapshot = self._run("sync", FakeLLM(issues=[]))
+        self.assertEqual(snapshot.next, ())
+        self.assertNotIn("refactored_code", snapshot.values)
+        self.assertTrue(is_noop(snapshot.values))
+
+    def test_unchanged_refactor_skips_tests_and_sandbox(self):
+        snapshot = self._run("sync", FakeLLM(content="NO_CHANGES"))
+        self.assertEqual(snapshot.next, ())
+        self.assertNotIn("final_test_code", snapshot.values)
+
+    def test_sync_and_async_paths_pause_before_sandbox(self):
+        for mode in ("sync", "async"):
+            with self.subTest(mode=mode):
+                snapshot = self._run(mode)
+                self.assertEqual(set(snapshot.next), {"executor_tool_node", "documenter_draft_node"})
+                self.assertEqual(snapshot.values["refactored_code"], "x = 2")
+
+
+class CheckpointBlobTests(SimpleTestCase):
+    BIG = "def f():\n    return 1\n" * 400
+
+    def _serde(self, store=None):
+        from src.blobstore import MemoryBlobStore, offloading
+
+        self.store = store if store is not None else MemoryBlobStore()
+        return offloading(store=self.store)
+
+    def test_large_strings_are_stored_once_and_restored(self):
+        serde = self._serde()
+        value = {"main.py": self.BIG, "copy.py": self.BIG, "small.py": "x = 1\n"}
+        type_, data = serde.dumps_typed(value)
+        self.assertTrue(type_.startswith("blob+"))
+        self.assertLess(len(data), len(self.BIG) // 20)
+        self.assertEqual(len(self.store), 1)
+        # A fresh serializer (another process) reads the text back from the store.
+        self.assertEqual(self._serde(self.store).loads_typed((type_, data)), value)
+
+    def test_small_and_legacy_payloads_pass_through(self):
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+        serde = self._serde()
+        self.assertEqual(serde.dumps_typed("x = 1"), JsonPlusSerializer().dumps_typed("x = 1"))
+        legacy = JsonPlusSerializer().dumps_typed({"main.py": self.BIG})
+        self.assertEqual(serde.loads_typed(legacy), {"main.py": self.BIG})
+
+    def test_missing_blob_is_an_error(self):
+        from src.blobstore import MemoryBlobStore
+
+        payload = self._serde().dumps_typed(self.BIG)
+        with self.assertRaises(KeyError):
+            self._serde(MemoryBlobStore()).loads_typed(payload)
+
+    def test_sessions_of_a_pr_share_the_repo_map(self):
+        from src.blobstore import MemoryBlobStore
+        from src.graph import build_local_app, run_graph
+
+        store = MemoryBlobStore()
+        with mock.patch("src.graph._memory_blobs", store):
+            app = build_local_app()
+            state = dict(review_state(), repo_files={"main.py": "x = 1\n", "util.py": self.BIG})
+            for thread in ("file-a", "file-b"):
+                run_graph(app, state, {"configurable": {"thread_id": thread, "llm": FakeLLM()}})
+        self.assertEqual(len(store), 1)
+        snapshot = app.get_state({"configurable": {"thread_id": "file-b"}})
+        self.assertEqual(snapshot.values["repo_files"]["util.py"], self.BIG)
+
+    def _postgres_put(self, saver, checkpoint, new_versions):
+        import contextlib
+
+        cursor = mock.MagicMock()
+        saver._cursor = lambda **kwargs: contextlib.nullcontext(cursor)
+        saver.put({"configurable": {"thread_id": "t", "checkpoint_ns": ""}}, checkpoint, {}, new_versions)
+        blobs = cursor.executemany.call_args.args[1] if cursor.executemany.called else []
+        return cursor.execute.call_args.args[1][4].obj, blobs
+
+    def test_postgres_put_offloads_large_string_channels(self):
+        from langgraph.checkpoint.base import empty_checkpoint
+        from src.checkpointers import OffloadingPostgresSaver
+
+        saver = OffloadingPostgresSaver(mock.MagicMock(), serde=self._serde())
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"original_code": self.BIG, "file_path": "main.py", "iteration_count": 1}
+        checkpoint["channel_versions"] = {"original_code": "1", "file_path": "1", "iteration_count": "1"}
+        stored, blobs = self._postgres_put(saver, checkpoint, dict(checkpoint["channel_versions"]))
+
+        self.assertEqual(stored["channel_values"], {"file_path": "main.py", "iteration_count": 1})
+        [(_, _, channel, version, type_, data)] = blobs
+        self.assertEqual((channel, version), ("original_code", "1"))
+        self.assertTrue(type_.startswith("blob+"))
+        self.assertLess(len(data), 200)
+        self.assertEqual(saver._load_blobs([(b"original_code", type_.encode(), data)]), {"original_code": self.BIG})
+
+        # Unchanged since an earlier (possibly pre-offloading) checkpoint: still gets its blob row.
+        _, blobs = self._postgres_put(saver, checkpoint, {"iteration_count": "2"})
+        self.assertEqual([row[2] for row in blobs], ["original_code"])
+
+    def test_completed_sessions_leave_no_blobs_behind(self):
+        import contextlib
+        from langgraph.checkpoint.base import empty_checkpoint
+        from engine import tasks
+        from src.checkpointers import OffloadingPostgresSaver
+        from src.retention import PostgresCheckpointStore
+
+        saver = OffloadingPostgresSaver(mock.MagicMock(), serde=self._serde())
+        for thread, code in (("a", self.BIG), ("b", self.BIG + "# b\n")):
+            checkpoint = empty_checkpoint()
+            checkpoint["channel_values"] = {"original_code": code, "repo_files": {"util.py": self.BIG * 2}}
+            checkpoint["channel_versions"] = {"original_code": "1", "repo_files": "1"}
+            saver._cursor = lambda **kwargs: contextlib.nullcontext(mock.MagicMock())
+            saver.put({"configurable": {"thread_id": thread, "checkpoint_ns": ""}}, checkpoint, {},
+                      dict(checkpoint["channel_versions"]))
+        self.assertEqual(len(self.store), 3)
+
+        store = PostgresCheckpointStore(mock.MagicMock(), blobs=self.store)
+        for thread, left in (("a", 2), ("b", 0)):
+            session = mock.Mock(langgraph_thread_id=thread)
+            with mock.patch("engine.tasks.checkpoint_store", return_value=store), \
+                    mock.patch("engine.tasks.discard_session"):
+                tasks._complete(session)
+            # The repo map is shared with the other session until that one completes too.
+            self.assertEqual(len(self.store), left)
+
+    def test_blob_released_under_a_new_reference_is_put_again(self):
+        from src.blobstore import thread_scope
+
+        serde = self._serde()
+        with thread_scope("a"):
+            serde.dumps_typed(self.BIG)
+        self.store.release(["a"])
+        self.assertEqual(len(self.store), 0)
+        # This process still remembers putting it; the reference finds it missing and re-puts it.
+        with thread_scope("b"):
+            payload = serde.dumps_typed(self.BIG)
+        self.assertEqual(self._serde(self.store).loads_typed(payload), self.BIG)
+
+    def test_async_saver_loads_blobs_off_the_loop(self):
+        import asyncio
+        import threading
+        from langgraph.checkpoint.base import empty_checkpoint
+        from src.checkpointers import OffloadingAsyncPostgresSaver
+
+        serde = self._serde()
+        type_, data = serde.dumps_typed({"__reporover_text__": self.BIG})
+        threads = []
+
+        async def load():
+            saver = OffloadingAsyncPostgresSaver(mock.MagicMock(), serde=serde)
+            loading = saver._load_blobs
+            saver._load_blobs = lambda values: threads.append(threading.get_ident()) or loading(values)
+            row = {"thread_id": "t", "checkpoint_ns": "", "checkpoint_id": "1", "parent_checkpoint_id": None,
+                   "checkpoint": empty_checkpoint(), "metadata": {}, "pending_writes": [],
+                   "channel_values": [(b"original_code", type_.encode(), data)]}
+            return await saver._load_checkpoint_tuple(row), threading.get_ident()
+
+        loaded, loop_thread = asyncio.run(load())
+        self.assertEqual(loaded.checkpoint["channel_values"]["original_code"], self.BIG)
+        self.assertNotEqual(threads[0], loop_thread)
+
+
+class CheckpointCompressionTests(SimpleTestCase):
+    VALUE = {"logs": "FAILED tests/test_main.py::test_x - AssertionError\n" * 200, "iteration": 2}
+
+    def _serde(self, codec="zlib", min_bytes=512):
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+        from src.serde import CompressingSerializer
+
+        return CompressingSerializer(JsonPlusSerializer(), codec=codec, min_bytes=min_bytes)
+
+    def test_large_payloads_are_compressed_and_restored(self):
+        serde = self._serde()
+        type_, data = serde.dumps_typed(self.VALUE)
+        self.assertEqual(type_, "msgpack+zlib")
+        self.assertLess(len(data), len(self.VALUE["logs"]) // 10)
+        # Any codec setting reads what another one wrote.
+        self.assertEqual(self._serde(codec="none").loads_typed((type_, data)), self.VALUE)
+
+    def test_small_and_legacy_payloads_pass_through(self):
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+        serde = self._serde()
+        self.assertEqual(serde.dumps_typed({"iteration": 2}), JsonPlusSerializer().dumps_typed({"iteration": 2}))
+        legacy = JsonPlusSerializer().dumps_typed(self.VALUE)
+        self.assertEqual(serde.loads_typed(legacy), self.VALUE)
+
+    def test_wraps_offloaded_payloads(self):
+        from src.blobstore import offloading
+        from src.serde import CompressingSerializer
+
+        serde = CompressingSerializer(offloading(), codec="zlib", min_bytes=16)
+        value = {"main.py": "x = 1\n" * 2000, "notes": "same line\n" * 50}
+        type_, data = serde.dumps_typed(value)
+        self.assertEqual(type_, "blob+msgpack+zlib")
+        self.assertEqual(serde.loads_typed((type_, data)), value)
+
+    def test_unknown_codec_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self._serde(codec="lz4")
+
+    def test_timings_are_recorded(self):
+        serde = self._serde()
+        serde.loads_typed(serde.dumps_typed(self.VALUE))
+        serde.dumps_typed({"iteration": 3})
+        stats = serde.stats()
+        self.assertEqual((stats["dumps"], stats["loads"], stats["compressed"]), (2, 1, 1))
+        self.assertEqual(stats["codec"], "zlib")
+        self.assertLess(stats["ratio"], 0.5)
+        self.assertIsNotNone(stats["dumps_avg_ms"])
+
+    def test_local_graph_checkpoints_are_compressed(self):
+        from src.graph import build_local_app, checkpoint_serde_stats, run_graph
+
+        before = checkpoint_serde_stats().get("dumps", 0)
+        app = build_local_app()
+        state = dict(review_state(), repo_files={"main.py": "x = 1\n", "notes.md": "todo\n" * 300})
+        run_graph(app, state, {"configurable": {"thread_id": self.id(), "llm": FakeLLM()}})
+        self.assertGreater(checkpoint_serde_stats()["dumps"], before)
+        snapshot = app.get_state({"configurable": {"thread_id": self.id()}})
+        self.assertEqual(snapshot.values["repo_files"]["notes.md"], "todo\n" * 300)
+
+
+class SlashResumeTests(SimpleTestCase):
+    """/approve, /reject and /skip resume the step paused before the sandbox."""
+
+    def setUp(self):
+        from src.graph import build_local_app, run_graph
+
+        self.app = build_local_app()
+        self.llm = FakeLLM()
+        self.config = {"configurable": {"thread_id": self.id(), "llm": self.llm}}
+        run_graph(self.app, review_state(), self.config)
+
+        import src.agents
+        self.doc_prompts = mock.patch("src.agents._agent_c_prompt", wraps=src.agents._agent_c_prompt)
+        self.docs = self.doc_prompts.start()
+        self.addCleanup(self.doc_prompts.stop)
+
+    def _resume(self, values, exit_code=0):
+        from src.graph import resume_with, run_graph
+
+        from src.executors import E2BBackend
+        from src.sandbox import SandboxPool
+
+        sandbox = mock.MagicMock()
+        sandbox.return_value.commands.run.side_effect = lambda cmd, **kwargs: mock.Mock(
+            exit_code=exit_code if "pytest" in cmd else 0, stdout="1 passed", stderr="")
+        coverage = '{"files": {"main.py": {"executed_lines": [1], "missing_lines": []}}}'
+
+        def read(path):
+            if path.endswith("coverage.json"):
+                return coverage
+            raise FileNotFoundError(path)
+
+        sandbox.return_value.files.read.side_effect = read
+        self.config["configurable"]["executor_backend"] = E2BBackend(SandboxPool(factory=sandbox, warm=0))
+        resume_with(self.app, self.config, values)
+        run_graph(self.app, None, self.config)
+        return sandbox, self.app.get_state(self.config)
+
+    def test_approve_runs_sandbox_and_reuses_drafted_docs(self):
+        sandbox, snapshot = self._resume({"execution_status": "APPROVED"})
+        sandbox.assert_called_once()
+        self.assertEqual(snapshot.next, ())
+        self.assertEqual(snapshot.values["execution_status"], "SUCCESS")
+        self.assertEqual(snapshot.values["documentation_diff"], "x = 2")
+        self.assertEqual(self.docs.call_count, 1)
+
+    def test_failed_draft_does_not_abort_the_sandbox_step(self):
+        with mock.patch("src.agents.call_agent_c", side_effect=RuntimeError("503 unavailable")):
+            sandbox, snapshot = self._resume({"execution_status": "APPROVED"})
+        sandbox.assert_called_once()
+        self.assertEqual(snapshot.next, ())
+        self.assertEqual(snapshot.values["execution_status"], "SUCCESS")
+        # documenter_node wrote the docs the draft could not.
+        self.assertEqual(snapshot.values["documentation_diff"], "x = 2")
+
+    def test_failed_run_discards_the_draft(self):
+        from src.agents import _has_current_docs
+
+        self.llm.content = "x = 3\n"  # the retry's refactor differs from the drafted one
+        _, snapshot = self._resume({"execution_status": "APPROVED"}, exit_code=1)
+        self.assertEqual(self.docs.call_count, 1)
+        self.assertEqual(snapshot.values["refactored_code"], "x = 3")
+        self.assertFalse(_has_current_docs(snapshot.values))
+        self.assertIn("executor_tool_node", snapshot.next)
+
+    def test_failed_run_parks_the_sandbox_for_the_retry(self):
+        sandbox, _ = self._resume({"execution_status": "APPROVED"}, exit_code=1)
+        pool = self.config["configurable"]["executor_backend"].pool
+        leased = pool.lease("key", session=self.id())
+        self.assertIs(leased.sbx, sandbox.return_value)
+        sandbox.assert_called_once()
+
+    def test_executor_records_the_sandbox_session(self):
+        _, snapshot = self._resume({"execution_status": "APPROVED"}, exit_code=1)
+        self.assertEqual(snapshot.values["sandbox_session_id"], self.id())
+
+    def test_reject_skips_sandbox_and_draft(self):
+        sandbox, snapshot = self._resume({"execution_status": "REJECTED", "execution_logs": "HUMAN REJECTION: no"})
+        sandbox.assert_not_called()
+        self.assertEqual(self.docs.call_count, 0)
+        self.assertEqual(snapshot.values["execution_status"], "FAILURE")
+        self.assertIn("executor_tool_node", snapshot.next)
+
+    def test_skip_documents_without_sandbox(self):
+        sandbox, snapshot = self._resume({"execution_status": "SKIPPED_TO_DOCS"})
+        sandbox.assert_not_called()
+        self.assertEqual(snapshot.next, ())
+        self.assertEqual(self.docs.call_count, 1)
+
+    def test_approve_after_trimming_to_the_latest_checkpoint(self):
+        from src.retention import MemoryCheckpointStore
+
+        saver = self.app.checkpointer
+        self.assertGreater(MemoryCheckpointStore([saver]).keep_latest([self.id()]), 0)
+        self.assertEqual(len(list(saver.list(self.config))), 1)
+        sandbox, snapshot = self._resume({"execution_status": "APPROVED"})
+        sandbox.assert_called_once()
+        self.assertEqual(snapshot.values["execution_status"], "SUCCESS")
+        self.assertEqual(snapshot.values["documentation_diff"], "x = 2")
+
+
+class CheckpointRetentionTests(SimpleTestCase):
+    def _run(self, app, thread):
+        from src.graph import run_graph
+
+        run_graph(app, review_state(), {"configurable": {"thread_id": thread, "llm": FakeLLM()}})
+
+    def setUp(self):
+        from src.graph import build_local_app
+        from src.retention import MemoryCheckpointStore
+
+        self.app = build_local_app()
+        self.store = MemoryCheckpointStore([self.app.checkpointer])
+
+    def test_delete_removes_only_the_given_threads(self):
+        for thread in ("a", "b"):
+            self._run(self.app, thread)
+        self.store.delete(["a"])
+        self.assertEqual(self.store.thread_ids(), ["b"])
+        self.assertFalse(any(key[0] == "a" for key in self.app.checkpointer.blobs))
+        self.assertEqual(self.app.get_state({"configurable": {"thread_id": "b"}}).values["file_path"], "main.py")
+
+    def test_thread_ids_are_paged(self):
+        for thread in ("a", "b", "c"):
+            self._run(self.app, thread)
+        self.assertEqual(self.store.thread_ids(limit=2), ["a", "b"])
+        self.assertEqual(self.store.thread_ids(after="b", limit=2), ["c"])
+
+    def test_keep_latest_drops_unreferenced_channel_blobs(self):
+        self._run(self.app, "a")
+        saver = self.app.checkpointer
+        before = len(saver.blobs)
+        self.store.keep_latest(["a"])
+        self.assertLess(len(saver.blobs), before)
+        self.assertEqual(self.store.keep_latest(["a"]), 0)
+        self.assertEqual(self.app.get_state({"configurable": {"thread_id": "a"}}).values["file_path"], "main.py")
+
+    def test_stores_must_implement_the_whole_interface(self):
+        from src.blobstore import BlobStore
+        from src.retention import CheckpointStore
+
+        for base in (CheckpointStore, BlobStore):
+            with self.assertRaises(TypeError):
+                type("Partial", (base,), {})()
+
+    def test_sweep_deletes_reclaimable_threads_in_batches(self):
+        from engine import tasks
+
+        for thread in ("a", "b", "c"):
+            self._run(self.app, thread)
+        abandoned = mock.Mock(langgraph_thread_id="c")
+        split = lambda batch, idle_since: ([t for t in batch if t != "b"], [abandoned] if "c" in batch else [])
+        with mock.patch("engine.tasks.checkpoint_store", return_value=self.store), \
+                mock.patch("engine.tasks.state_blob_store", return_value=None), \
+                mock.patch("engine.tasks.services.reclaimable_threads", side_effect=split) as reclaim, \
+                mock.patch("engine.tasks.discard_session") as discard, \
+                mock.patch("engine.tasks.retention.SWEEP_BATCH", 2):
+            result = tasks.sweep_checkpoints()
+        self.assertEqual(result, {"threads": 2, "blobs": 0})
+        self.assertEqual(self.store.thread_ids(), ["b"])
+        self.assertEqual(reclaim.call_count, 2)
+        self.assertEqual(abandoned.current_status, "COMPLETED")
+        abandoned.save.assert_called_once()
+        discard.assert_called_once_with("c", api_key=abandoned.repo_settings.org_config.get_e2b_key.return_value)
+
+    def test_sweep_prunes_the_in_memory_blob_store(self):
+        from engine import tasks
+        from src import retention
+        from src.blobstore import MemoryBlobStore
+        from src.graph import state_blob_store
+
+        now = [0.0]
+        blobs = MemoryBlobStore(clock=lambda: now[0])
+        blobs.put_many({"old": b"x"})
+        now[0] = retention.BLOB_RETENTION_SECONDS + 1.0
+        blobs.put_many({"fresh": b"y"})
+        with mock.patch.dict(os.environ, {"CHECKPOINTER": "memory"}), mock.patch("src.graph._memory_blobs", blobs):
+            self.assertIs(state_blob_store(), blobs)
+        with mock.patch("engine.tasks.checkpoint_store", return_value=self.store), \
+                mock.patch("engine.tasks.state_blob_store", return_value=blobs), \
+                mock.patch("engine.tasks.services.reclaimable_threads", return_value=([], [])):
+            self.assertEqual(tasks.sweep_checkpoints(), {"threads": 0, "blobs": 1})
+        self.assertEqual(blobs.get_many(["old", "fresh"]), {"fresh": b"y"})
+
+
+class SandboxPoolTests(SimpleTestCase):
+    def setUp(self):
+        from src.sandbox import SandboxPool
+
+        self.now = 0.0
+        self.created = []
+
+        def factory(api_key):
+            sbx = mock.MagicMock(name=f"sandbox-{len(self.created)}")
+            sbx.commands.run.return_value = mock.Mock(exit_code=0, stdout="", stderr="")
+            self.created.append(sbx)
+            return sbx
+
+        self.pool = SandboxPool(factory=factory, max_size=2, idle_seconds=60, warm=0, clock=lambda: self.now)
+
+    def test_returned_sandbox_is_reset_and_reused(self):
+        first = self.pool.lease("key-a")
+        self.pool.release(first)
+        first.sbx.commands.run.assert_called_once()
+        self.assertIn("rm -rf", first.sbx.commands.run.call_args.args[0])
+        self.assertIs(self.pool.lease("key-a").sbx, first.sbx)
+        self.assertEqual(len(self.created), 1)
+
+    def test_sandbox_with_a_changed_interpreter_is_not_reused(self):
+        from src.sandbox import INTERPRETER_BASELINE
+
+        first = self.pool.lease("key-a")
+        first.sbx.commands.run.return_value = mock.Mock(exit_code=1, stdout="", stderr="")  # fingerprint differs
+        self.pool.release(first)
+        self.assertIn(INTERPRETER_BASELINE, first.sbx.commands.run.call_args.args[0])
+        first.sbx.kill.assert_called_once()
+        self.assertIsNot(self.pool.lease("key-a").sbx, first.sbx)
+
+    def test_tenants_do_not_share_sandboxes(self):
+        self.pool.release(self.pool.lease("key-a"))
+        self.pool.lease("key-b")
+        self.assertEqual(len(self.created), 2)
+
+    def test_parked_sandbox_goes_back_to_its_session(self):
+        first = self.pool.lease("key-a", session="pr-1")
+        self.pool.release(first, keep=True)
+        other = self.pool.lease("key-a", session="pr-2")
+        self.assertIsNot(other.sbx, first.sbx)
+        self.assertIs(self.pool.lease("key-a", session="pr-1").sbx, first.sbx)
+        first.sbx.commands.run.assert_not_called()  # not reset between retries
+
+    def test_size_limit_per_tenant(self):
+        from src import sandbox
+
+        self.pool.lease("key-a")
+        self.pool.lease("key-a")
+        with mock.patch.object(sandbox, "LEASE_TIMEOUT", 0):
+            with self.assertRaises(RuntimeError):
+                self.pool.lease("key-a")
+
+    def test_unhealthy_sandbox_is_killed_and_frees_a_slot(self):
+        leased = self.pool.lease("key-a")
+        self.pool.lease("key-a")
+        self.pool.release(leased, healthy=False)
+        leased.sbx.kill.assert_called_once()
+        self.pool.lease("key-a")
+        self.assertEqual(len(self.created), 3)
+
+    def test_idle_sandboxes_are_evicted(self):
+        leased = self.pool.lease("key-a", session="pr-1")
+        self.pool.release(leased, keep=True)
+        self.now = 120.0
+        with mock.patch("src.sandbox.threading.Thread") as thread:
+            thread.return_value.start.side_effect = lambda: thread.call_args.kwargs["target"]()
+            self.pool.lease("key-a", session="pr-1")
+        leased.sbx.kill.assert_called_once()
+        self.assertEqual(len(self.created), 2)
+
+    def test_expired_parked_sandbox_is_killed_while_its_record_lasts(self):
+        from src.sandbox import MemorySessionRegistry
+
+        self.pool.registry = mock.Mock(wraps=MemorySessionRegistry())
+        leased = self.pool.lease("key-a", session="pr-1")
+        leased.sbx.sandbox_id = "sbx-1"
+        self.pool.release(leased, keep=True)
+        # The record has to outlive the sandbox, or eviction would mistake "expired" for "claimed".
+        self.assertGreater(self.pool.registry.park.call_args.args[2], 60)
+        self.now = 120.0
+        with mock.patch("src.sandbox.threading.Thread") as thread:
+            thread.return_value.start.side_effect = lambda: thread.call_args.kwargs["target"]()
+            self.pool.lease("key-a")
+        leased.sbx.kill.assert_called_once()
+
+    def test_expired_parked_sandbox_is_killed_with_the_registry_down(self):
+        self.pool.registry = mock.Mock()
+        self.pool.registry.claim.side_effect = ConnectionError("redis down")
+        evicted = self.pool.lease("key-a", session="pr-1")
+        self.pool.release(evicted, keep=True)
+        resumed = self.pool.lease("key-a", session="pr-2")
+        self.pool.release(resumed, keep=True)
+        self.now = 50.0
+        self.assertIs(self.pool.lease("key-a", session="pr-2").sbx, resumed.sbx)
+        self.now = 120.0
+        with mock.patch("src.sandbox.threading.Thread") as thread:
+            thread.return_value.start.side_effect = lambda: thread.call_args.kwargs["target"]()
+            self.pool.lease("key-a")
+        evicted.sbx.kill.assert_called_once()
+
+    def test_discard_kills_the_sessions_sandbox(self):
+        leased = self.pool.lease("key-a", session="pr-1")
+        self.pool.release(leased, keep=True)
+        self.pool.discard("pr-1")
+        leased.sbx.kill.assert_called_once()
+
+    def test_spare_counts_idle_but_not_leased_sandboxes(self):
+        from src.sandbox import SandboxPool
+
+        first = self.pool.lease("key-a")
+        self.assertEqual(self.pool.spare("key-a"), 1)
+        self.pool.release(first)
+        self.assertEqual(self.pool.spare("key-a"), 2)
+        self.assertIsNone(SandboxPool(factory=mock.Mock(), max_size=0).spare("key-a"))
+
+    def _second_worker(self):
+        from src.sandbox import SandboxPool
+
+        connected, killed = [], []
+
+        def connect(sandbox_id, api_key):
+            connected.append(sandbox_id)
+            return mock.MagicMock(name=f"reconnected-{sandbox_id}", sandbox_id=sandbox_id)
+
+        other = SandboxPool(factory=mock.Mock(side_effect=AssertionError("no new sandbox expected")),
+                            max_size=2, idle_seconds=60, warm=0, clock=lambda: self.now,
+                            registry=self.pool.registry, connect=connect,
+                            kill_by_id=lambda sandbox_id, api_key: killed.append((sandbox_id, api_key)))
+        return other, connected, killed
+
+    def test_other_worker_reconnects_to_the_parked_session(self):
+        leased = self.pool.lease("key-a", session="pr-1")
+        leased.sbx.sandbox_id = "sbx-1"
+        leased.python, leased.uploaded = "3.11", {"app.py": "abc"}
+        self.pool.release(leased, keep=True)
+        other, connected, _ = self._second_worker()
+        resumed = other.lease("key-a", session="pr-1")
+        self.assertEqual(connected, ["sbx-1"])
+        self.assertEqual((resumed.python, resumed.uploaded), ("3.11", {"app.py": "abc"}))
+        # The first worker no longer holds it, so it cannot hand it out twice.
+        self.pool.lease("key-a", session="pr-1")
+        self.assertEqual(len(self.created), 2)
+
+    def test_other_worker_kills_the_parked_session_by_id(self):
+        leased = self.pool.lease("key-a", session="pr-1")
+        leased.sbx.sandbox_id = "sbx-1"
+        self.pool.release(leased, keep=True)
+        other, _, killed = self._second_worker()
+        other.discard("pr-1", api_key="key-a")
+        self.assertEqual(killed, [("sbx-1", "key-a")])
+        leased.sbx.kill.assert_not_called()
+        self.pool.lease("key-a", session="pr-1")
+        self.assertEqual(len(self.created), 2)
+
+    def test_dependency_key_ignores_order_case_and_spelling(self):
+        from src.sandbox import env_key
+
+        self.assertEqual(env_key(["Requests >= 2", "flask_login"], "3.11"), env_key(["Flask-Login", "requests>=2"], "3.11"))
+        self.assertNotEqual(env_key(["requests"], "3.11"), env_key(["requests"], "3.12"))
+
+    def test_repeat_dependency_set_skips_install(self):
+        from src.sandbox import ensure_env
+
+        leased = self.pool.lease("key-a")
+        leased.sbx.commands.run.return_value = mock.Mock(exit_code=0, stdout="3.11\n", stderr="")
+        first = ensure_env(leased, ["requests"])
+        installs = leased.sbx.commands.run.call_count
+        again = ensure_env(leased, ["Requests"])
+        self.assertFalse(first.cached)
+        self.assertTrue(again.cached)
+        self.assertEqual(again.site_dir, first.site_dir)
+        self.assertEqual(leased.sbx.commands.run.call_count, installs)
+        self.assertIsNone(ensure_env(leased, []))
+
+    def test_requirements_are_shell_quoted(self):
+        import shlex
+        from src.sandbox import ensure_env
+
+        leased = self.pool.lease("key-a")
+        leased.python = "3.11"
+        ensure_env(leased, ["requests>=2;python_version<'4'$(touch /tmp/pwned)"])
+        command = leased.sbx.commands.run.call_args.args[0]
+        install = command.split("pip install -q --target ")[1].split(" && ")[0]
+        self.assertEqual(shlex.split(install)[1], "requests>=2;python_version<'4'$(touch/tmp/pwned)")
+
+    def test_lease_prefers_sandbox_with_the_env(self):
+        from src.sandbox import ensure_env
+
+        plain, warm = self.pool.lease("key-a"), self.pool.lease("key-a")
+        warm.sbx.commands.run.return_value = mock.Mock(exit_code=0, stdout="3.11", stderr="")
+        ensure_env(warm, ["requests"])
+        self.pool.release(warm)
+        self.pool.release(plain)
+        self.assertIs(self.pool.lease("key-a", dependencies=["requests"]).sbx, warm.sbx)
+
+    def test_failed_install_raises(self):
+        from src.sandbox import DependencyInstallError, ensure_env
+
+        leased = self.pool.lease("key-a")
+        leased.sbx.commands.run.return_value = mock.Mock(exit_code=1, stdout="", stderr="No matching distribution")
+        with self.assertRaises(DependencyInstallError):
+            ensure_env(leased, ["not-a-package"])
+        self.assertEqual(leased.envs, {})
+
+    def test_files_are_packed_into_one_archive(self):
+        import io
+        import tarfile
+        from src.sandbox import pack_files
+
+        archive = pack_files({"pkg/mod.py": "x = 1\n", "test_mod.py": "def test(): pass\n", "../evil.py": "boom"})
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar:
+            self.assertEqual(sorted(tar.getnames()), ["pkg/mod.py", "test_mod.py"])
+            self.assertEqual(tar.extractfile("pkg/mod.py").read(), b"x = 1\n")
+
+    def test_hydration_is_one_upload_and_one_command(self):
+        from src.sandbox import WORKSPACE, hydrate
+
+        sbx = mock.Mock()
+        sbx.commands.run.return_value = mock.Mock(exit_code=0)
+        result = hydrate(sbx, {f"pkg/m{i}.py": "x = 1\n" for i in range(50)})
+        sbx.files.write.assert_called_once()
+        sbx.commands.run.assert_called_once()
+        self.assertIn(f"tar -xzf {sbx.files.write.call_args.args[0]} -C {WORKSPACE}", sbx.commands.run.call_args.args[0])
+        self.assertEqual(result.files, 50)
+
+    def test_hydration_uploads_only_changed_files(self):
+        from src.sandbox import hydrate
+
+        sbx = mock.Mock()
+        sbx.commands.run.return_value = mock.Mock(exit_code=0)
+        uploaded = {}
+        hydrate(sbx, {"calc.py": "x = 1\n", "test_calc.py": "def test(): pass\n"}, uploaded=uploaded)
+        sbx.reset_mock()
+        self.assertEqual(hydrate(sbx, {"calc.py": "x = 1\n", "test_calc.py": "def test(): pass\n"},
+                                 uploaded=uploaded).unchanged, 2)
+        sbx.files.write.assert_not_called()
+        sbx.commands.run.assert_not_called()
+
+        result = hydrate(sbx, {"calc.py": "x = 2\n"}, uploaded=uploaded)
+        self.assertEqual((result.files, result.unchanged), (1, 0))
+        self.assertIn("rm -f /home/user/workspace/test_calc.py", sbx.commands.run.call_args.args[0])
+        self.assertEqual(sorted(uploaded), ["calc.py"])
+
+    def test_reset_forgets_uploaded_files(self):
+        leased = self.pool.lease("key-a")
+        leased.uploaded["calc.py"] = "hash"
+        self.pool.release(leased)
+        self.assertEqual(self.pool.lease("key-a").uploaded, {})
+
+    def test_session_sandbox_expires_after_its_ttl(self):
+        self.pool.session_ttl = 100
+        leased = self.pool.lease("key-a", session="pr-1")
+        for self.now in (50.0, 100.0):
+            self.pool.release(leased, keep=True)
+            leased = self.pool.lease("key-a", session="pr-1")
+        self.assertEqual(len(self.created), 1)
+        self.pool.release(leased, keep=True)
+        self.now = 150.0
+        with mock.patch("src.sandbox.threading.Thread") as thread:
+            thread.return_value.start.side_effect = lambda: thread.call_args.kwargs["target"]()
+            self.pool.lease("key-a", session="pr-1")
+        leased.sbx.kill.assert_called_once()
+        self.assertEqual(len(self.created), 2)
+
+    def test_nonzero_exit_is_a_result(self):
+        from e2b.sandbox.commands.command_handle import CommandExitException
+        from src.sandbox import run_command
+
+        sbx = mock.Mock()
+        sbx.commands.run.side_effect = CommandExitException(stdout="1 failed", stderr="", exit_code=1, error=None)
+        self.assertEqual(run_command(sbx, "pytest").exit_code, 1)
+
+
+class LocalExecutorTests(SimpleTestCase):
+    def setUp(self):
+        import tempfile
+        from src.executors import LocalBackend
+
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(__import__("shutil").rmtree, self.root, True)
+        self.backend = LocalBackend(root=self.root)
+
+    def test_hydrate_run_and_collect_in_a_temp_dir(self):
+        import os
+
+        workspace = self.backend.lease(None)
+        workspace.hydrate({"pkg/mod.py": "VALUE = 41\n"})
+        result = workspace.run("python -c 'import pkg.mod, pathlib; pathlib.Path(\"out.txt\").write_text(str(pkg.mod.VALUE + 1))'")
+        self.assertEqual(result.exit_code, 0, result.stderr)
+        self.assertEqual(workspace.collect(["out.txt", "missing.txt", "../escape"]), {"out.txt": "42"})
+        self.backend.release(workspace)
+        self.assertFalse(os.path.exists(workspace.path))
+
+    def test_nonzero_exit_and_timeout(self):
+        workspace = self.backend.lease(None)
+        self.assertEqual(workspace.run("exit 3").exit_code, 3)
+        result = workspace.run("sleep 5", timeout=0.2)
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("TIMEOUT", result.stderr)
+
+    def test_cancel_kills_the_running_process_group(self):
+        import time
+        from src.executors import RunCancelled, run_with_deadline
+
+        workspace = self.backend.lease(None)
+        started = time.monotonic()
+        with self.assertRaises(RunCancelled):
+            run_with_deadline(workspace, "sleep 30", timeout=60,
+                              cancelled=lambda: time.monotonic() - started > 0.2, poll=0.05)
+        time.sleep(0.2)
+        self.assertIsNotNone(workspace._proc.poll())
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_deadline_outlives_a_hung_backend_call(self):
+        import threading
+        from src.executors import ExecutionResult, Workspace, run_with_deadline
+
+        hung = mock.Mock(spec=Workspace)
+        released = threading.Event()
+        hung.run.side_effect = lambda cmd, timeout: released.wait(5) or ExecutionResult(0, "", "")
+        hung.cancel.side_effect = released.set
+        with mock.patch("src.executors.DEADLINE_GRACE_SECONDS", 0):
+            result = run_with_deadline(hung, "pytest", timeout=0.1, poll=0.05)
+        hung.cancel.assert_called_once()
+        self.assertIn("TIMEOUT", result.stderr)
+
+    def test_e2b_run_enforces_deadlines_in_the_sandbox(self):
+        from src.executors import E2BWorkspace
+
+        leased = mock.Mock()
+        leased.sbx.commands.run.return_value = mock.Mock(exit_code=124, stdout="", stderr="")
+        result = E2BWorkspace(leased).run("python -m pytest", timeout=60)
+        cmd = leased.sbx.commands.run.call_args.args[0]
+        self.assertIn("ulimit -t", cmd)
+        self.assertIn("timeout --verbose -k 5 60 bash -c 'python -m pytest'", cmd)
+        self.assertIn("TIMEOUT: killed after 60s.", result.stderr)
+
+    def test_only_timeouts_sigkill_counts_as_a_deadline(self):
+        from src.executors import E2BWorkspace
+
+        leased = mock.Mock()
+        leased.sbx.commands.run.return_value = mock.Mock(exit_code=137, stdout="", stderr="Killed")
+        self.assertNotIn("TIMEOUT", E2BWorkspace(leased).run("python -m pytest", timeout=60).stderr)
+        leased.sbx.commands.run.return_value = mock.Mock(
+            exit_code=137, stdout="", stderr="timeout: sending signal TERM to command 'bash'\n"
+                                             "timeout: sending signal KILL to command 'bash'")
+        self.assertIn("TIMEOUT: killed after 60s.", E2BWorkspace(leased).run("python -m pytest", timeout=60).stderr)
+
+    def test_venv_is_built_once_per_dependency_set(self):
+        from src.executors import LocalBackend
+
+        def build(path, requirements):
+            __import__("os").makedirs(path)
+
+        with mock.patch.object(LocalBackend, "_build", side_effect=build) as built:
+            first = self.backend.ensure_venv(["Requests"])
+            again = self.backend.ensure_venv(["requests"])
+            other = self.backend.ensure_venv([])
+        self.assertEqual(built.call_count, 2)
+        self.assertFalse(first.cached)
+        self.assertTrue(again.cached)
+        self.assertEqual(again.site_dir, first.site_dir)
+        self.assertNotEqual(other.site_dir, first.site_dir)
+
+    def test_venv_build_does_not_see_worker_secrets(self):
+        from src.executors import ExecutionResult
+
+        with mock.patch.dict("os.environ", {"DJANGO_SECRET_KEY": "s3cret"}), \
+                mock.patch("src.executors._run_limited", return_value=ExecutionResult(0, "", "")) as run:
+            self.backend._build(f"{self.root}/envs/x", ["requests"])
+        for call in run.call_args_list:
+            env = call.args[2]
+            self.assertNotIn("DJANGO_SECRET_KEY", env)
+            self.assertEqual(env["HOME"], self.root)
+
+    def test_backend_selection(self):
+        from src.executors import E2BBackend, LocalBackend, resolve_backend
+
+        self.assertIsInstance(resolve_backend({"executor_backend": "local"}), LocalBackend)
+        self.assertIsInstance(resolve_backend({"executor_backend": ""}), E2BBackend)
+        self.assertIs(resolve_backend({"executor_backend": self.backend}), self.backend)
+        with self.assertRaises(ValueError):
+            resolve_backend({"executor_backend": "docker"})
+
+    def test_discard_reaches_sandboxes_parked_by_other_processes(self):
+        from src.executors import discard_session
+
+        # This process never leased an E2B sandbox; the session registry may still hold one.
+        with mock.patch.dict("src.executors._backends", clear=True), \
+                mock.patch("src.executors.get_pool") as get_pool:
+            discard_session("pr-1", api_key="key-a")
+        get_pool.return_value.discard.assert_called_once_with("pr-1", api_key="key-a")
+
+
+class TestImpactTests(SimpleTestCase):
+    ORIGINAL = (
+        "def add(a, b):\n    return a + b\n\n\n"
+        "def sub(a, b):\n    return a - b\n\n\n"
+        "def total(xs):\n    return add(xs[0], xs[1])\n"
+    )
+    TESTS = (
+        "from calc import add, sub, total\n\n\n"
+        "def test_add():\n    assert add(1, 2) == 3\n\n\n"
+        "def test_sub():\n    assert sub(2, 1) == 1\n\n\n"
+        "class TestTotal:\n    def test_total(self):\n        assert total([1, 2]) == 3\n"
+    )
+    COVERAGE = (
+        '{"files": {"calc.py": {"executed_lines": [1, 2, 5, 9], "missing_lines": [6, 10],'
+        ' "contexts": {"2": ["test_calc.py::test_add|run"], "1": [""]}}}}'
+    )
+
+    def test_changed_function_selects_tests_through_the_call_graph(self):
+        from src.impact import select_tests
+
+        refactored = self.ORIGINAL.replace("return a + b", "return b + a")
+        selection = select_tests(self.ORIGINAL, refactored, self.TESTS, "test_calc.py")
+        self.assertEqual(selection.changed, {"add"})
+        self.assertEqual(selection.test_ids, ["test_calc.py::test_add", "test_calc.py::TestTotal::test_total"])
+
+    def test_module_level_change_and_escape_hatch_run_everything(self):
+        from src.impact import select_tests
+
+        self.assertTrue(select_tests(self.ORIGINAL, "import os\n" + self.ORIGINAL, self.TESTS, "t.py").full)
+        refactored = self.ORIGINAL.replace("return a - b", "return -(b - a)")
+        self.assertFalse(select_tests(self.ORIGINAL, refactored, self.TESTS, "t.py").full)
+        self.assertTrue(select_tests(self.ORIGINAL, refactored, self.TESTS, "t.py", full=True).full)
+
+    def test_earlier_coverage_selects_tests_without_static_references(self):
+        from src.impact import select_tests
+
+        refactored = self.ORIGINAL.replace("return a - b", "return -(b - a)")
+        earlier = {"test_calc.py::test_add": ["sub"]}
+        selection = select_tests(self.ORIGINAL, refactored, self.TESTS, "test_calc.py", earlier)
+        self.assertEqual(selection.test_ids, ["test_calc.py::test_add", "test_calc.py::test_sub"])
+
+    def test_coverage_contexts_and_changed_line_coverage(self):
+        from src.impact import changed_lines, changed_lines_coverage, coverage_map
+
+        self.assertEqual(coverage_map(self.COVERAGE, "calc.py", self.ORIGINAL), {"test_calc.py::test_add": ["add"]})
+        self.assertEqual(changed_lines(self.ORIGINAL, {"add"}), {2})
+        self.assertEqual(changed_lines_coverage(self.COVERAGE, "calc.py", {2}), 100.0)
+        self.assertEqual(changed_lines_coverage(self.COVERAGE, "calc.py", {2, 6}), 50.0)
+        self.assertIsNone(changed_lines_coverage("not json", "calc.py", {2}))
+
+    def test_executor_runs_only_impacted_tests(self):
+        from src.agents import call_executor
+        from src.executors import ExecutionResult, ExecutorBackend
+
+        backend = mock.Mock(spec=ExecutorBackend)
+        workspace = backend.lease.return_value
+        workspace.install.return_value = None
+        workspace.run.return_value = ExecutionResult(0, "2 passed", "")
+        workspace.collect.return_value = {".reporover/coverage.json": self.COVERAGE}
+        refactored = self.ORIGINAL.replace("return a + b", "return b + a")
+        state = {"file_path": "calc.py", "original_code": self.ORIGINAL, "refactored_code": refactored,
+                 "final_test_code": self.TESTS, "existing_test_path": "test_calc.py", "repo_files": {}}
+
+        result = call_executor(state, {"configurable": {"executor_backend": backend}})
+        cmd = workspace.run.call_args.args[0]
+        self.assertIn("test_calc.py::test_add test_calc.py::TestTotal::test_total", cmd)
+        self.assertNotIn("--cov-fail-under", cmd)
+        self.assertEqual(result["execution_status"], "SUCCESS")
+        self.assertEqual(result["test_coverage_map"], {"test_calc.py::test_add": ["add"]})
+
+
+class ShardingTests(SimpleTestCase):
+    def test_shards_are_balanced_by_duration(self):
+        from src.sharding import plan_shards
+
+        durations = {"a": 8.0, "b": 4.0, "c": 4.0, "d": 1.0}
+        shards = plan_shards(["a", "b", "c", "d", "e"], durations, 2)
+        loads = sorted(sum(durations.get(t, 4.0) for t in shard) for shard in shards)
+        self.assertEqual(loads, [9.0, 12.0])
+        self.assertEqual(sorted(t for shard in shards for t in shard), ["a", "b", "c", "d", "e"])
+        self.assertEqual(plan_shards(["a"], {}, 4), [["a"]])
+
+    def test_coverage_reports_are_unioned(self):
+        import json
+        from src.sharding import coverage_percent, merge_coverage
+
+        first = '{"files": {"m.py": {"executed_lines": [1, 2], "missing_lines": [3, 4], "contexts": {"2": ["t::a|run"]}}}}'
+        second = '{"files": {"m.py": {"executed_lines": [1, 3], "missing_lines": [2, 4], "contexts": {"3": ["t::b|run"]}}}}'
+        merged = merge_coverage([first, second, "garbage"])
+        data = json.loads(merged)["files"]["m.py"]
+        self.assertEqual((data["executed_lines"], data["missing_lines"]), ([1, 2, 3], [4]))
+        self.assertEqual(set(data["contexts"]), {"2", "3"})
+        self.assertEqual(coverage_percent(merged, "m.py"), 75.0)
+
+    def test_junit_durations_map_back_to_node_ids(self):
+        from src.results import junit_durations
+
+        xml = (
+            '<testsuites><testsuite><testcase classname="tests.test_m" name="test_a" time="0.5"/>'
+            '<testcase classname="tests.test_m.TestB" name="test_c[1]" time="0.25"/>'
+            '<testcase classname="tests.test_m.TestB" name="test_c[2]" time="0.25"/></testsuite></testsuites>'
+        )
+        self.assertEqual(junit_durations(xml, "tests/test_m.py"), {
+            "tests/test_m.py::test_a": 0.5,
+            "tests/test_m.py::TestB::test_c": 0.5,
+        })
+        self.assertEqual(junit_durations("not xml", "t.py"), {})
+
+    def _sharded_run(self, spare=None, shards=2):
+        from src import agents
+        from src.executors import ExecutionResult, ExecutorBackend
+
+        # A unittest class whose name the static scan would not pick up as tests.
+        tests = "import unittest\n\nclass IncCase(unittest.TestCase):\n" + "".join(
+            f"    def test_{i}(self):\n        self.assertEqual(inc({i}), {i + 1})\n" for i in range(4))
+        collected = "\n".join(f"test_m.py::IncCase::test_{i}" for i in range(4)) + "\n\n4 tests collected in 0.01s\n"
+        coverage = '{"files": {"m.py": {"executed_lines": [1, 2], "missing_lines": []}}}'
+        backend = mock.Mock(spec=ExecutorBackend)
+        backend.spare_capacity.return_value = spare
+        workspaces = []
+
+        def lease(*args, **kwargs):
+            workspace = mock.Mock()
+            workspace.install.return_value = None
+            workspace.run.side_effect = lambda cmd, **kw: ExecutionResult(
+                0, collected if "--collect-only" in cmd else f"shard ok {len(workspaces)}", "")
+            workspace.collect.return_value = {".reporover/coverage.json": coverage}
+            workspaces.append(workspace)
+            return workspace
+
+        backend.lease.side_effect = lease
+        state = {"file_path": "m.py", "original_code": "def inc(x):\n    return x + 1\n",
+                 "final_test_code": tests, "existing_test_path": "test_m.py", "repo_files": {}}
+        with mock.patch.multiple(agents, EXECUTOR_SHARDS=shards, SHARD_MIN_TESTS=2):
+            result = agents.call_executor(state, {"configurable": {"executor_backend": backend}})
+        return backend, workspaces, result
+
+    def test_collected_test_ids_skip_the_summary(self):
+        from src.sharding import collected_test_ids
+
+        output = "t.py::test_a\nt.py::TestB::test_c[1 2]\nt.py::Outer::Inner::test_d\n\n3 tests collected in 0.1s\n"
+        self.assertEqual(collected_test_ids(output), ["t.py::test_a", "t.py::Outer::Inner::test_d"])
+
+    def test_extra_shards_are_capped_at_spare_capacity(self):
+        backend, workspaces, result = self._sharded_run(spare=0, shards=4)
+        self.assertEqual(len(workspaces), 1)
+        self.assertFalse(any("--collect-only" in c.args[0] for c in workspaces[0].run.call_args_list))
+        self.assertEqual(result["execution_status"], "SUCCESS")
+
+    def test_executor_merges_sharded_runs(self):
+        backend, workspaces, result = self._sharded_run()
+
+        self.assertEqual(len(workspaces), 2)
+        commands = [w.run.call_args.args[0] for w in workspaces]
+        self.assertTrue(all("--cov-fail-under" not in cmd for cmd in commands))
+        self.assertEqual(sum(cmd.count("test_m.py::IncCase::test_") for cmd in commands), 4)
+        self.assertEqual(result["execution_status"], "SUCCESS")
+        self.assertIn("--- shard 2/2 (2 tests) ---", result["execution_logs"])
+        self.assertEqual(backend.release.call_count, 2)
+
+
+class StructuredResultTests(SimpleTestCase):
+    FAILED = (
+        '<testsuites><testsuite><testcase classname="test_calc" name="test_ok" time="0.1"/>'
+        '<testcase classname="test_calc" name="test_bad" time="0.1"><failure message="assert 3 == 4">'
+        "def test_bad():\n        x = add(1, 2)\n&gt;       assert x == 4\nE       assert 3 == 4\n\n"
+        "test_calc.py:4: AssertionError</failure></testcase></testsuite></testsuites>"
+    )
+    COLLECTION_ERROR = (
+        '<testsuites><testsuite><testcase classname="" name="test_calc"><error message="collection failure">'
+        "ImportError while importing test module.\nTraceback:\ntest_calc.py:1: in &lt;module&gt;\n"
+        "    import requests\nE   ModuleNotFoundError: No module named 'requests'</error></testcase>"
+        "</testsuite></testsuites>"
+    )
+    PASSED = '<testsuites><testsuite><testcase classname="test_calc" name="test_ok"/></testsuite></testsuites>'
+
+    def _summarize(self, junit, exit_code=1, pct=100.0, missing=(), logs=""):
+        from src.results import summarize_run
+
+        return summarize_run([junit], "test_calc.py", exit_code, logs, pct, missing, 80)
+
+    def test_failing_test_ids_and_trimmed_tracebacks(self):
+        result = self._summarize(self.FAILED)
+        self.assertEqual(result["outcome"], "tests_failed")
+        self.assertEqual(result["tests"]["passed"], 1)
+        (failure,) = result["failures"]
+        self.assertEqual(failure["test_id"], "test_calc.py::test_bad")
+        self.assertEqual(failure["message"], "assert 3 == 4")
+        self.assertEqual(failure["traceback"].splitlines(), [
+            ">       assert x == 4", "E       assert 3 == 4", "test_calc.py:4: AssertionError"])
+
+    def test_missing_module_is_a_dependency_error(self):
+        result = self._summarize(self.COLLECTION_ERROR, exit_code=2)
+        self.assertEqual(result["outcome"], "dependency_error")
+        self.assertEqual(result["missing_modules"], ["requests"])
+        self.assertEqual(result["failures"][0]["test_id"], "test_calc.py")
+
+    def test_coverage_below_threshold(self):
+        from src.results import render_result
+
+        result = self._summarize(self.PASSED, exit_code=0, pct=62.5, missing=[5, 6, 7, 10])
+        self.assertEqual(result["outcome"], "coverage_low")
+        self.assertIn("lines never executed: 5-7, 10", render_result(result))
+        self.assertEqual(self._summarize(self.PASSED, exit_code=0)["outcome"], "passed")
+
+    def test_deadline_kill_is_a_timeout(self):
+        result = self._summarize(self.PASSED, exit_code=137, logs="TIMEOUT: killed after 300s.")
+        self.assertEqual(result["outcome"], "timed_out")
+
+    def test_superseded_review_cancels_without_a_sandbox(self):
+        from src.agents import call_executor
+        from src.executors import ExecutorBackend
+
+        backend = mock.Mock(spec=ExecutorBackend)
+        state = {"file_path": "calc.py", "original_code": "x = 1\n", "final_test_code": "def test_ok():\n    pass\n",
+                 "repo_files": {}}
+        result = call_executor(state, {"configurable": {"executor_backend": backend, "cancelled": lambda: True}})
+        self.assertEqual(result["execution_status"], "CANCELLED")
+        backend.lease.assert_not_called()
+
+    def test_without_a_report_the_log_decides(self):
+        self.assertEqual(self._summarize("", logs="ModuleNotFoundError: x")["outcome"], "dependency_error")
+        self.assertEqual(self._summarize("", exit_code=0, pct=95.0)["outcome"], "passed")
+
+    def test_unknown_coverage_fails_closed(self):
+        from src.results import render_result
+
+        for junit in ("", self.PASSED):
+            result = self._summarize(junit, exit_code=0, pct=None)
+            self.assertEqual(result["outcome"], "coverage_low")
+        self.assertIn("COVERAGE (module): unknown", render_result(result))
+
+    def test_executor_routes_on_the_structured_result(self):
+        from src.agents import call_executor
+        from src.executors import ExecutionResult, ExecutorBackend
+
+        backend = mock.Mock(spec=ExecutorBackend)
+        workspace = backend.lease.return_value
+        workspace.install.return_value = None
+        # The log says nothing about coverage; only the JSON report does.
+        workspace.run.return_value = ExecutionResult(0, "raw pytest output", "")
+        workspace.collect.return_value = {
+            ".reporover/junit.xml": self.PASSED,
+            ".reporover/coverage.json": '{"files": {"calc.py": {"executed_lines": [1], "missing_lines": [2, 3]}}}',
+        }
+        state = {"file_path": "calc.py", "original_code": "def f():\n    return 1\n",
+                 "final_test_code": "def test_ok():\n    pass\n", "existing_test_path": "test_calc.py",
+                 "repo_files": {}}
+        result = call_executor(state, {"configurable": {"executor_backend": backend}})
+        self.assertEqual(result["next_node"], "test_engineer_node")
+        self.assertEqual(result["execution_result"]["coverage"]["missing_lines"], [2, 3])
+        self.assertNotIn("raw pytest output", result["messages"][0].content)
+
+
+class LogCompactionTests(SimpleTestCase):
+    FRAME = ['  File "calc.py", line 3, in fact', "    return n * fact(n - 1)"]
+
+    def _failure(self, name):
+        return [f"____ {name} ____", "    def test():", ">       assert add(1, 2) == 4",
+                "E       assert 3 == 4", "", "test_calc.py:4: AssertionError"]
+
+    def test_install_chatter_is_dropped(self):
+        from src.logs import compact_log
+
+        raw = "\n".join([
+            "Collecting requests", "  Downloading requests-2.32.3-py3-none-any.whl (64 kB)",
+            "     ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━ 64.9/64.9 kB 3.1 MB/s eta 0:00:00",
+            "Requirement already satisfied: idna in ./env (3.7)",
+            "Installing collected packages: requests", "Successfully installed requests-2.32.3",
+            "1 passed in 0.01s",
+        ])
+        self.assertEqual(compact_log(raw), "1 passed in 0.01s")
+
+    def test_repeated_frames_and_identical_tracebacks_collapse(self):
+        from src.logs import compact_log
+
+        raw = "\n".join(self.FRAME * 50 + self._failure("test_a") + self._failure("test_b"))
+        compact = compact_log(raw)
+        self.assertEqual(compact.count("fact(n - 1)"), 1)
+        self.assertIn("[previous 2 line(s) repeated 49 more times]", compact)
+        self.assertEqual(compact.count("E       assert 3 == 4"), 1)
+        self.assertIn("[same traceback as test_a]", compact)
+
+    def test_budget_keeps_the_assertion_and_the_summary(self):
+        from src.logs import compact_log
+
+        noise = [f"debug output line {i}" for i in range(2000)]
+        raw = "\n".join(noise[:1000] + self._failure("test_a") + noise[1000:]
+                        + ["FAILED test_calc.py::test_a - assert 3 == 4", "1 failed in 0.02s"])
+        compact = compact_log(raw, budget=1000)
+        self.assertLessEqual(len(compact.encode()), 1000)
+        self.assertIn("E       assert 3 == 4", compact)
+        self.assertIn("1 failed in 0.02s", compact)
+        self.assertIn("lines omitted", compact)
+
+    def test_full_log_is_archived_only_when_configured(self):
+        import gzip
+        import tempfile
+        from src.logs import archive_full_log
+
+        self.assertIsNone(archive_full_log("log", directory=""))
+        with tempfile.TemporaryDirectory() as directory:
+            path = archive_full_log("full log", directory=directory)
+            with gzip.open(path, "rt") as handle:
+                self.assertEqual(handle.read(), "full log")
+            self.assertEqual(archive_full_log("full log", directory=directory), path)
+
+
+class PreflightTests(SimpleTestCase):
+    CODE = "import os\n\n\ndef add(a, b):\n    return a + b\n"
+    TESTS = "from calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n"
+
+    def _check(self, code=CODE, tests=TESTS, dependencies=(), original=CODE):
+        from src.preflight import check
+
+        return check("pkg/calc.py", code, "tests/test_calc.py", tests, ["pkg/calc.py", "pkg/util.py"],
+                     list(dependencies), original)
+
+    def test_clean_code_goes_to_the_sandbox(self):
+        report = self._check(tests=self.TESTS + "import pytest\nfrom pkg.util import x\n")
+        self.assertTrue(report.ok)
+        self.assertEqual(report.next_node, "executor_tool_node")
+
+    def test_syntax_error_in_the_refactor_goes_to_the_refactorer(self):
+        report = self._check(code="def add(a, b)\n    return a + b\n")
+        self.assertEqual(report.target_errors, ["pkg/calc.py:1: SyntaxError: expected ':'"])
+        self.assertEqual(report.next_node, "refactorer_node")
+
+    def test_undefined_name_is_reported_once_per_name(self):
+        report = self._check(code=self.CODE + "\n\ndef sub(a, b):\n    return add(a, -b) + offest\n")
+        self.assertEqual(report.target_errors, ["pkg/calc.py:9: undefined name `offest`"])
+        # Names the original already left undefined are not the refactorer's doing.
+        self.assertTrue(self._check(code="x = y\n", original="x = y\n").ok)
+
+    def test_imports_resolve_against_repo_stdlib_and_dependencies(self):
+        tests = self.TESTS + "import requests\nimport yaml\ntry:\n    import ujson\nexcept ImportError:\n    ujson = None\n"
+        report = self._check(tests=tests, dependencies=["requests>=2"])
+        self.assertEqual(report.test_errors,
+                         ["tests/test_calc.py:7: `import yaml` is not in the repo, the stdlib or pypi_dependencies"])
+        self.assertEqual(report.next_node, "test_engineer_node")
+        self.assertTrue(self._check(tests=tests, dependencies=["Requests", "PyYAML"]).ok)
+
+    def test_new_unknown_import_blames_the_refactor_but_an_old_one_the_dependencies(self):
+        code = "import numpy\n" + self.CODE
+        self.assertEqual(self._check(code=code).next_node, "refactorer_node")
+        report = self._check(code=code, original=code)
+        self.assertEqual(len(report.dependency_errors), 1)
+        self.assertEqual(report.next_node, "test_engineer_node")
+
+    def test_broken_refactor_never_reaches_the_sandbox(self):
+        from src.graph import build_local_app, run_graph
+
+        app = build_local_app()
+        config = {"configurable": {"thread_id": self.id(), "llm": FakeLLM(content="x = undefined_name\n")}}
+        with mock.patch("src.agents.resolve_backend") as backend:
+            run_graph(app, review_state(), config)
+        backend.assert_not_called()
+        snapshot = app.get_state(config)
+        self.assertEqual(snapshot.next, ())
+        self.assertEqual(snapshot.values["iteration_count"], 3)
+        self.assertIn("undefined name `undefined_name`", snapshot.values["execution_logs"])
+
+
+class PatchModeTests(SimpleTestCase):
+    SOURCE = "def add(a, b):\n    return a - b\n\n\ndef sub(a, b):\n    return a - b\n"
+
+    def test_apply_edits_with_unique_anchor(self):
+        from src.patching import apply_edits
+
+        out = apply_edits(self.SOURCE, [("def add(a, b):\n    return a - b", "def add(a, b):\n    return a + b")])
+        self.assertIn("return a + b", out)
+        self.assertTrue(out.endswith("def sub(a, b):\n    return a - b\n"))
+
+    def test_anchor_ignores_trailing_whitespace(self):
+        from src.patching import apply_edits
+
+        out = apply_edits("x = 1   \ny = 2\n", [("x = 1\ny = 2", "x = 3\ny = 2")])
+        self.assertEqual(out, "x = 3\ny = 2\n")
+
+    def test_ambiguous_or_broken_patches_are_rejected(self):
+        from src.patching import PatchError, apply_edits
+
+        with self.assertRaises(PatchError):
+            apply_edits(self.SOURCE, [("    return a - b", "    return 0")])
+        with self.assertRaises(PatchError):
+            apply_edits(self.SOURCE, [("def add(a, b):", "def add(a, b")])
+
+    def test_agent_b_falls_back_to_full_file(self):
+        from src.agents import CodeEdit, RefactorPatch, call_agent_b
+
+        state = review_state(self.SOURCE)
+        bad = RefactorPatch(no_changes=False, edits=[CodeEdit(search="missing", replace="x")])
+        llm = FakeLLM(content="def add(a, b):\n    return a + b\n", patch=bad)
+        config = {"configurable": {"llm": llm, "refactor_patch_min_lines": 2}}
+
+        update = call_agent_b(state, config)
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(update["refactored_code"], "def add(a, b):\n    return a + b")
+
+    def test_agent_b_applies_patch_without_full_file_call(self):
+        from src.agents import CodeEdit, RefactorPatch, call_agent_b
+
+        patch = RefactorPatch(no_changes=False, edits=[
+            CodeEdit(search="def add(a, b):\n    return a - b", replace="def add(a, b):\n    return a + b"),
+        ])
+        llm = FakeLLM(patch=patch)
+        config = {"configurable": {"llm": llm, "refactor_patch_min_lines": 2}}
+
+        update = call_agent_b(review_state(self.SOURCE), config)
+        self.assertEqual(llm.calls, 0)
+        self.assertIn("return a + b", update["refactored_code"])
+        self.assertIn("+    return a + b", update["code_diff"])
+
+
+class ChunkedReviewTests(SimpleTestCase):
+    SOURCE = (
+        "import os\n"
+        "\n"
+        "def a():\n"
+        "    return 1\n"
+        "\n"
+        "LIMIT = 3\n"
+        "\n"
+        "@staticmethod\n"
+        "def b():\n"
+        "    return 2\n"
+        "\n"
+        "class C:\n"
+        "    pass\n"
+    )
+
+    def test_split_by_top_level_definitions(self):
+        from src.chunking import split_module
+
+        plan = split_module(self.SOURCE, max_lines=1)
+        self.assertEqual([c.name for c in plan.chunks], ["a", "b", "C"])
+        self.assertEqual((plan.chunks[1].start_line, plan.chunks[1].end_line), (8, 10))
+        self.assertIn("import os", plan.module_context)
+        self.assertIn("LIMIT = 3", plan.module_context)
+        self.assertEqual(plan.chunks[1].to_original_line(3), 10)
+        self.assertEqual(plan.chunks[1].to_original_line(99), 10)
+
+    def test_small_definitions_are_packed(self):
+        from src.chunking import split_module
+
+        plan = split_module(self.SOURCE, max_lines=8)
+        self.assertEqual(len(plan.chunks), 2)
+        self.assertIsNone(split_module("def only():\n    pass\n"))
+
+    def test_agent_a_reviews_chunks_and_remaps_lines(self):
+        from src.agents import call_agent_a
+
+        issue = dict(ISSUE, line_number=2)
+        llm = FakeLLM(issues=[issue])
+        config = {"configurable": {"llm": llm, "review_chunk_min_lines": 1}}
+        with mock.patch("src.agents.CHUNK_MAX_LINES", 1):
+            update = call_agent_a(review_state(self.SOURCE), config)
+
+        self.assertEqual(len(llm.prompts), 3)
+        self.assertIn("import os", llm.prompts[0])
+        self.assertEqual([i["line_number"] for i in update["review_issues"]], [4, 9, 13])
+
+
+class MeteringTests(SimpleTestCase):
+    def _handler(self):
+        from engine.metering import MeteringHandler
+        from tenancy.models import OrganizationConfig, ReviewSession
+
+        return MeteringHandler(ReviewSession(pr_number=1), OrganizationConfig(github_installation_id=1))
+
+    def test_llm_call_is_attributed_to_its_node(self):
+        import uuid
+        from langchain_core.outputs import ChatGeneration, LLMResult
+
+        handler = self._handler()
+        run_id = uuid.uuid4()
+        handler.on_chat_model_start({}, [], run_id=run_id, metadata={
+            "langgraph_node": "reviewer_node", "ls_provider": "google_genai", "ls_model_name": "m",
+        })
+        message = AIMessage(content="ok", usage_metadata={"input_tokens": 1000, "output_tokens": 200, "total_tokens": 1200})
+        with self.settings(LLM_PRICES_JSON='{"m": [1.0, 10.0]}'):
+            handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+
+        (record,) = handler.records
+        self.assertEqual((record.node, record.provider, record.model_name), ("reviewer_node", "google_genai", "m"))
+        self.assertEqual((record.input_tokens, record.output_tokens), (1000, 200))
+        self.assertEqual(record.cost_micro_usd, 3000)
+
+    def test_sandbox_event_reaches_handler_through_config(self):
+        from langchain_core.runnables import RunnableLambda
+        from src.agents import _report_sandbox_run
+
+        handler = self._handler()
+        RunnableLambda(lambda x, config: _report_sandbox_run(config, 0.0, install_saved_s=1.5)).invoke(
+            1, {"callbacks": [handler]}
+        )
+        (record,) = handler.records
+        self.assertEqual((record.kind, record.provider, record.node), ("sandbox", "e2b", "executor_tool_node"))
+        self.assertGreater(record.wall_ms, 0)
+        self.assertEqual(record.install_saved_ms, 1500)
+
+    def test_graph_runs_checkpoint_serde_is_metered(self):
+        from src.graph import build_local_app, run_graph
+
+        handler = self._handler()
+        state = dict(review_state(), repo_files={"main.py": "x = 1\n", "notes.md": "todo\n" * 300})
+        handler.add_checkpoint_serde(run_graph(build_local_app(), state, {
+            "configurable": {"thread_id": self.id(), "llm": FakeLLM()}}))
+        handler.add_checkpoint_serde({"dumps": 0, "loads": 0})
+        (record,) = [r for r in handler.records if r.kind == "checkpoint"]
+        self.assertEqual(record.node, "checkpointer")
+        self.assertGreater(record.raw_bytes, record.stored_bytes)
+
+    def test_flush_failure_does_not_raise(self):
+        handler = self._handler()
+        handler.on_custom_event("sandbox_run", {"wall_ms": 5}, run_id=None)
+        with mock.patch("tenancy.models.NodeMetric.objects.bulk_create", side_effect=RuntimeError("db down")):
+            self.assertEqual(handler.flush(), 0)
+        self.assertEqual(handler.records, [])
+
+
+class ResilienceTests(SimpleTestCase):
+    def setUp(self):
+        from src import resilience
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+
+    def test_breaker_opens_then_half_open_probe_closes_it(self):
+        from src.resilience import CircuitBreaker
+
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 11
+        self.assertTrue(breaker.allow())   # the single half-open probe
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+    def test_open_circuit_fails_over_or_raises(self):
+        from src import resilience
+
+        for _ in range(resilience.BREAKER_FAILURES):
+            resilience.breaker_for("gemini:a").record_failure()
+        primary = resilience.Attempt("gemini:a", lambda: "primary")
+
+        self.assertEqual(resilience.call(primary, resilience.Attempt("gemini:b", lambda: "fallback")), "fallback")
+        with self.assertRaises(resilience.CircuitOpenError) as ctx:
+            resilience.call(primary)
+        self.assertTrue(is_provider_error(ctx.exception))
+
+    def test_parse_errors_do_not_trip_the_breaker_or_fail_over(self):
+        from src import resilience
+
+        def bad_output():
+            raise ValueError("not json")
+
+        with self.assertRaises(ValueError):
+            resilience.call(resilience.Attempt("gemini:a", bad_output), resilience.Attempt("gemini:b", lambda: "x"))
+        self.assertEqual(resilience.breaker_for("gemini:a").state, "closed")
+
+    def test_auth_errors_do_not_trip_the_breaker_or_fail_over(self):
+        from src import resilience
+
+        class AuthenticationError(Exception):
+            status_code = 401
+
+        def refused():
+            raise AuthenticationError("401 invalid api key")
+
+        for _ in range(resilience.BREAKER_FAILURES):
+            with self.assertRaises(AuthenticationError):
+                resilience.call(resilience.Attempt("gemini:a@t1", refused), resilience.Attempt("gemini:b@t1", lambda: "x"))
+        self.assertEqual(resilience.breaker_for("gemini:a@t1").state, "closed")
+
+    def _half_open(self, key):
+        from src import resilience
+
+        breaker = resilience.breaker_for(key)
+        for _ in range(resilience.BREAKER_FAILURES):
+            breaker.record_failure()
+        breaker._opened_at -= resilience.BREAKER_RESET_SECONDS
+        return breaker
+
+    def test_refused_probe_lets_the_next_call_probe(self):
+        from src import resilience
+
+        class AuthenticationError(Exception):
+            status_code = 401
+
+        def refused():
+            raise AuthenticationError("401 invalid api key")
+
+        breaker = self._half_open("gemini:a@t1")
+        with self.assertRaises(AuthenticationError):
+            resilience.call(resilience.Attempt("gemini:a@t1", refused))
+        self.assertEqual(resilience.call(resilience.Attempt("gemini:a@t1", lambda: "ok")), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+    def test_cancelled_probe_lets_the_next_call_probe(self):
+        import asyncio
+        from src import resilience
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        async def ok():
+            return "ok"
+
+        async def scenario():
+            probe = asyncio.ensure_future(resilience.acall(resilience.Attempt("gemini:a", hang)))
+            await asyncio.sleep(0)
+            probe.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await probe
+            return await resilience.acall(resilience.Attempt("gemini:a", ok))
+
+        breaker = self._half_open("gemini:a")
+        self.assertEqual(asyncio.run(scenario()), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+    def test_breakers_are_scoped_per_tenant_key(self):
+        from src import resilience
+        from src.agents import _call_llm
+
+        for _ in range(resilience.BREAKER_FAILURES):
+            resilience.breaker_for(resilience.attempt_key("gemini", "m", "tenant-a")).record_failure()
+
+        def config(fingerprint):
+            return {"configurable": {"llm_provider": "gemini", "llm_model_name": "m",
+                                     "llm_key_fingerprint": fingerprint}}
+
+        self.assertEqual(_call_llm(config("tenant-b"), "llm", None, lambda llm: "ok"), "ok")
+        with self.assertRaises(resilience.CircuitOpenError) as ctx:
+            _call_llm(config("tenant-a"), "llm", None, lambda llm: "ok")
+        self.assertNotIn("tenant-a", str(ctx.exception))
+
+    def test_slow_call_is_hedged(self):
+        import time
+        from src import resilience
+
+        resilience.latency_for("gemini:a").observe(0.01)
+        calls = []
+
+        def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(1)
+                return "slow"
+            return "fast"
+
+        with mock.patch.multiple(resilience, HEDGE_MIN_SAMPLES=1, HEDGE_MIN_DELAY=0.05):
+            self.assertEqual(resilience.call(resilience.Attempt("gemini:a", fn)), "fast")
+
+    def test_async_failover_after_primary_error(self):
+        import asyncio
+        from src import resilience
+
+        async def boom():
+            raise RuntimeError("503 unavailable")
+
+        async def ok():
+            return "fallback"
+
+        result = asyncio.run(resilience.acall(resilience.Attempt("gemini:a", boom), resilience.Attempt("gemini:b", ok)))
+        self.assertEqual(result, "fallback")
+
+
+class RateGovernorTests(SimpleTestCase):
+    def _governor(self, **kwargs):
+        from src.governor import MemoryBackend, RateGovernor
+
+        self.now = 1000.0
+        self.slept = []
+
+        def sleep(seconds):
+            self.slept.append(seconds)
+            self.now += seconds
+
+        return RateGovernor(MemoryBackend(), "fp", clock=lambda: self.now, sleep=sleep, **kwargs)
+
+    def test_calls_queue_when_the_window_is_full(self):
+        governor = self._governor(rpm=2)
+        for _ in range(3):
+            governor.call(lambda: "ok")
+        self.assertEqual(len(self.slept), 1)
+        self.assertGreaterEqual(self.slept[0], 60)
+
+    def test_429_honours_retry_after_and_learns_a_limit(self):
+        governor = self._governor()
+        governor.call(lambda: "ok")
+        governor.call(lambda: "ok")
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("429 Resource exhausted. Please retry in 7s.")
+            return "ok"
+
+        self.assertEqual(governor.call(flaky), "ok")
+        self.assertEqual(self.slept[0], 7.0)
+        self.assertEqual(governor.limits(), (2, 0))
+
+    def test_token_budget_uses_actual_usage(self):
+        governor = self._governor(tpm=1000)
+        message = AIMessage(content="x", usage_metadata={"input_tokens": 900, "output_tokens": 50, "total_tokens": 950})
+        governor.call(lambda: message, tokens=100)
+        governor.call(lambda: "ok", tokens=100)
+        self.assertEqual(len(self.slept), 1)
+
+    def test_backend_outage_lets_calls_through(self):
+        governor = self._governor(rpm=1)
+        governor.backend.reserve = mock.Mock(side_effect=ConnectionError("redis down"))
+        with self.assertLogs("src.governor", level="ERROR"):
+            self.assertEqual(governor.call(lambda: "ok"), "ok")
+
+
+class TestDiscoveryTests(SimpleTestCase):
+    TARGET = "pkg/calc.py"
+
+    def test_prefers_conventional_name_then_importers(self):
+        from src.suite_discovery import discover
+
+        repo = {
+            self.TARGET: "def add(a, b):\n    return a + b\n",
+            "tests/test_calc.py": "from pkg.calc import add\n",
+            "tests/test_api.py": "import pkg.calc\n",
+            "tests/test_other.py": "import os\n",
+        }
+        found = discover(self.TARGET, repo)
+        self.assertEqual(found["existing_test_path"], "tests/test_calc.py")
+        self.assertEqual(found["related_test_paths"], ["tests/test_api.py", "tests/test_calc.py"])
+
+    def test_importers_are_never_the_suite_to_rewrite(self):
+        from src.agents import _agent_t_prompt
+        from src.suite_discovery import discover
+
+        repo = {self.TARGET: "def add(a, b):\n    return a + b\n", "tests/test_api.py": "import pkg.calc\n"}
+        found = discover(self.TARGET, repo)
+        self.assertIsNone(found["existing_test_path"])
+        self.assertEqual(found["related_test_paths"], ["tests/test_api.py"])
+
+        prompt = _agent_t_prompt(dict(found, file_path=self.TARGET, original_code=repo[self.TARGET], repo_files=repo))
+        self.assertIn("No existing tests were found.", prompt)
+        self.assertIn("read-only context", prompt)
+        self.assertIn("import pkg.calc", prompt)
+
+    def test_loads_branch_tests_through_source(self):
+        from src.suite_discovery import discover
+
+        source = mock.Mock()
+        source.test_paths.return_value = ["tests/calc_test.py", "tests/test_unrelated.py"]
+        source.read.return_value = "from calc import add\n"
+        found = discover(self.TARGET, {self.TARGET: "x = 1\n"}, source)
+
+        source.read.assert_called_once_with("tests/calc_test.py")
+        self.assertEqual(found["existing_test_path"], "tests/calc_test.py")
+        self.assertEqual(found["existing_test_code"], "from calc import add\n")
+
+    def test_discovery_runs_alongside_review(self):
+        from src.graph import build_local_app, run_graph
+
+        app = build_local_app()
+        config = {"configurable": {"thread_id": "discovery", "llm": FakeLLM()}}
+        state = dict(review_state(), repo_files={"main.py": "x = 1\n", "test_main.py": "import main\n"})
+        steps = {}
+        for event in app.stream(state, config=config, stream_mode="debug"):
+            if event["type"] == "task":
+                steps.setdefault(event["step"], set()).add(event["payload"]["name"])
+        self.assertEqual(steps[1], {"reviewer_node", "test_discovery_node"})
+        self.assertEqual(app.get_state(config).values["existing_test_path"], "test_main.py")
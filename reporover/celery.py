@@ -5,6 +5,10 @@ the webhook endpoint can return HTTP 200 within GitHub's 10-second budget
 (PRD §3.3). Start a worker with:
 
     celery -A reporover worker -l info
+
+and the periodic checkpoint retention sweep with:
+
+    celery -A reporover beat -l info
 """
 import os
 
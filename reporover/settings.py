@@ -141,6 +141,15 @@ CELERY_BROKER_URL = env("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_DEFAULT_QUEUE = "reporover"
+# Redis holding the shared per-key LLM rate windows (defaults to the broker).
+GOVERNOR_REDIS_URL = env("GOVERNOR_REDIS_URL") or CELERY_BROKER_URL
+# Checkpoint retention sweep (run `celery -A reporover beat` alongside the workers).
+CELERY_BEAT_SCHEDULE = {
+    "sweep-checkpoints": {
+        "task": "engine.tasks.sweep_checkpoints",
+        "schedule": float(env("CHECKPOINT_SWEEP_SECONDS", "3600")),
+    },
+}
 # --- Celery / Redis Security Overrides ---
 # Tells Celery to allow connection loops over cloud TLS links
 CELERY_BROKER_USE_SSL = {
@@ -169,6 +178,12 @@ GITHUB_WEBHOOK_SECRET = env("GITHUB_WEBHOOK_SECRET")
 GITHUB_OAUTH_CLIENT_ID = env("GITHUB_OAUTH_CLIENT_ID")
 GITHUB_OAUTH_CLIENT_SECRET = env("GITHUB_OAUTH_CLIENT_SECRET")
 
+# --- Metering ---
+# JSON map of model name -> [USD per 1M input tokens, USD per 1M output tokens]
+# used to estimate per-node cost on the dashboard, e.g.
+# {"gemini-2.5-flash": [0.30, 2.50], "gemini-2.5-pro": [1.25, 10.0]}
+LLM_PRICES_JSON = env("LLM_PRICES_JSON", "")
+
 # Login URL for the OAuth dashboard.
 LOGIN_URL = "/dashboard/login/"
 
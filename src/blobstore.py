@@ -0,0 +1,394 @@
+"""Content-addressed side store for the large strings in checkpointed state.
+
+With ``CHECKPOINTER=postgres`` every step writes the channels it changed, and
+every pending write, through the checkpointer's serializer. ``repo_files`` (the
+whole hydrated context), ``file_content`` / ``original_code`` (usually the same
+text) and the test code would otherwise be copied into every checkpoint of
+every session of a PR.
+
+:class:`OffloadingSerializer` wraps the checkpointer's serializer. Before
+encoding, each string of at least ``CHECKPOINT_BLOB_MIN_BYTES`` (found directly
+or inside dicts, lists and tuples) is replaced by a reference to its SHA-256
+digest. The text itself goes to a :class:`BlobStore` once, whichever session
+or PR wrote it first, so checkpoints carry only the references. Payloads are
+tagged ``blob+<type>`` so values written before offloading (or below the
+threshold) load unchanged.
+
+The Postgres savers keep primitive channel values (strings included) inline in
+the checkpoint's JSONB and never pass them to the serializer.
+:func:`box_strings` wraps each large string channel so it takes the
+serializer's blob path instead, and :func:`unbox_strings` unwraps it on load
+(see :mod:`src.checkpointers`).
+
+Blobs are immutable. The Postgres savers run their writes inside
+:func:`thread_scope`, so the store records which threads reference each blob.
+Deleting a thread (the session completed, or its PR closed) then deletes the
+blobs no other thread references, so the source code is not kept after the
+review. ``touched_at`` records the last time a checkpoint referenced a blob,
+so retention can also drop blobs no live checkpoint can need (threads never
+deleted, blobs written before references were recorded).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+BLOB_MIN_BYTES = int(os.environ.get("CHECKPOINT_BLOB_MIN_BYTES", "4096"))
+
+_TAG = "blob+"
+_REF = "__reporover_blob__"
+_BOXED = "__reporover_text__"
+# Thread id whose checkpoint is being written (set by the savers, see thread_scope).
+_writing_thread: ContextVar[Optional[str]] = ContextVar("reporover_writing_thread", default=None)
+_CACHE_SIZE = 256
+# A blob already stored is re-put (refreshing ``touched_at``) at most this often per process.
+_TOUCH_SECONDS = 3600
+
+
+class BlobStore(ABC):
+    """Immutable blobs keyed by the SHA-256 hex digest of their content."""
+
+    @abstractmethod
+    def put_many(self, blobs: Dict[str, bytes]) -> None: ...
+
+    @abstractmethod
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]: ...
+
+    def reference(self, thread_id: str, keys: Iterable[str]) -> set:
+        """Record that ``thread_id`` references ``keys``; returns the keys with no blob stored."""
+        return set()
+
+    def release(self, thread_ids: Iterable[str]) -> int:
+        """Forget the threads' references and delete blobs nothing references any more."""
+        return 0
+
+    def prune(self, older_than_seconds: int, limit: int = 1000) -> int:
+        """Delete up to ``limit`` blobs no checkpoint has referenced for ``older_than_seconds``."""
+        return 0
+
+
+class MemoryBlobStore(BlobStore):
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._blobs: Dict[str, bytes] = {}
+        self._touched: Dict[str, float] = {}
+        self._refs: Dict[str, set] = {}  # thread id -> referenced keys
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    def put_many(self, blobs):
+        now = self._clock()
+        with self._lock:
+            for key, data in blobs.items():
+                self._blobs.setdefault(key, data)
+                self._touched[key] = now
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._blobs[key] for key in keys if key in self._blobs}
+
+    def reference(self, thread_id, keys):
+        keys = set(keys)
+        with self._lock:
+            self._refs.setdefault(thread_id, set()).update(keys)
+            return keys - set(self._blobs)
+
+    def release(self, thread_ids):
+        with self._lock:
+            released = set().union(*(self._refs.pop(thread, set()) for thread in thread_ids))
+            live = set().union(*self._refs.values())
+            gone = [key for key in released - live if key in self._blobs]
+            for key in gone:
+                del self._blobs[key]
+                self._touched.pop(key, None)
+        return len(gone)
+
+    def prune(self, older_than_seconds, limit=1000):
+        horizon = self._clock() - older_than_seconds
+        with self._lock:
+            stale = [key for key, touched in self._touched.items() if touched < horizon][:limit]
+            for key in stale:
+                del self._blobs[key]
+                del self._touched[key]
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+
+class PostgresBlobStore(BlobStore):
+    """Blobs in ``reporover_state_blobs``, next to the LangGraph checkpoint tables."""
+
+    TABLE = "reporover_state_blobs"
+    REFS_TABLE = "reporover_state_blob_refs"
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def setup(self) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                " hash TEXT PRIMARY KEY,"
+                " data BYTEA NOT NULL,"
+                " created_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+                " touched_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.REFS_TABLE} ("
+                " thread_id TEXT NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " PRIMARY KEY (thread_id, hash))"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.REFS_TABLE}_hash ON {self.REFS_TABLE} (hash)")
+
+    def put_many(self, blobs):
+        if not blobs:
+            return
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    f"INSERT INTO {self.TABLE} (hash, data) VALUES (%s, %s) "
+                    f"ON CONFLICT (hash) DO UPDATE SET touched_at = now()",
+                    list(blobs.items()),
+                )
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self.pool.connection() as conn:
+            rows = conn.execute(f"SELECT hash, data FROM {self.TABLE} WHERE hash = ANY(%s)", (keys,)).fetchall()
+        return {key: bytes(data) for key, data in rows}
+
+    def reference(self, thread_id, keys):
+        keys = sorted(set(keys))
+        if not keys:
+            return set()
+        with self.pool.connection() as conn:
+            conn.execute(
+                f"INSERT INTO {self.REFS_TABLE} (thread_id, hash) SELECT %s, unnest(%s::text[]) "
+                "ON CONFLICT DO NOTHING",
+                (thread_id, keys),
+            )
+            # A blob released by another thread's deletion before this reference landed must be re-put.
+            stored = conn.execute(f"SELECT hash FROM {self.TABLE} WHERE hash = ANY(%s)", (keys,)).fetchall()
+        return set(keys) - {row[0] for row in stored}
+
+    def release(self, thread_ids):
+        thread_ids = list(thread_ids)
+        if not thread_ids:
+            return 0
+        with self.pool.connection() as conn, conn.transaction():
+            released = conn.execute(
+                f"DELETE FROM {self.REFS_TABLE} WHERE thread_id = ANY(%s) RETURNING hash", (thread_ids,)
+            ).fetchall()
+            if not released:
+                return 0
+            return conn.execute(
+                f"DELETE FROM {self.TABLE} b WHERE b.hash = ANY(%s) AND NOT EXISTS ("
+                f" SELECT 1 FROM {self.REFS_TABLE} r WHERE r.hash = b.hash)",
+                (sorted({row[0] for row in released}),),
+            ).rowcount
+
+    def prune(self, older_than_seconds, limit=1000):
+        with self.pool.connection() as conn:
+            return conn.execute(
+                f"DELETE FROM {self.TABLE} WHERE hash IN ("
+                f" SELECT hash FROM {self.TABLE} WHERE touched_at < now() - make_interval(secs => %s) LIMIT %s)",
+                (older_than_seconds, limit),
+            ).rowcount
+
+
+class OffloadingSerializer:
+    """Checkpoint serializer that stores large strings once, by hash, in a :class:`BlobStore`."""
+
+    def __init__(self, inner, store: BlobStore, min_bytes: int = BLOB_MIN_BYTES):
+        self.inner = inner
+        self.store = store
+        self.min_bytes = min_bytes
+        # Digest -> text for recently seen blobs, so most loads skip the store.
+        self._recent: "OrderedDict[str, str]" = OrderedDict()
+        self._stored: "OrderedDict[str, float]" = OrderedDict()  # digest -> when this process last put it
+        self._referenced: "OrderedDict[Tuple[str, str], None]" = OrderedDict()  # (thread, digest) recorded
+        self._lock = threading.Lock()
+
+    # --- untyped protocol (delegated) ------------------------------------------
+    def dumps(self, obj: Any) -> bytes:
+        return self.inner.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.inner.loads(data)
+
+    # --- typed protocol -------------------------------------------------------------
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if self.min_bytes <= 0:
+            return self.inner.dumps_typed(obj)
+        pending: Dict[str, bytes] = {}
+        stripped = self._strip(obj, pending)
+        if stripped is obj:
+            return self.inner.dumps_typed(obj)
+        self._upload(pending)
+        type_, data = self.inner.dumps_typed(stripped)
+        return f"{_TAG}{type_}", data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if not type_.startswith(_TAG):
+            return self.inner.loads_typed(data)
+        value = self.inner.loads_typed((type_[len(_TAG):], payload))
+        refs: set = set()
+        self._collect(value, refs)
+        return self._restore(value, self._fetch(refs))
+
+    # --- internals ------------------------------------------------------------
+    def _strip(self, value: Any, pending: Dict[str, bytes]) -> Any:
+        """``value`` with large strings replaced by refs; the same object when nothing changed."""
+        if isinstance(value, str):
+            encoded = value.encode("utf-8")
+            if len(encoded) < self.min_bytes:
+                return value
+            key = hashlib.sha256(encoded).hexdigest()
+            pending[key] = encoded
+            self._remember(key, value)
+            return {_REF: key}
+        if isinstance(value, dict):
+            items = {k: self._strip(v, pending) for k, v in value.items()}
+            return value if all(items[k] is value[k] for k in value) else items
+        if isinstance(value, (list, tuple)):
+            items = [self._strip(v, pending) for v in value]
+            if all(new is old for new, old in zip(items, value)):
+                return value
+            return items if isinstance(value, list) else tuple(items)
+        return value
+
+    def _collect(self, value: Any, refs: set) -> None:
+        if isinstance(value, dict):
+            if len(value) == 1 and _REF in value:
+                refs.add(value[_REF])
+                return
+            for v in value.values():
+                self._collect(v, refs)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                self._collect(v, refs)
+
+    def _restore(self, value: Any, texts: Dict[str, str]) -> Any:
+        if isinstance(value, dict):
+            if len(value) == 1 and _REF in value:
+                return texts[value[_REF]]
+            return {k: self._restore(v, texts) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._restore(v, texts) for v in value]
+        if isinstance(value, tuple):
+            return tuple(self._restore(v, texts) for v in value)
+        return value
+
+    def _upload(self, pending: Dict[str, bytes]) -> None:
+        # Blobs are immutable: only send ones this process has not stored (or touched) lately.
+        now = time.monotonic()
+        with self._lock:
+            fresh = {key: data for key, data in pending.items()
+                     if now - self._stored.get(key, float("-inf")) >= _TOUCH_SECONDS}
+        fresh.update({key: pending[key] for key in self._reference(pending)})
+        if not fresh:
+            return
+        self.store.put_many(fresh)
+        with self._lock:
+            for key in fresh:
+                self._stored[key] = now
+                self._stored.move_to_end(key)
+            while len(self._stored) > _CACHE_SIZE * 16:
+                self._stored.popitem(last=False)
+
+    def _reference(self, pending: Dict[str, bytes]) -> set:
+        """Record the writing thread's references; returns keys whose blob must be (re-)put."""
+        thread = _writing_thread.get()
+        if thread is None:
+            return set()
+        with self._lock:
+            new = {key for key in pending if (thread, key) not in self._referenced}
+        if not new:
+            return set()
+        missing = self.store.reference(thread, new)
+        with self._lock:
+            for key in new:
+                self._referenced[(thread, key)] = None
+            while len(self._referenced) > _CACHE_SIZE * 16:
+                self._referenced.popitem(last=False)
+        return missing
+
+    def _fetch(self, refs: set) -> Dict[str, str]:
+        texts: Dict[str, str] = {}
+        with self._lock:
+            for key in refs:
+                if key in self._recent:
+                    texts[key] = self._recent[key]
+                    self._recent.move_to_end(key)
+        missing = refs - set(texts)
+        if missing:
+            found = self.store.get_many(missing)
+            lost = missing - set(found)
+            if lost:
+                raise KeyError(f"Checkpoint references missing state blobs: {sorted(lost)}")
+            for key, data in found.items():
+                texts[key] = data.decode("utf-8")
+                self._remember(key, texts[key])
+        return texts
+
+    def _remember(self, key: str, text: str) -> None:
+        with self._lock:
+            self._recent[key] = text
+            self._recent.move_to_end(key)
+            while len(self._recent) > _CACHE_SIZE:
+                self._recent.popitem(last=False)
+
+
+@contextmanager
+def thread_scope(thread_id: str):
+    """Blobs written by the serializer inside this block are referenced by ``thread_id``."""
+    token = _writing_thread.set(thread_id)
+    try:
+        yield
+    finally:
+        _writing_thread.reset(token)
+
+
+def box_strings(checkpoint: dict, new_versions: dict, min_bytes: int = BLOB_MIN_BYTES) -> Tuple[dict, dict]:
+    """``checkpoint`` with large string channels boxed, and the versions to write them at.
+
+    Boxed channels are written at their current version even when unchanged:
+    threads checkpointed before boxing have no blob row for them yet, and the
+    savers' upsert ignores rows that already exist.
+    """
+    if min_bytes <= 0:
+        return checkpoint, new_versions
+    versions = checkpoint.get("channel_versions") or {}
+    large = [key for key, value in checkpoint["channel_values"].items()
+             if isinstance(value, str) and key in versions and len(value.encode("utf-8")) >= min_bytes]
+    if not large:
+        return checkpoint, new_versions
+    values = dict(checkpoint["channel_values"])
+    for key in large:
+        values[key] = {_BOXED: values[key]}
+    return {**checkpoint, "channel_values": values}, {**{key: versions[key] for key in large}, **new_versions}
+
+
+def unbox_strings(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value[_BOXED] if isinstance(value, dict) and len(value) == 1 and _BOXED in value else value
+            for key, value in values.items()}
+
+
+def offloading(inner=None, store: Optional[BlobStore] = None) -> OffloadingSerializer:
+    """The default checkpoint serializer wrapped for offloading (in-memory store unless given)."""
+    if inner is None:
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+        inner = JsonPlusSerializer()
+    return OffloadingSerializer(inner, store if store is not None else MemoryBlobStore())
@@ -0,0 +1,62 @@
+"""Postgres checkpointers that offload large string channels.
+
+``PostgresSaver`` / ``AsyncPostgresSaver`` store primitive channel values
+inline in the checkpoint row, so ``file_content``, ``original_code``,
+``refactored_code``, ``final_test_code`` and ``execution_logs`` would be copied
+into every checkpoint uncompressed. These subclasses box the large ones
+(:func:`src.blobstore.box_strings`) so they go through the offloading,
+compressing serializer like every other channel. Writes run inside
+:func:`src.blobstore.thread_scope`, so the blob store knows which threads
+reference each blob and deleting a thread can delete its blobs too.
+
+The async saver also decodes channel blobs on a worker thread: the serializer
+fetches offloaded text from the blob table over the synchronous pool, which
+must not block the shared runtime loop.
+"""
+from __future__ import annotations
+
+import asyncio
+
+from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+from src.blobstore import box_strings, thread_scope, unbox_strings
+
+
+def _thread(config) -> str:
+    return str(config["configurable"]["thread_id"])
+
+
+class OffloadingPostgresSaver(PostgresSaver):
+    def put(self, config, checkpoint, metadata, new_versions):
+        checkpoint, new_versions = box_strings(checkpoint, new_versions)
+        with thread_scope(_thread(config)):
+            return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with thread_scope(_thread(config)):
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def _load_blobs(self, blob_values):
+        return unbox_strings(super()._load_blobs(blob_values))
+
+
+class OffloadingAsyncPostgresSaver(AsyncPostgresSaver):
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        checkpoint, new_versions = box_strings(checkpoint, new_versions)
+        # asyncio.to_thread copies the context, so the serializer's worker thread sees the scope.
+        with thread_scope(_thread(config)):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        with thread_scope(_thread(config)):
+            return await super().aput_writes(config, writes, task_id, task_path)
+
+    def _load_blobs(self, blob_values):
+        return unbox_strings(super()._load_blobs(blob_values))
+
+    async def _load_checkpoint_tuple(self, value):
+        blobs = await asyncio.to_thread(self._load_blobs, value["channel_values"])
+        loaded = await super()._load_checkpoint_tuple({**value, "channel_values": []})
+        loaded.checkpoint["channel_values"].update(blobs)
+        return loaded
@@ -0,0 +1,79 @@
+"""Split very large modules at top-level definitions for map-reduce review.
+
+Agent A normally reviews a file in one prompt. Past a size threshold that is
+slow and can overflow the context window, so the file is cut along top-level
+``def`` / ``class`` boundaries (decorators included) and neighbouring small
+definitions are packed together up to a line budget. Everything that is not a
+top-level definition (imports, constants, module docstring) becomes shared
+module context sent with every chunk.
+"""
+from __future__ import annotations
+
+import ast
+from dataclasses import dataclass
+from typing import List, Optional
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+@dataclass
+class Chunk:
+    name: str
+    start_line: int  # 1-based, inclusive, in the original file
+    end_line: int    # 1-based, inclusive
+    source: str
+
+    def to_original_line(self, line_number: int) -> int:
+        """Map a 1-based line inside this chunk back to the original file."""
+        line = self.start_line + max(int(line_number), 1) - 1
+        return min(line, self.end_line)
+
+
+@dataclass
+class ModulePlan:
+    module_context: str
+    chunks: List[Chunk]
+
+
+def split_module(source: str, max_lines: int = 300) -> Optional[ModulePlan]:
+    """Plan chunks for ``source``; None when it cannot or need not be split."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+
+    lines = source.splitlines(keepends=True)
+    context_lines: List[str] = []
+    spans = []  # (name, start, end) of each top-level definition
+    for node in tree.body:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        end = node.end_lineno or node.lineno
+        if isinstance(node, _DEFINITIONS):
+            spans.append((node.name, start, end))
+        else:
+            context_lines.extend(lines[start - 1:end])
+
+    if len(spans) < 2:
+        return None
+
+    chunks: List[Chunk] = []
+    names: List[str] = []
+    chunk_start = chunk_end = None
+    for name, start, end in spans:
+        if chunk_start is not None and end - chunk_start + 1 > max_lines:
+            chunks.append(_chunk(lines, names, chunk_start, chunk_end))
+            names, chunk_start = [], None
+        if chunk_start is None:
+            chunk_start = start
+        names.append(name)
+        chunk_end = end
+    chunks.append(_chunk(lines, names, chunk_start, chunk_end))
+
+    if len(chunks) < 2:
+        return None
+    return ModulePlan(module_context="".join(context_lines), chunks=chunks)
+
+
+def _chunk(lines: List[str], names: List[str], start: int, end: int) -> Chunk:
+    label = names[0] if len(names) == 1 else f"{names[0]} … {names[-1]}"
+    return Chunk(name=label, start_line=start, end_line=end, source="".join(lines[start - 1:end]))
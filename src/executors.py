@@ -0,0 +1,443 @@
+"""Pluggable backends for the executor node.
+
+``call_executor`` talks to an :class:`ExecutorBackend`, never to a sandbox
+SDK directly. A backend leases a :class:`Workspace` that can ``hydrate`` the
+repo files, ``install`` the agent-declared dependencies, ``run`` a command and
+``collect`` result files. Two backends ship:
+
+* ``e2b`` — the warm E2B sandbox pool (:mod:`src.sandbox`). This is the default.
+* ``local`` — a subprocess on the worker host. Each run gets its own temp
+  directory. Dependencies go into isolated venvs cached by dependency set.
+  Runs get rlimits (CPU seconds, address space, file size) and a wall-clock
+  timeout that kills the whole process group. This backend is for on-prem and
+  offline installs, load tests, and small repos where E2B round-trips dominate.
+  It runs code on the worker itself, so enable it only for trusted tenants.
+
+The backend is ``EXECUTOR_BACKEND`` unless an operator picks another one for
+an org in the Django admin (``OrganizationConfig.executor_backend``). Tenants
+cannot choose it themselves.
+
+Every test run has a wall-clock deadline (``EXECUTOR_TEST_TIMEOUT``) and a CPU
+deadline. Both are enforced inside the sandbox or process group, which is
+killed when either is hit. :func:`run_with_deadline` also polls a
+cancellation callable (a newer commit superseded the review) and kills the
+workspace as soon as it fires. As a backstop, it kills a run whose backend
+call outlives its own deadline.
+"""
+from __future__ import annotations
+
+import fcntl
+import io
+import logging
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional
+
+from src.sandbox import (
+    WORKSPACE,
+    TEST_TOOLING,
+    DependencyInstallError,
+    EnvResult,
+    Hydration,
+    SandboxPool,
+    ensure_env,
+    env_key,
+    get_pool,
+    hydrate,
+    normalize_dependencies,
+    pack_files,
+    run_command,
+)
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_BACKEND = os.environ.get("EXECUTOR_BACKEND", "e2b").lower()
+TEST_TIMEOUT = int(os.environ.get("EXECUTOR_TEST_TIMEOUT", "300"))
+INSTALL_TIMEOUT = int(os.environ.get("EXECUTOR_INSTALL_TIMEOUT", "300"))
+CPU_SECONDS = int(os.environ.get("EXECUTOR_CPU_SECONDS", "300"))
+CANCEL_POLL_SECONDS = float(os.environ.get("EXECUTOR_CANCEL_POLL_SECONDS", "5"))
+# Extra time the backend call gets past its own deadline before the run is abandoned.
+DEADLINE_GRACE_SECONDS = 30
+
+TIMEOUT_MARKER = "TIMEOUT: killed after"
+CPU_LIMIT_MARKER = "CPU LIMIT: killed after"
+
+LOCAL_ROOT = os.environ.get("LOCAL_EXECUTOR_ROOT") or os.path.join(tempfile.gettempdir(), "reporover-executor")
+LOCAL_MEMORY_MB = int(os.environ.get("LOCAL_EXECUTOR_MEMORY_MB", "2048"))
+LOCAL_CPU_SECONDS = int(os.environ.get("LOCAL_EXECUTOR_CPU_SECONDS", "300"))
+LOCAL_MAX_FILE_MB = int(os.environ.get("LOCAL_EXECUTOR_MAX_FILE_MB", "256"))
+
+
+@dataclass
+class ExecutionResult:
+    exit_code: int
+    stdout: str
+    stderr: str
+
+
+class Workspace(ABC):
+    """One leased place to run a review's tests."""
+
+    @abstractmethod
+    def hydrate(self, files: Dict[str, str]) -> Hydration: ...
+
+    @abstractmethod
+    def install(self, dependencies) -> Optional[EnvResult]:
+        """Make ``dependencies`` importable by later runs; raises ``DependencyInstallError``."""
+
+    @abstractmethod
+    def run(self, cmd: str, timeout: float = TEST_TIMEOUT) -> ExecutionResult: ...
+
+    @abstractmethod
+    def collect(self, paths: Iterable[str]) -> Dict[str, str]:
+        """Read result files (workspace-relative); missing files are left out."""
+
+    @abstractmethod
+    def cancel(self) -> None:
+        """Kill whatever is running; the workspace is unusable afterwards."""
+
+
+class ExecutorBackend(ABC):
+    name = ""
+
+    @abstractmethod
+    def lease(self, api_key: Optional[str], session: Optional[str] = None, dependencies=None) -> Workspace: ...
+
+    @abstractmethod
+    def release(self, workspace: Workspace, keep: bool = False, healthy: bool = True) -> None:
+        """Give the workspace back; ``keep`` holds it for the session's retry."""
+
+    def discard(self, session: str, api_key: Optional[str] = None) -> None:
+        """Drop whatever the backend still holds for a finished review session."""
+
+    def spare_capacity(self, api_key: Optional[str]) -> Optional[int]:
+        """Workspaces the tenant could lease now without waiting; None when unbounded."""
+        return None
+
+
+# --------------------------------------------------------------------------- #
+# E2B
+# --------------------------------------------------------------------------- #
+
+_TIMEOUT_KILL = "timeout: sending signal KILL"
+
+
+class E2BWorkspace(Workspace):
+    def __init__(self, leased):
+        self.leased = leased
+        self._envs: Optional[Dict[str, str]] = None
+
+    def hydrate(self, files):
+        # A sandbox parked for the session already holds most files; send only the changed ones.
+        return hydrate(self.leased.sbx, files, uploaded=self.leased.uploaded)
+
+    def install(self, dependencies):
+        env = ensure_env(self.leased, dependencies, timeout=INSTALL_TIMEOUT)
+        self._envs = {"PYTHONPATH": env.site_dir} if env is not None else None
+        return env
+
+    def run(self, cmd, timeout=TEST_TIMEOUT):
+        # Deadlines are enforced in the sandbox so a runaway test is killed there, not just abandoned.
+        limited = (f"ulimit -t {CPU_SECONDS} 2>/dev/null; "
+                   f"timeout --verbose -k 5 {int(timeout)} bash -c {shlex.quote(cmd)}")
+        result = run_command(self.leased.sbx, limited, cwd=WORKSPACE, envs=self._envs,
+                             timeout=timeout + DEADLINE_GRACE_SECONDS)
+        stderr = result.stderr
+        # 137 alone is any SIGKILL (the OOM killer too); it is a deadline only if ``timeout`` escalated.
+        if result.exit_code == 124 or (result.exit_code == 137 and _TIMEOUT_KILL in (stderr or "")):
+            stderr = f"{stderr}\n{TIMEOUT_MARKER} {timeout:.0f}s."
+        elif result.exit_code == 128 + signal.SIGXCPU:
+            stderr = f"{stderr}\n{CPU_LIMIT_MARKER} {CPU_SECONDS}s of CPU time."
+        return ExecutionResult(result.exit_code, result.stdout, stderr)
+
+    def cancel(self):
+        self.leased.sbx.kill()
+
+    def collect(self, paths):
+        collected = {}
+        for path in paths:
+            try:
+                collected[path] = self.leased.sbx.files.read(f"{WORKSPACE}/{path}")
+            except Exception:
+                logger.debug("No %s in the sandbox workspace.", path)
+        return collected
+
+
+class E2BBackend(ExecutorBackend):
+    name = "e2b"
+
+    def __init__(self, pool: Optional[SandboxPool] = None):
+        self._pool = pool
+
+    @property
+    def pool(self) -> SandboxPool:
+        return self._pool or get_pool()
+
+    def lease(self, api_key, session=None, dependencies=None):
+        return E2BWorkspace(self.pool.lease(api_key, session=session, dependencies=dependencies))
+
+    def release(self, workspace, keep=False, healthy=True):
+        self.pool.release(workspace.leased, keep=keep, healthy=healthy)
+
+    def discard(self, session, api_key=None):
+        self.pool.discard(session, api_key=api_key)
+
+    def spare_capacity(self, api_key):
+        return self.pool.spare(api_key)
+
+
+# --------------------------------------------------------------------------- #
+# Local subprocess
+# --------------------------------------------------------------------------- #
+
+def _limit_resources():  # pragma: no cover - runs in the child process
+    import resource
+
+    os.setsid()
+    for limit, value in (
+        (resource.RLIMIT_CPU, LOCAL_CPU_SECONDS),
+        (resource.RLIMIT_AS, LOCAL_MEMORY_MB * 1024 * 1024),
+        (resource.RLIMIT_FSIZE, LOCAL_MAX_FILE_MB * 1024 * 1024),
+    ):
+        if value > 0:
+            resource.setrlimit(limit, (value, value))
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (OSError, AttributeError):
+        proc.kill()
+
+
+def _run_limited(cmd, cwd: str, env: Dict[str, str], timeout: float, shell: bool = False,
+                 started: Optional[Callable[[subprocess.Popen], None]] = None) -> ExecutionResult:
+    """Run under rlimits in its own process group; the whole group is killed on timeout."""
+    proc = subprocess.Popen(
+        cmd, cwd=cwd, env=env, shell=shell, text=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        preexec_fn=_limit_resources if os.name == "posix" else None,
+    )
+    if started is not None:
+        started(proc)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        stdout, stderr = proc.communicate()
+        return ExecutionResult(-signal.SIGKILL, stdout, f"{stderr}\n{TIMEOUT_MARKER} {timeout:.0f}s.")
+    if proc.returncode == -signal.SIGXCPU:
+        stderr = f"{stderr}\n{CPU_LIMIT_MARKER} {LOCAL_CPU_SECONDS}s of CPU time."
+    return ExecutionResult(proc.returncode, stdout, stderr)
+
+
+def _stripped_env(bin_dir: str, home: str) -> Dict[str, str]:
+    """Environment for untrusted code (tests, dependency builds): none of the worker's secrets."""
+    return {
+        "PATH": os.pathsep.join([bin_dir, "/usr/local/bin", "/usr/bin", "/bin"]),
+        "HOME": home,
+        "TMPDIR": home,
+        "LANG": "C.UTF-8",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+
+
+class LocalWorkspace(Workspace):
+    def __init__(self, backend: "LocalBackend", path: str):
+        self.backend = backend
+        self.path = path
+        self._venv: Optional[str] = None
+        self._proc: Optional[subprocess.Popen] = None
+
+    def hydrate(self, files):
+        started = time.monotonic()
+        archive = pack_files(files)
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar:
+            tar.extractall(self.path, filter="data")
+        return Hydration(files=len(files), archive_bytes=len(archive), seconds=time.monotonic() - started)
+
+    def install(self, dependencies):
+        # Even without declared dependencies the run needs a venv with the test tooling.
+        env = self.backend.ensure_venv(dependencies)
+        self._venv = env.site_dir
+        return env
+
+    def _env(self) -> Dict[str, str]:
+        bin_dir = os.path.join(self._venv, "bin") if self._venv else os.path.dirname(sys.executable)
+        return _stripped_env(bin_dir, self.path)
+
+    def run(self, cmd, timeout=TEST_TIMEOUT):
+        return _run_limited(cmd, self.path, self._env(), timeout, shell=True,
+                            started=lambda proc: setattr(self, "_proc", proc))
+
+    def cancel(self):
+        if self._proc is not None and self._proc.poll() is None:
+            _kill_group(self._proc)
+
+    def collect(self, paths):
+        collected = {}
+        for path in paths:
+            full = os.path.realpath(os.path.join(self.path, path))
+            if not full.startswith(os.path.realpath(self.path) + os.sep) or not os.path.isfile(full):
+                continue
+            with open(full, encoding="utf-8", errors="replace") as handle:
+                collected[path] = handle.read()
+        return collected
+
+
+class LocalBackend(ExecutorBackend):
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_ROOT, python: str = sys.executable):
+        self.root = root
+        self.python = python
+        self._lock = threading.Lock()
+
+    def lease(self, api_key, session=None, dependencies=None):
+        runs = os.path.join(self.root, "runs")
+        os.makedirs(runs, exist_ok=True)
+        return LocalWorkspace(self, tempfile.mkdtemp(prefix="run-", dir=runs))
+
+    def release(self, workspace, keep=False, healthy=True):
+        # Venvs are cached by dependency set, so nothing is worth keeping per session.
+        shutil.rmtree(workspace.path, ignore_errors=True)
+
+    def ensure_venv(self, dependencies) -> EnvResult:
+        requirements = normalize_dependencies(dependencies)
+        key = env_key(requirements, f"{sys.version_info.major}.{sys.version_info.minor}")
+        venv = os.path.join(self.root, "envs", key)
+        marker = os.path.join(venv, ".reporover-ready")
+        if os.path.exists(marker):
+            return EnvResult(key, venv, cached=True, saved_seconds=self._recorded_seconds(marker))
+
+        os.makedirs(os.path.dirname(venv), exist_ok=True)
+        # One builder per env across threads (lock) and worker processes (flock).
+        with self._lock, open(f"{venv}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if os.path.exists(marker):
+                return EnvResult(key, venv, cached=True, saved_seconds=self._recorded_seconds(marker))
+            shutil.rmtree(venv, ignore_errors=True)
+            started = time.monotonic()
+            try:
+                self._build(venv, requirements)
+            except Exception:
+                shutil.rmtree(venv, ignore_errors=True)
+                raise
+            elapsed = time.monotonic() - started
+            with open(marker, "w") as handle:
+                handle.write(f"{elapsed:.3f}")
+        return EnvResult(key, venv, cached=False, install_seconds=elapsed)
+
+    @staticmethod
+    def _recorded_seconds(marker: str) -> float:
+        try:
+            with open(marker) as handle:
+                return float(handle.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0.0
+
+    def _build(self, path: str, requirements) -> None:
+        # Dependency builds run setup.py / build backends from PyPI: same stripped env as test runs.
+        env = _stripped_env(os.path.dirname(self.python), self.root)
+        created = _run_limited([self.python, "-m", "venv", path], self.root, env, INSTALL_TIMEOUT)
+        if created.exit_code:
+            raise DependencyInstallError(f"venv creation failed:\n{created.stdout}\n{created.stderr}")
+        pip = [os.path.join(path, "bin", "python"), "-m", "pip", "install", "-q", *TEST_TOOLING.split(), *requirements]
+        installed = _run_limited(pip, self.root, _stripped_env(os.path.join(path, "bin"), self.root), INSTALL_TIMEOUT)
+        if installed.exit_code:
+            raise DependencyInstallError(f"pip install failed:\n{installed.stdout}\n{installed.stderr}")
+
+
+# --------------------------------------------------------------------------- #
+# Deadlines and cancellation
+# --------------------------------------------------------------------------- #
+
+class RunCancelled(RuntimeError):
+    """The run was cancelled (e.g. a newer commit superseded the review) and its workspace killed."""
+
+
+def run_with_deadline(workspace: Workspace, cmd: str, timeout: float = TEST_TIMEOUT,
+                      cancelled: Optional[Callable[[], bool]] = None,
+                      poll: float = CANCEL_POLL_SECONDS) -> ExecutionResult:
+    """``workspace.run`` that can be cancelled, and that never outlives its deadline.
+
+    Raises :class:`RunCancelled` once ``cancelled()`` returns true.
+    """
+    outcome: Dict[str, object] = {}
+
+    def _run():
+        try:
+            outcome["result"] = workspace.run(cmd, timeout=timeout)
+        except BaseException as exc:  # re-raised in the caller's thread
+            outcome["error"] = exc
+
+    worker = threading.Thread(target=_run, name="reporover-executor-run", daemon=True)
+    deadline = time.monotonic() + timeout + DEADLINE_GRACE_SECONDS
+    worker.start()
+    while True:
+        worker.join(timeout=max(min(poll, deadline - time.monotonic()), 0))
+        if not worker.is_alive():
+            break
+        if cancelled is not None and cancelled():
+            workspace.cancel()
+            raise RunCancelled("Run cancelled: the review was superseded.")
+        if time.monotonic() >= deadline:
+            workspace.cancel()
+            return ExecutionResult(-signal.SIGKILL, "", f"{TIMEOUT_MARKER} {timeout:.0f}s (backend did not return).")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+# --------------------------------------------------------------------------- #
+# Selection
+# --------------------------------------------------------------------------- #
+
+BACKENDS = {"e2b": E2BBackend, "local": LocalBackend}
+_backends: Dict[str, ExecutorBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: Optional[str] = None) -> ExecutorBackend:
+    """Process-wide backend by name (empty means ``EXECUTOR_BACKEND``)."""
+    name = (name or EXECUTOR_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown executor backend {name!r}; expected one of {sorted(BACKENDS)}.")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+def resolve_backend(configurable: dict) -> ExecutorBackend:
+    """The run's backend: an instance or name in ``configurable["executor_backend"]``, else the default."""
+    chosen = configurable.get("executor_backend")
+    if isinstance(chosen, ExecutorBackend):
+        return chosen
+    return get_backend(chosen)
+
+
+def discard_session(session: str, api_key: Optional[str] = None) -> None:
+    """Free what every backend still holds for ``session``.
+
+    E2B sandboxes parked by other worker processes are found through the pool's
+    shared session registry, so the E2B backend is always asked.
+    """
+    get_backend("e2b")
+    with _backends_lock:
+        backends = list(_backends.values())
+    for backend in backends:
+        try:
+            backend.discard(session, api_key=api_key)
+        except Exception:
+            logger.warning("Executor backend %s failed to discard session %s", backend.name, session, exc_info=True)
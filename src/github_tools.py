@@ -4,6 +4,7 @@ import tempfile
 import shutil
 from github import Github, GithubIntegration, Auth
 from typing import Dict, Any, List, Optional
+from src.suite_discovery import is_test_path
 
 class GitHubConnector:
     def __init__(self, repo_name: str = None, *, github_client: "Github" = None):
@@ -88,8 +89,23 @@ class GitHubConnector:
         except Exception as e:
             # Fallback if the API rejects the file-level comment
             print(f"Inline comment failed for {file_path}, falling back to PR thread: {e}")
-            fallback_body = f"**[Inline notice for `{file_path}`]**\n\n{body}"
-            return self.post_pr_comment(pr_number, fallback_body)
+            return self.post_pr_comment(pr_number, self._inline_fallback_body(file_path, body))
+
+    def edit_inline_pr_comment(self, pr_number: int, comment_id: int, file_path: str, body: str) -> None:
+        """
+        Edits a comment previously returned by :meth:`post_inline_pr_comment` in place.
+        The id may belong to a review comment or to the PR-thread fallback, so both are tried;
+        the fallback keeps its file header.
+        """
+        try:
+            self.repo.get_pull(pr_number).get_review_comment(comment_id).edit(body)
+        except Exception:
+            self.repo.get_issue(pr_number).get_comment(comment_id).edit(self._inline_fallback_body(file_path, body))
+
+    @staticmethod
+    def _inline_fallback_body(file_path: str, body: str) -> str:
+        return f"**[Inline notice for `{file_path}`]**\n\n{body}"
+
     def get_latest_commit_sha(self, pr_number: int) -> str:
         """Return the head SHA of a PR, used to guard against stale executions (PRD §4.3)."""
         return self.repo.get_pull(pr_number).head.sha
@@ -165,6 +181,16 @@ class GitHubConnector:
             print(f"   Search failed for {filename_ending}: {e}")
             return None
 
+    def list_test_files(self, branch: str = None) -> List[str]:
+        """
+        Lists every pytest-style test file (test_*.py / *_test.py) on a branch
+        with a single recursive tree call, without downloading any content.
+        """
+        ref = branch if branch else self.repo.default_branch
+        sha = self.repo.get_branch(ref).commit.sha
+        tree = self.repo.get_git_tree(sha, recursive=True)
+        return [element.path for element in tree.tree if element.type == "blob" and is_test_path(element.path)]
+
     def get_repo_map(self, pr_files: List[dict], branch: str) -> Dict[str, str]:
         """
         Builds a dictionary of {filepath: content} for the sandbox.
@@ -0,0 +1,332 @@
+"""Per-key request and token rate governor for BYOK LLM calls.
+
+Free-tier Gemini and Groq keys allow only a handful of requests (and a fixed
+token budget) per minute, and a PR fan-out starts several file reviews at
+once. Instead of letting the provider answer with 429 — which used to pause
+the whole PR — every call first reserves room in a sliding 60-second window
+shared by all workers using the same key, and waits its turn when the window
+is full.
+
+Limits come from the tenant's configuration when set. When a 429 still slips
+through, the governor honours ``Retry-After`` (or backs off exponentially),
+lowers the learned limit to what the window actually held, and retries the
+call. Learned limits expire after ``GOVERNOR_LEARN_TTL`` seconds so a key that
+was upgraded is probed again.
+
+Windows live in Redis (:class:`RedisBackend`) so the budget is shared across
+worker processes; :class:`MemoryBackend` is the single-process equivalent.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 60
+# Longest a call waits in the queue before it is sent anyway.
+MAX_WAIT_SECONDS = float(os.environ.get("GOVERNOR_MAX_WAIT", "120"))
+# 429 retries per call before the error is surfaced.
+MAX_RETRIES = int(os.environ.get("GOVERNOR_MAX_RETRIES", "4"))
+LEARN_TTL_SECONDS = int(os.environ.get("GOVERNOR_LEARN_TTL", "3600"))
+# Token reservation for a call whose size is not known yet.
+DEFAULT_CALL_TOKENS = int(os.environ.get("GOVERNOR_DEFAULT_CALL_TOKENS", "2000"))
+
+_RATE_LIMIT_SIGNALS = ("429", "rate limit", "rate-limit", "resource exhausted", "resource_exhausted", "too many requests")
+
+
+def is_rate_limit(exc: BaseException) -> bool:
+    if getattr(exc, "status_code", None) == 429 or getattr(exc, "code", None) == 429:
+        return True
+    text = str(exc).lower()
+    return any(signal in text for signal in _RATE_LIMIT_SIGNALS)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait, from headers or the error text."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            return float(value)
+    except (TypeError, ValueError):
+        pass
+    # Gemini: "Please retry in 23.5s." / "retry_delay { seconds: 23 }"
+    match = re.search(r"retry in ([\d.]+)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)", str(exc), re.IGNORECASE)
+    if match:
+        return float(match.group(1) or match.group(2))
+    return None
+
+
+# --------------------------------------------------------------------------- #
+# Backends
+# --------------------------------------------------------------------------- #
+
+class MemoryBackend:
+    """Sliding windows held in this process only."""
+
+    def __init__(self):
+        self._requests: Dict[str, Dict[str, float]] = {}
+        self._tokens: Dict[str, Dict[str, Tuple[float, int]]] = {}
+        self._blocked: Dict[str, float] = {}
+        self._learned: Dict[str, Dict[str, Tuple[int, float]]] = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, key: str, now: float) -> None:
+        horizon = now - WINDOW_SECONDS
+        self._requests[key] = {m: t for m, t in self._requests.get(key, {}).items() if t > horizon}
+        self._tokens[key] = {m: v for m, v in self._tokens.get(key, {}).items() if v[0] > horizon}
+
+    def reserve(self, key: str, now: float, rpm: int, tpm: int, tokens: int, member: str) -> float:
+        with self._lock:
+            blocked = self._blocked.get(key, 0.0)
+            if blocked > now:
+                return blocked - now
+            self._purge(key, now)
+            requests, spent = self._requests[key], self._tokens[key]
+            if rpm and len(requests) >= rpm:
+                return min(requests.values()) + WINDOW_SECONDS - now
+            used = sum(count for _, count in spent.values())
+            if tpm and used and used + tokens > tpm:
+                return min(t for t, _ in spent.values()) + WINDOW_SECONDS - now
+            requests[member] = now
+            spent[member] = (now, tokens)
+            return 0.0
+
+    def settle(self, key: str, member: str, tokens: int) -> None:
+        with self._lock:
+            entry = self._tokens.get(key, {}).get(member)
+            if entry:
+                self._tokens[key][member] = (entry[0], tokens)
+
+    def usage(self, key: str, now: float) -> Tuple[int, int]:
+        with self._lock:
+            self._purge(key, now)
+            return len(self._requests[key]), sum(count for _, count in self._tokens[key].values())
+
+    def block(self, key: str, until: float) -> None:
+        with self._lock:
+            self._blocked[key] = max(self._blocked.get(key, 0.0), until)
+
+    def learn(self, key: str, field: str, value: int, now: float) -> None:
+        with self._lock:
+            self._learned.setdefault(key, {})[field] = (value, now + LEARN_TTL_SECONDS)
+
+    def learned(self, key: str, now: float) -> Dict[str, int]:
+        with self._lock:
+            return {f: v for f, (v, expires) in self._learned.get(key, {}).items() if expires > now}
+
+
+# Atomic check-and-reserve. Returns "0" when granted, else seconds to wait.
+_RESERVE_LUA = """
+local req, tok, blk = KEYS[1], KEYS[2], KEYS[3]
+local now, rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens, member, window = tonumber(ARGV[4]), ARGV[5], tonumber(ARGV[6])
+local blocked = tonumber(redis.call('GET', blk) or '0')
+if blocked > now then return tostring(blocked - now) end
+redis.call('ZREMRANGEBYSCORE', req, '-inf', now - window)
+redis.call('ZREMRANGEBYSCORE', tok, '-inf', now - window)
+if rpm > 0 and redis.call('ZCARD', req) >= rpm then
+  local oldest = redis.call('ZRANGE', req, 0, 0, 'WITHSCORES')
+  return tostring(tonumber(oldest[2]) + window - now)
+end
+if tpm > 0 then
+  local entries = redis.call('ZRANGE', tok, 0, -1, 'WITHSCORES')
+  local used = 0
+  for i = 1, #entries, 2 do
+    used = used + tonumber(string.match(entries[i], ':(%d+)$'))
+  end
+  if used > 0 and used + tokens > tpm then
+    return tostring(tonumber(entries[2]) + window - now)
+  end
+end
+redis.call('ZADD', req, now, member)
+redis.call('ZADD', tok, now, member .. ':' .. tokens)
+redis.call('EXPIRE', req, window * 2)
+redis.call('EXPIRE', tok, window * 2)
+return '0'
+"""
+
+
+class RedisBackend:
+    """Sliding windows in Redis, shared by every worker using the same key."""
+
+    PREFIX = "reporover:governor"
+
+    def __init__(self, client):
+        self.client = client
+        self._reserve = client.register_script(_RESERVE_LUA)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis
+
+        options = {"ssl_cert_reqs": None} if url.startswith("rediss://") else {}
+        return cls(redis.Redis.from_url(url, decode_responses=True, **options))
+
+    def _keys(self, key: str) -> Tuple[str, str, str, str]:
+        # Hash tag keeps one key's windows in the same cluster slot for the Lua script.
+        base = f"{self.PREFIX}:{{{key}}}"
+        return f"{base}:req", f"{base}:tok", f"{base}:blocked", f"{base}:learned"
+
+    def reserve(self, key: str, now: float, rpm: int, tpm: int, tokens: int, member: str) -> float:
+        req, tok, blk, _ = self._keys(key)
+        return float(self._reserve(keys=[req, tok, blk], args=[now, rpm, tpm, tokens, member, WINDOW_SECONDS]))
+
+    def settle(self, key: str, member: str, tokens: int) -> None:
+        req, tok, _, _ = self._keys(key)
+        score = self.client.zscore(req, member)
+        if score is None:
+            return
+        stale = [m for m in self.client.zrangebyscore(tok, score, score) if m.rsplit(":", 1)[0] == member]
+        pipe = self.client.pipeline()
+        if stale:
+            pipe.zrem(tok, *stale)
+        pipe.zadd(tok, {f"{member}:{tokens}": score})
+        pipe.execute()
+
+    def usage(self, key: str, now: float) -> Tuple[int, int]:
+        req, tok, _, _ = self._keys(key)
+        horizon = now - WINDOW_SECONDS
+        requests = self.client.zcount(req, horizon, "+inf")
+        entries = self.client.zrangebyscore(tok, horizon, "+inf")
+        return requests, sum(int(m.rsplit(":", 1)[1]) for m in entries)
+
+    def block(self, key: str, until: float) -> None:
+        _, _, blk, _ = self._keys(key)
+        current = float(self.client.get(blk) or 0)
+        if until > current:
+            self.client.set(blk, until, ex=max(int(until - time.time()) + 1, 1))
+
+    def learn(self, key: str, field: str, value: int, now: float) -> None:
+        _, _, _, learned = self._keys(key)
+        pipe = self.client.pipeline()
+        pipe.hset(learned, field, value)
+        pipe.expire(learned, LEARN_TTL_SECONDS)
+        pipe.execute()
+
+    def learned(self, key: str, now: float) -> Dict[str, int]:
+        _, _, _, learned = self._keys(key)
+        return {field: int(value) for field, value in self.client.hgetall(learned).items()}
+
+
+# --------------------------------------------------------------------------- #
+# Governor
+# --------------------------------------------------------------------------- #
+
+def _tokens_of(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return int(usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+    return None
+
+
+class RateGovernor:
+    """Queues calls made with one BYOK key so they stay inside its RPM/TPM budget."""
+
+    def __init__(self, backend, fingerprint: str, rpm: int = 0, tpm: int = 0,
+                 clock=time.time, sleep=time.sleep):
+        self.backend = backend
+        self.fingerprint = fingerprint
+        self.rpm = rpm
+        self.tpm = tpm
+        self._clock = clock
+        self._sleep = sleep
+
+    def limits(self) -> Tuple[int, int]:
+        """Effective (rpm, tpm): the tighter of configured and learned; 0 means unlimited."""
+        learned = self._safe(self.backend.learned, self.fingerprint, self._clock(), default={})
+
+        def tighter(configured: int, learnt: Optional[int]) -> int:
+            return min(v for v in (configured, learnt) if v) if (configured or learnt) else 0
+        return tighter(self.rpm, learned.get("rpm")), tighter(self.tpm, learned.get("tpm"))
+
+    def _safe(self, fn, *args, default=None):
+        # The governor protects the provider; it must never take a review down with it.
+        try:
+            return fn(*args)
+        except Exception:
+            logger.exception("Rate governor backend unavailable; letting the call through.")
+            return default
+
+    def _try_reserve(self, tokens: int, member: str) -> float:
+        # Reserved even without limits: the window is what a 429 learns from.
+        rpm, tpm = self.limits()
+        wait = self._safe(self.backend.reserve, self.fingerprint, self._clock(), rpm, tpm, tokens, member, default=0.0)
+        return max(wait, 0.0)
+
+    def _wait_plan(self, tokens: int, member: str, waited: float) -> Optional[float]:
+        """Seconds to sleep before retrying the reservation, or None once the call may go."""
+        wait = self._try_reserve(tokens, member)
+        if wait <= 0:
+            return None
+        if waited + wait > MAX_WAIT_SECONDS:
+            logger.warning("Rate governor queue exceeded %ss for %s; sending anyway.", MAX_WAIT_SECONDS, self.fingerprint)
+            return None
+        return wait + random.uniform(0, 0.25)
+
+    def _throttled(self, exc: BaseException, attempt: int) -> float:
+        """Record a 429: block the key, learn a tighter limit, and return the backoff."""
+        delay = retry_after(exc) or min(2 ** attempt, WINDOW_SECONDS) + random.uniform(0, 1)
+        now = self._clock()
+        self._safe(self.backend.block, self.fingerprint, now + delay)
+
+        requests, tokens = self._safe(self.backend.usage, self.fingerprint, now, default=(0, 0))
+        rpm, tpm = self.limits()
+        if "token" in str(exc).lower() and tokens:
+            learnt = max(int(tokens * 0.9), 1)
+            if not tpm or learnt < tpm:
+                self._safe(self.backend.learn, self.fingerprint, "tpm", learnt, now)
+        elif requests:
+            learnt = max(int(requests * 0.9), 1)
+            if not rpm or learnt < rpm:
+                self._safe(self.backend.learn, self.fingerprint, "rpm", learnt, now)
+        logger.warning("Rate limited on %s; retrying in %.1fs (attempt %d).", self.fingerprint, delay, attempt + 1)
+        return delay
+
+    def _settle(self, member: str, result: Any) -> None:
+        tokens = _tokens_of(result)
+        if tokens is not None:
+            self._safe(self.backend.settle, self.fingerprint, member, tokens)
+
+    def call(self, fn: Callable[[], Any], tokens: int = DEFAULT_CALL_TOKENS) -> Any:
+        """Run ``fn`` once the key has room, retrying it on 429."""
+        for attempt in range(MAX_RETRIES + 1):
+            member, waited = uuid.uuid4().hex, 0.0
+            while (wait := self._wait_plan(tokens, member, waited)) is not None:
+                self._sleep(wait)
+                waited += wait
+            try:
+                result = fn()
+            except Exception as exc:
+                if not is_rate_limit(exc) or attempt == MAX_RETRIES:
+                    raise
+                self._sleep(self._throttled(exc, attempt))
+                continue
+            self._settle(member, result)
+            return result
+
+    async def acall(self, fn: Callable[[], Any], tokens: int = DEFAULT_CALL_TOKENS) -> Any:
+        """Async twin of :meth:`call`; ``fn`` returns an awaitable and backend I/O runs off the loop."""
+        for attempt in range(MAX_RETRIES + 1):
+            member, waited = uuid.uuid4().hex, 0.0
+            while (wait := await asyncio.to_thread(self._wait_plan, tokens, member, waited)) is not None:
+                await asyncio.sleep(wait)
+                waited += wait
+            try:
+                result = await fn()
+            except Exception as exc:
+                if not is_rate_limit(exc) or attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(await asyncio.to_thread(self._throttled, exc, attempt))
+                continue
+            await asyncio.to_thread(self._settle, member, result)
+            return result
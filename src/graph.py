@@ -8,14 +8,99 @@ separate webhook invocations.
 """
 from __future__ import annotations
 
+import logging
 import os
 from typing import Literal
 
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
 
+from src import runtime
+from src.blobstore import MemoryBlobStore, PostgresBlobStore, offloading
+from src.retention import CheckpointStore, MemoryCheckpointStore, PostgresCheckpointStore
+from src.serde import CompressingSerializer, measuring, new_stats
 from src.state import AgentState
-from src.agents import call_agent_a, call_agent_b, call_executor, call_agent_c, call_agent_t, call_agent_d_diplomat
+from src.agents import (
+    call_agent_a, acall_agent_a,
+    call_agent_b, acall_agent_b,
+    call_executor, acall_executor,
+    call_agent_c, acall_agent_c,
+    call_agent_c_draft, acall_agent_c_draft,
+    call_agent_t, acall_agent_t,
+    call_agent_d_diplomat, acall_agent_d_diplomat,
+    call_test_discovery, acall_test_discovery,
+    call_preflight, acall_preflight,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# --- Node runnables ----------------------------------------------------------
+# Each node carries a sync and an async implementation: ``app.stream`` runs the
+# former, ``app.astream`` / ``app.ainvoke`` the latter, over the same graph.
+def _node(func, afunc, name: str) -> RunnableLambda:
+    return RunnableLambda(func, afunc=afunc, name=name)
+
+
+reviewer = _node(call_agent_a, acall_agent_a, "reviewer_node")
+refactorer = _node(call_agent_b, acall_agent_b, "refactorer_node")
+test_engineer = _node(call_agent_t, acall_agent_t, "test_engineer_node")
+executor = _node(call_executor, acall_executor, "executor_tool_node")
+documenter = _node(call_agent_c, acall_agent_c, "documenter_node")
+documenter_draft = _node(call_agent_c_draft, acall_agent_c_draft, "documenter_draft_node")
+diplomat = _node(call_agent_d_diplomat, acall_agent_d_diplomat, "diplomat_node")
+test_discovery = _node(call_test_discovery, acall_test_discovery, "test_discovery_node")
+preflight = _node(call_preflight, acall_preflight, "preflight_node")
+
+
+# --- No-op fast path -----------------------------------------------------------
+def refactor_unchanged(state: AgentState) -> bool:
+    """True when the proposed code is identical to what is already on the branch."""
+    original = state.get("original_code") or ""
+    proposed = state.get("refactored_code") or original
+    return proposed.strip() == original.strip()
+
+
+def is_noop(state: AgentState) -> bool:
+    """True for a review that ended without proposing anything to run or commit."""
+    return not state.get("review_issues") or refactor_unchanged(state)
+
+
+def route_after_review(state: AgentState) -> Literal["refactorer_node", "__end__"]:
+    # A clean review has nothing to refactor, test or execute.
+    if not state.get("review_issues"):
+        print("--- Clean review. Skipping refactor, tests and sandbox. ---")
+        return END
+    return "refactorer_node"
+
+
+def route_after_refactor(state: AgentState) -> Literal["test_engineer_node", "__end__"]:
+    # An unchanged file needs no new tests and no sandbox run.
+    if refactor_unchanged(state):
+        print("--- Refactor made no changes. Skipping tests and sandbox. ---")
+        return END
+    return "test_engineer_node"
+
+
+# --- Conditional routing after the pre-flight checks ---
+def route_after_preflight(state: AgentState) -> Literal["executor_tool_node", "refactorer_node", "test_engineer_node", "__end__"]:
+    next_node = state.get("next_node", "executor_tool_node")
+    if next_node == "executor_tool_node":
+        return next_node
+    # A failed pre-flight counts against the same retry ceiling as a failed sandbox run.
+    count = state.get("iteration_count", 0)
+    if count >= 3:
+        print(f"--- MAX RETRIES REACHED ({count}). Terminating. ---")
+        return END
+    print(f"--- PRE-FLIGHT FAILED (Attempt {count}). Routing back to {next_node}... ---")
+    return next_node
+
+
+def _with_draft(state: AgentState):
+    # Agent C drafts the docs in the same step as the sandbox run.
+    route = route_after_preflight(state)
+    return [route, "documenter_draft_node"] if route == "executor_tool_node" else route
 
 
 # --- Conditional routing after the executor (self-healing loop) ---
@@ -27,12 +112,17 @@ def route_after_executor(state: AgentState) -> Literal["documenter_node", "refac
     if status == "SUCCESS":
         return "documenter_node"
 
-    # 2. USER SKIP -> Document the changes anyway
+    # 2. CANCELLED -> A newer commit superseded the review; nothing to report
+    if status == "CANCELLED":
+        print("--- Run cancelled (superseded). Terminating. ---")
+        return END
+
+    # 3. USER SKIP -> Document the changes anyway
     if status == "SKIPPED_TO_DOCS":
         print("--- User skipped execution. Generating docs... ---")
         return "documenter_node"
 
-    # 3. FAILURE -> Retry loop, strict ceiling of 3 iterations (PRD §3.5)
+    # 4. FAILURE -> Retry loop, strict ceiling of 3 iterations (PRD §3.5)
     if status == "FAILURE":
         if count >= 3:
             print(f"--- MAX RETRIES REACHED ({count}). Terminating. ---")
@@ -44,7 +134,7 @@ def route_after_executor(state: AgentState) -> Literal["documenter_node", "refac
         print(f"--- FAILED (Attempt {count}). Routing back to {next_node}... ---")
         return next_node
 
-    # 4. MAX RETRIES or terminal end
+    # 5. MAX RETRIES or terminal end
     print("Process Ended.")
     return END
 
@@ -54,17 +144,41 @@ def build_workflow() -> StateGraph:
     workflow = StateGraph(AgentState)
 
     # 1. Add all nodes
-    workflow.add_node("reviewer_node", call_agent_a)
-    workflow.add_node("refactorer_node", call_agent_b)
-    workflow.add_node("test_engineer_node", call_agent_t)
-    workflow.add_node("executor_tool_node", call_executor)
-    workflow.add_node("documenter_node", call_agent_c)
-
-    # 2. Define the Standard Linear Flow
+    workflow.add_node("reviewer_node", reviewer)
+    workflow.add_node("refactorer_node", refactorer)
+    workflow.add_node("test_engineer_node", test_engineer)
+    workflow.add_node("preflight_node", preflight)
+    workflow.add_node("executor_tool_node", executor)
+    workflow.add_node("documenter_node", documenter)
+    workflow.add_node("documenter_draft_node", documenter_draft)
+    workflow.add_node("test_discovery_node", test_discovery)
+
+    # 2. Define the Standard Flow, short-circuiting files with nothing to change.
+    # Test discovery does not depend on the review, so it runs in the same step
+    # as Agent A; the step boundary is the join, so its results are in state
+    # before the refactorer (and later the test engineer) runs.
     workflow.add_edge(START, "reviewer_node")
-    workflow.add_edge("reviewer_node", "refactorer_node")
-    workflow.add_edge("refactorer_node", "test_engineer_node")
-    workflow.add_edge("test_engineer_node", "executor_tool_node")
+    workflow.add_edge(START, "test_discovery_node")
+    workflow.add_edge("test_discovery_node", END)
+    workflow.add_conditional_edges(
+        "reviewer_node",
+        route_after_review,
+        {"refactorer_node": "refactorer_node", END: END},
+    )
+    workflow.add_conditional_edges(
+        "refactorer_node",
+        route_after_refactor,
+        {"test_engineer_node": "test_engineer_node", END: END},
+    )
+    # Static checks first: a broken file or test goes straight back to its agent.
+    # The docs only need the original and refactored code, so Agent C drafts
+    # them in the same step as the sandbox run instead of after it.
+    workflow.add_edge("test_engineer_node", "preflight_node")
+    workflow.add_conditional_edges(
+        "preflight_node",
+        _with_draft,
+        ["executor_tool_node", "documenter_draft_node", "refactorer_node", "test_engineer_node", END],
+    )
 
     # 3. Define the Self-Healing Routing (After the Sandbox)
     workflow.add_conditional_edges(
@@ -79,6 +193,7 @@ def build_workflow() -> StateGraph:
     )
     
     workflow.add_edge("documenter_node", END)
+    workflow.add_edge("documenter_draft_node", END)
 
     return workflow
 
@@ -88,13 +203,27 @@ def build_conflict_workflow() -> StateGraph:
     """A dedicated graph exclusively for resolving merge conflicts."""
     workflow = StateGraph(AgentState)
 
-    workflow.add_node("diplomat_node", call_agent_d_diplomat)
-    workflow.add_node("test_engineer_node", call_agent_t)
-    workflow.add_node("executor_tool_node", call_executor)
+    workflow.add_node("diplomat_node", diplomat)
+    workflow.add_node("test_engineer_node", test_engineer)
+    workflow.add_node("preflight_node", preflight)
+    workflow.add_node("executor_tool_node", executor)
+    workflow.add_node("test_discovery_node", test_discovery)
 
     workflow.add_edge(START, "diplomat_node")
+    workflow.add_edge(START, "test_discovery_node")
+    workflow.add_edge("test_discovery_node", END)
     workflow.add_edge("diplomat_node", "test_engineer_node")
-    workflow.add_edge("test_engineer_node", "executor_tool_node")
+    workflow.add_edge("test_engineer_node", "preflight_node")
+    workflow.add_conditional_edges(
+        "preflight_node",
+        route_after_preflight,
+        {
+            "executor_tool_node": "executor_tool_node",
+            "refactorer_node": "diplomat_node",
+            "test_engineer_node": "test_engineer_node",
+            END: END,
+        }
+    )
 
     workflow.add_conditional_edges(
         "executor_tool_node", 
@@ -115,6 +244,7 @@ def compile_app(checkpointer, workflow_builder=build_workflow):
 
     The graph always pauses *before* sandbox execution so the orchestration layer
     can post results to the PR and wait for a slash command (PRD §3.5, §3.6).
+    Commands resume that paused step with :func:`resume_with`.
     """
     return workflow_builder().compile(
         checkpointer=checkpointer,
@@ -135,14 +265,11 @@ def compile_app(checkpointer, workflow_builder=build_workflow):
 _app_singleton = None
 _conflict_app_singleton = None
 _pg_pool = None
+_async_saver = None
+_serializers: list = []  # every checkpoint serializer built in this process (for timings)
 
 
-def _postgres_checkpointer():
-    """Build (once) a PostgresSaver backed by a connection pool and run setup()."""
-    global _pg_pool
-    from langgraph.checkpoint.postgres import PostgresSaver
-    from psycopg_pool import ConnectionPool
-
+def _postgres_dsn() -> str:
     dsn = os.environ.get("POSTGRES_DSN")
     if not dsn:
         # Fall back to Django settings when running inside the app context.
@@ -151,27 +278,131 @@ def _postgres_checkpointer():
             dsn = settings.POSTGRES_DSN
         except Exception as exc:  # pragma: no cover - misconfiguration guard
             raise RuntimeError("POSTGRES_DSN is not configured for the checkpointer.") from exc
+    return dsn
+
+
+def _sync_pool():
+    """The process-wide synchronous Postgres pool (checkpointer and state blobs)."""
+    global _pg_pool
+    from psycopg_pool import ConnectionPool
 
     if _pg_pool is None:
         _pg_pool = ConnectionPool(
-            conninfo=dsn,
+            conninfo=_postgres_dsn(),
             max_size=int(os.environ.get("CHECKPOINTER_POOL_SIZE", "10")),
             kwargs={"autocommit": True, "prepare_threshold": 0},
         )
-    saver = PostgresSaver(_pg_pool)
+    return _pg_pool
+
+
+def _compressed(inner) -> CompressingSerializer:
+    serde = CompressingSerializer(inner)
+    _serializers.append(serde)
+    return serde
+
+
+def checkpoint_serde_stats() -> dict:
+    """Serialize/deserialize counts, bytes and timings of this process's checkpointers."""
+    totals: dict = {}
+    for serde in _serializers:
+        for key, value in serde.stats().items():
+            if key.endswith("_avg_ms") or key == "ratio":
+                continue
+            totals[key] = value if isinstance(value, str) else totals.get(key, 0) + value
+    for op in ("dumps", "loads"):
+        calls = totals.get(op)
+        totals[f"{op}_avg_ms"] = round(totals[f"{op}_seconds"] * 1000 / calls, 3) if calls else None
+    raw = totals.get("raw_bytes")
+    totals["ratio"] = round(totals["stored_bytes"] / raw, 3) if raw else None
+    return totals
+
+
+def _postgres_serde():
+    """Checkpoint serializer: large strings in the blob table, the rest compressed msgpack."""
+    store = PostgresBlobStore(_sync_pool())
+    store.setup()  # idempotent
+    return _compressed(offloading(store=store))
+
+
+def _postgres_checkpointer():
+    """Build (once) a PostgresSaver backed by a connection pool and run setup()."""
+    from src.checkpointers import OffloadingPostgresSaver
+
+    saver = OffloadingPostgresSaver(_sync_pool(), serde=_postgres_serde())
     saver.setup()  # idempotent: creates checkpoint tables if absent
     return saver
 
 
+def _async_postgres_checkpointer():
+    """Build (once) an AsyncPostgresSaver bound to the shared runtime loop.
+
+    Binding to :func:`src.runtime.get_loop` lets task threads keep calling the
+    saver's synchronous wrappers (``get_state`` / ``update_state``) while graph
+    steps run as coroutines on the loop.
+    """
+    global _async_saver
+    if _async_saver is None:
+        from psycopg_pool import AsyncConnectionPool
+        from src.checkpointers import OffloadingAsyncPostgresSaver
+
+        # Blob reads/writes are keyed lookups on the synchronous pool, made off the loop.
+        serde = _postgres_serde()
+
+        async def _build():
+            pool = AsyncConnectionPool(
+                conninfo=_postgres_dsn(),
+                max_size=int(os.environ.get("CHECKPOINTER_POOL_SIZE", "10")),
+                kwargs={"autocommit": True, "prepare_threshold": 0},
+                open=False,
+            )
+            await pool.open()
+            saver = OffloadingAsyncPostgresSaver(pool, serde=serde)
+            await saver.setup()
+            return saver
+
+        _async_saver = runtime.run(_build())
+    return _async_saver
+
+
+def resume_with(app, config, values: dict) -> None:
+    """Record a human decision on a graph paused before the sandbox.
+
+    The update is applied as ``preflight_node`` (the step that paused), so
+    the pending sandbox step still runs on resume and ``executor_tool_node``
+    reads the decision from ``execution_status``.
+    """
+    app.update_state(config, values, as_node="preflight_node")
+
+
+def _checkpointer():
+    backend = os.environ.get("CHECKPOINTER", "postgres").lower()
+    if backend == "memory":
+        return _memory_checkpointer()
+    if runtime.async_enabled():
+        return _async_postgres_checkpointer()
+    return _postgres_checkpointer()
+
+
+def checkpoint_store() -> CheckpointStore:
+    """Retention handle over the configured checkpointer's stored threads."""
+    if os.environ.get("CHECKPOINTER", "postgres").lower() == "memory":
+        apps = (_app_singleton, _conflict_app_singleton)
+        return MemoryCheckpointStore(app.checkpointer for app in apps if app is not None)
+    return PostgresCheckpointStore(_sync_pool(), blobs=PostgresBlobStore(_sync_pool()))
+
+
+def state_blob_store():
+    """The store the configured checkpointer offloads large state strings to."""
+    if os.environ.get("CHECKPOINTER", "postgres").lower() == "memory":
+        return _memory_blobs
+    return PostgresBlobStore(_sync_pool())
+
+
 def get_app():
     """Return the process-wide compiled standard graph (lazy singleton)."""
     global _app_singleton
     if _app_singleton is None:
-        backend = os.environ.get("CHECKPOINTER", "postgres").lower()
-        if backend == "memory":
-            _app_singleton = compile_app(MemorySaver(), build_workflow)
-        else:
-            _app_singleton = compile_app(_postgres_checkpointer(), build_workflow)
+        _app_singleton = compile_app(_checkpointer(), build_workflow)
     return _app_singleton
 
 
@@ -179,14 +410,42 @@ def get_conflict_app():
     """Return the process-wide compiled conflict resolution graph (lazy singleton)."""
     global _conflict_app_singleton
     if _conflict_app_singleton is None:
-        backend = os.environ.get("CHECKPOINTER", "postgres").lower()
-        if backend == "memory":
-            _conflict_app_singleton = compile_app(MemorySaver(), build_conflict_workflow)
-        else:
-            _conflict_app_singleton = compile_app(_postgres_checkpointer(), build_conflict_workflow)
+        _conflict_app_singleton = compile_app(_checkpointer(), build_conflict_workflow)
     return _conflict_app_singleton
 
 
+def run_graph(app, graph_input, config) -> dict:
+    """Drive ``app`` until it finishes or pauses; returns the run's checkpoint serde counters.
+
+    With ``GRAPH_EXECUTION=async`` the run is an ``astream`` scheduled on the
+    shared runtime loop, so the calling worker thread holds no I/O of its own.
+    """
+    serde = new_stats()
+    if runtime.async_enabled():
+        async def _drain():
+            # Set on the loop's side: the coroutine does not run in the caller's context.
+            with measuring(serde):
+                async for _ in app.astream(graph_input, config=config):
+                    pass
+
+        runtime.run(_drain())
+    else:
+        with measuring(serde):
+            for _ in app.stream(graph_input, config=config):
+                pass
+    logger.debug("Checkpoint serde: %s", checkpoint_serde_stats())
+    return serde
+
+
+_memory_blobs = MemoryBlobStore()
+
+
+def _memory_checkpointer():
+    # Large strings are held once per process even in memory (shared across sessions);
+    # sweep_checkpoints prunes the ones no checkpoint has touched within retention.
+    return MemorySaver(serde=_compressed(offloading(store=_memory_blobs)))
+
+
 def build_local_app():
     """Compile a fresh standard graph with an in-memory checkpointer (CLI smoke test)."""
-    return compile_app(MemorySaver(), build_workflow)
\ No newline at end of file
+    return compile_app(_memory_checkpointer(), build_workflow)
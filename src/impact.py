@@ -0,0 +1,254 @@
+"""Test impact selection for the executor.
+
+Instead of running the whole test file on every approve/retry, the executor
+runs only the tests that can observe the change:
+
+1. :func:`changed_symbols` diffs the ASTs of ``original_code`` and
+   ``refactored_code`` and returns the functions, methods and classes whose
+   definition changed (or were added or removed). A change to module-level
+   code (imports, constants) cannot be localized, so it returns None and the
+   run falls back to the full suite.
+2. The module's call graph widens that set to every definition that calls a
+   changed one, transitively.
+3. :func:`referenced_names` maps each test id to the names the test (its class
+   helpers and the fixtures it requests) touches, through imports and
+   attribute access. Test ids look like ``test_x.py::TestY::test_z``.
+4. Coverage contexts from earlier runs (:func:`coverage_map`) add the
+   symbols each test was seen executing.
+
+A test is selected when it references or covered an impacted symbol. When
+nothing is selected, or everything is, the full file runs. Because only part
+of the suite runs, the coverage gate is then applied to the changed lines
+(:func:`changed_lines_coverage`) instead of the whole module.
+"""
+from __future__ import annotations
+
+import ast
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+IMPACT_ENABLED = os.environ.get("TEST_IMPACT_ENABLED", "true").lower() == "true"
+
+# Written into the workspace so every run records which test executed which line.
+COVERAGE_RC = ".reporover/coveragerc"
+COVERAGE_RC_CONTENT = "[json]\nshow_contexts = True\n"
+COVERAGE_JSON = ".reporover/coverage.json"
+
+_DEFS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+@dataclass
+class Selection:
+    test_ids: List[str] = field(default_factory=list)  # empty means "run the whole file"
+    changed: Set[str] = field(default_factory=set)
+    reason: str = ""
+
+    @property
+    def full(self) -> bool:
+        return not self.test_ids
+
+
+def _definitions(tree: ast.Module) -> Dict[str, ast.AST]:
+    """Qualified name -> node for top-level defs and methods (``Class.method``)."""
+    found: Dict[str, ast.AST] = {}
+    for node in tree.body:
+        if isinstance(node, _DEFS):
+            found[node.name] = node
+            if isinstance(node, ast.ClassDef):
+                for item in node.body:
+                    if isinstance(item, _DEFS):
+                        found[f"{node.name}.{item.name}"] = item
+    return found
+
+
+def _dump(node: ast.AST) -> str:
+    return ast.dump(node, include_attributes=False)
+
+
+def _module_level(tree: ast.Module) -> List[str]:
+    return [_dump(node) for node in tree.body if not isinstance(node, _DEFS)]
+
+
+def _class_shell(node: ast.ClassDef) -> List[str]:
+    """Bases, decorators and class-level statements, without the methods."""
+    return ([_dump(base) for base in node.bases] + [_dump(d) for d in node.decorator_list]
+            + [_dump(item) for item in node.body if not isinstance(item, _DEFS)])
+
+
+def changed_symbols(original: str, refactored: str) -> Optional[Set[str]]:
+    """Definitions that differ between the two versions; None when module-level code changed."""
+    try:
+        before, after = ast.parse(original or ""), ast.parse(refactored or "")
+    except SyntaxError:
+        return None
+    if _module_level(before) != _module_level(after):
+        return None
+    old, new = _definitions(before), _definitions(after)
+    changed = set()
+    for name in set(old) | set(new):
+        if name not in old or name not in new:
+            changed.add(name)
+            continue
+        if isinstance(new[name], ast.ClassDef):
+            # Methods are compared on their own; the class changes only through its shell.
+            if _class_shell(old[name]) != _class_shell(new[name]):
+                changed.add(name)
+        elif _dump(old[name]) != _dump(new[name]):
+            changed.add(name)
+    return changed
+
+
+def _names(node: ast.AST) -> Set[str]:
+    found = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            found.add(child.id)
+        elif isinstance(child, ast.Attribute):
+            found.add(child.attr)
+        elif isinstance(child, ast.alias):
+            found.add((child.asname or child.name).split(".")[-1])
+    return found
+
+
+def impacted_symbols(source: str, changed: Set[str]) -> Set[str]:
+    """``changed`` plus every definition in ``source`` that (transitively) calls one of them."""
+    try:
+        definitions = _definitions(ast.parse(source or ""))
+    except SyntaxError:
+        return set(changed)
+    references = {name: _names(node) for name, node in definitions.items()}
+    impacted = set(changed)
+    frontier = set(changed)
+    while frontier:
+        short = {name.split(".")[-1] for name in frontier}
+        frontier = {
+            name for name, refs in references.items()
+            if name not in impacted and (refs & short)
+        }
+        impacted |= frontier
+    # A changed method makes its class relevant to tests that only name the class.
+    impacted |= {name.split(".")[0] for name in impacted}
+    return impacted
+
+
+def referenced_names(test_code: str, test_path: str) -> Dict[str, Set[str]]:
+    """Test id -> names the test touches, including class helpers and requested fixtures."""
+    try:
+        tree = ast.parse(test_code or "")
+    except SyntaxError:
+        return {}
+    fixtures = {
+        node.name: _names(node) for node in tree.body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not node.name.startswith("test")
+    }
+    def refs(func, extra: Set[str]) -> Set[str]:
+        names = _names(func) | extra
+        for arg in func.args.args:
+            names |= fixtures.get(arg.arg, set())
+        return names
+
+    tests: Dict[str, Set[str]] = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            tests[f"{test_path}::{node.name}"] = refs(node, set())
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            helpers = set()
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and not item.name.startswith("test"):
+                    helpers |= _names(item)
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith("test"):
+                    tests[f"{test_path}::{node.name}::{item.name}"] = refs(item, helpers)
+    return tests
+
+
+def _line_owners(source: str) -> List[Tuple[int, int, str]]:
+    """(start, end, qualified name) for every definition, innermost last."""
+    try:
+        definitions = _definitions(ast.parse(source or ""))
+    except SyntaxError:
+        return []
+    spans = [(node.lineno, node.end_lineno or node.lineno, name) for name, node in definitions.items()]
+    return sorted(spans, key=lambda span: (span[0], -span[1]))
+
+
+def changed_lines(source: str, changed: Iterable[str]) -> Set[int]:
+    """Body lines of the changed definitions (``def`` lines run at import, so they prove nothing)."""
+    try:
+        definitions = _definitions(ast.parse(source or ""))
+    except SyntaxError:
+        return set()
+    lines = set()
+    for name in set(changed) & set(definitions):
+        node = definitions[name]
+        lines.update(range(node.body[0].lineno, (node.end_lineno or node.lineno) + 1))
+    return lines
+
+
+def file_report(coverage_json: str, source_path: str) -> Optional[dict]:
+    """The entry for ``source_path`` in a coverage.py JSON report, if any."""
+    try:
+        report = json.loads(coverage_json or "{}")
+    except (TypeError, ValueError):
+        return None
+    return next((data for name, data in (report.get("files") or {}).items()
+                 if name.replace("\\", "/").endswith(source_path)), None)
+
+
+def coverage_map(coverage_json: str, source_path: str, source: str) -> Dict[str, List[str]]:
+    """Test id -> symbols of ``source_path`` it executed, from a coverage JSON report with contexts."""
+    data = file_report(coverage_json, source_path)
+    if not data or not data.get("contexts"):
+        return {}
+    owners = _line_owners(source)
+    mapping: Dict[str, Set[str]] = {}
+    for line, contexts in data["contexts"].items():
+        line = int(line)
+        symbols = [name for start, end, name in owners if start <= line <= end]
+        if not symbols:
+            continue
+        for context in contexts:
+            test_id = context.split("|")[0]
+            if test_id:
+                mapping.setdefault(test_id, set()).update(symbols)
+    return {test_id: sorted(symbols) for test_id, symbols in mapping.items()}
+
+
+def changed_lines_coverage(coverage_json: str, source_path: str, lines: Set[int]) -> Optional[float]:
+    """Percent of the changed, executable lines the run executed; None when unknown."""
+    data = file_report(coverage_json, source_path)
+    if data is None:
+        return None
+    executed = set(data.get("executed_lines") or []) & lines
+    missing = set(data.get("missing_lines") or []) & lines
+    if not executed and not missing:
+        return 100.0
+    return 100.0 * len(executed) / (len(executed) + len(missing))
+
+
+def select_tests(original: str, refactored: str, test_code: str, test_path: str,
+                 earlier_coverage: Optional[Dict[str, List[str]]] = None, full: bool = False) -> Selection:
+    """Pick the tests in ``test_code`` that can observe the original -> refactored change."""
+    if full or not IMPACT_ENABLED:
+        return Selection(reason="full suite requested")
+    changed = changed_symbols(original, refactored)
+    if changed is None:
+        return Selection(reason="module-level code changed")
+    if not changed:
+        return Selection(reason="no definition changed")
+
+    impacted = impacted_symbols(refactored, changed) | impacted_symbols(original, changed)
+    short = {name.split(".")[-1] for name in impacted}
+    tests = referenced_names(test_code, test_path)
+    selected = [
+        test_id for test_id, names in tests.items()
+        if names & short or set((earlier_coverage or {}).get(test_id, [])) & impacted
+    ]
+    if not selected:
+        return Selection(changed=changed, reason="no test references the change")
+    if len(selected) == len(tests):
+        return Selection(changed=changed, reason="every test is impacted")
+    return Selection(test_ids=selected, changed=changed,
+                     reason=f"{len(selected)}/{len(tests)} tests impacted by {', '.join(sorted(changed))}")
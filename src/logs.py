@@ -0,0 +1,154 @@
+"""Compact sandbox logs before they reach state, checkpoints and prompts.
+
+Raw executor output is mostly noise for the agents: pip progress and
+"Requirement already satisfied" lines, the same frame repeated by a
+recursion, the same traceback printed for every parametrized case.
+:func:`compact_log`:
+
+1. drops package-installer chatter,
+2. collapses runs of identical lines and repeated multi-line frame blocks,
+3. replaces a pytest failure section whose traceback was already shown with a
+   one-line back-reference,
+4. fits the result into a byte budget. When over budget it keeps the
+   assertion context (``>`` / ``E`` lines, ``file:line`` locations, error and
+   summary lines) and the tail, and marks the gaps.
+
+The full log is never put in state. When ``EXECUTION_FULL_LOG_DIR`` is set,
+:func:`archive_full_log` writes it there (gzipped, content-addressed) and the
+compact log points at the file.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import re
+from typing import List, Optional
+
+LOG_BUDGET_BYTES = int(os.environ.get("EXECUTION_LOG_BUDGET_BYTES", "8000"))
+FULL_LOG_DIR = os.environ.get("EXECUTION_FULL_LOG_DIR", "")
+
+_INSTALL_CHATTER = re.compile(
+    r"^\s*(Collecting |Downloading |Using cached |Requirement already satisfied|Installing collected packages"
+    r"|Successfully installed |Successfully built |Building wheels? |Created wheel |Stored in directory"
+    r"|Preparing metadata|Getting requirements to build|Installing build dependencies|Attempting uninstall"
+    r"|Found existing installation|Uninstalling |Looking in indexes|WARNING: Running pip as the 'root' user"
+    r"|\[notice\]|\S+ \d+(\.\d+)* is already installed)"
+    r"|^\s*[━╸─\-=#|█▏▎▍▌▋▊▉ ]+\s*[\d.]+\s*/\s*[\d.]+\s*[kMG]?B"
+)
+_SECTION = re.compile(r"^_{3,} (.+?) _{3,}$")
+_IMPORTANT = re.compile(
+    r"^(>|E\s)|^\S+\.py:\d+:|Error|Exception|FAILED|ERROR|FAIL Required|short test summary|"
+    r"\d+ (passed|failed|error)|Coverage failure|Required test coverage"
+)
+_TAIL_LINES = 15
+
+
+def _strip_install_chatter(lines: List[str]) -> List[str]:
+    return [line for line in lines if not _INSTALL_CHATTER.search(line)]
+
+
+def _collapse_repeats(lines: List[str], max_block: int = 4) -> List[str]:
+    """Collapse back-to-back repeats of a 1..max_block line block into one copy plus a count."""
+    out: List[str] = []
+    i = 0
+    while i < len(lines):
+        collapsed = False
+        for size in range(1, max_block + 1):
+            block = lines[i:i + size]
+            if len(block) < size or not any(line.strip() for line in block):
+                continue
+            repeats = 1
+            while lines[i + repeats * size:i + (repeats + 1) * size] == block:
+                repeats += 1
+            if repeats > 1:
+                out.extend(block)
+                out.append(f"[previous {size} line(s) repeated {repeats - 1} more times]")
+                i += repeats * size
+                collapsed = True
+                break
+        if not collapsed:
+            out.append(lines[i])
+            i += 1
+    return out
+
+
+def _dedupe_sections(lines: List[str]) -> List[str]:
+    """Replace a pytest ``____ test ____`` section identical to an earlier one with a reference."""
+    out: List[str] = []
+    seen = {}
+    i = 0
+    while i < len(lines):
+        header = _SECTION.match(lines[i])
+        if not header:
+            out.append(lines[i])
+            i += 1
+            continue
+        end = i + 1
+        while end < len(lines) and not _SECTION.match(lines[end]) and not lines[end].startswith("="):
+            end += 1
+        body = "\n".join(lines[i + 1:end])
+        if body.strip() and body in seen:
+            out.append(lines[i])
+            out.append(f"[same traceback as {seen[body]}]")
+        else:
+            seen.setdefault(body, header.group(1))
+            out.extend(lines[i:end])
+        i = end
+    return out
+
+
+def _size(lines: List[str]) -> int:
+    return sum(len(line.encode("utf-8")) + 1 for line in lines)
+
+
+def _fit(lines: List[str], budget: int) -> List[str]:
+    if _size(lines) <= budget:
+        return lines
+    keep = set(range(max(len(lines) - _TAIL_LINES, 0), len(lines)))
+    important = [i for i, line in enumerate(lines) if _IMPORTANT.search(line)]
+    # Most recent context first: the end of the log is where pytest summarises.
+    for index in reversed(important):
+        candidate = keep | {index - 1, index, index + 1} & set(range(len(lines)))
+        if _size([lines[i] for i in candidate]) + 200 > budget:
+            break
+        keep = candidate
+    out: List[str] = []
+    previous = -1
+    for index in sorted(keep):
+        if index > previous + 1:
+            out.append(f"... [{index - previous - 1} lines omitted] ...")
+        out.append(lines[index])
+        previous = index
+    if previous < len(lines) - 1:
+        out.append(f"... [{len(lines) - previous - 1} lines omitted] ...")
+    # Still too long (e.g. one huge line): hard-cut from the front.
+    while out and _size(out) > budget:
+        first = out.pop(0)
+        if len(first.encode("utf-8")) > budget:
+            out.insert(0, first[-(budget // 2):])
+            break
+    return out
+
+
+def compact_log(text: str, budget: int = LOG_BUDGET_BYTES) -> str:
+    """Strip noise from ``text`` and fit it into ``budget`` bytes."""
+    lines = (text or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    lines = _strip_install_chatter(lines)
+    lines = _collapse_repeats(lines)
+    lines = _dedupe_sections(lines)
+    return "\n".join(_fit(lines, budget)).strip("\n")
+
+
+def archive_full_log(text: str, directory: Optional[str] = None) -> Optional[str]:
+    """Write the raw log under ``directory`` (default ``EXECUTION_FULL_LOG_DIR``); None when disabled."""
+    directory = directory if directory is not None else FULL_LOG_DIR
+    if not directory or not text:
+        return None
+    data = text.encode("utf-8")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{hashlib.sha256(data).hexdigest()}.log.gz")
+    if not os.path.exists(path):
+        with gzip.open(path, "wb") as handle:
+            handle.write(data)
+    return path
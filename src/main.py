@@ -1,6 +1,7 @@
 import sys
-from src.graph import build_local_app
+from src.graph import build_local_app, resume_with
 from src.github_tools import GitHubConnector
+from src.suite_discovery import BranchTestSource
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -72,19 +73,6 @@ for i, target_file in enumerate(target_files):
         print("Skipping to next file...")
         continue
 
-    # --- NEW: Test Discovery ---
-    expected_test_name = f"test_{filename.split('/')[-1]}" # e.g., test_utils.py
-    alt_test_name = f"{filename.split('/')[-1].replace('.py', '')}_test.py" # e.g., utils_test.py
-    
-    existing_test_path = None
-    existing_test_code = None
-    
-    for filepath, content in repo_context_map.items():
-        if filepath.endswith(expected_test_name) or filepath.endswith(alt_test_name):
-            existing_test_path = filepath
-            existing_test_code = content
-            break
-
     # 2. Initialize State for THIS specific file
     initial_state = {
         "repo_path": REPO_NAME,
@@ -94,13 +82,14 @@ for i, target_file in enumerate(target_files):
         "repo_files": repo_context_map,
         "pr_description": f"Title: {pr_data['title']}\nDesc: {pr_data['description']}",
         "iteration_count": 0,
-        # --- NEW STATE VARIABLES ---
-        "existing_test_path": existing_test_path,
-        "existing_test_code": existing_test_code,
     }
 
     # 3. Unique Thread ID per file
-    config = {"configurable": {"thread_id": f"pr_{PR_NUMBER}_file_{i}"}}
+    # Test discovery runs as a graph branch alongside Agent A
+    config = {"configurable": {
+        "thread_id": f"pr_{PR_NUMBER}_file_{i}",
+        "test_source": BranchTestSource(gh, pr_data["head_branch"]),
+    }}
 
     print(f"\n--- Phase 1: Review & Refactor ({filename}) ---")
     
@@ -137,10 +126,11 @@ for i, target_file in enumerate(target_files):
         current_code = snapshot.values.get("refactored_code", "No code generated")
         
         # Smart Preview
-        preview_lines = current_code.split('\n')[:15]
+        all_lines = current_code.split('\n')
+        preview_lines = all_lines[:15]
         print('\n'.join(preview_lines))
-        if len(preview_lines) < len(current_code.split('\n')):
-            print(f"... ({len(current_code.split('\n')) - 15} lines hidden) ...")
+        if len(preview_lines) < len(all_lines):
+            print(f"... ({len(all_lines) - 15} lines hidden) ...")
         print("-------------------------------")
 
         # 2. Human Decision
@@ -180,10 +170,10 @@ for i, target_file in enumerate(target_files):
             
             if choice == "2":
                 print("Skipping execution. Proceeding to Agent C...")
-                app.update_state(
+                resume_with(
+                    app,
                     config,
                     {"execution_status": "SKIPPED_TO_DOCS", "execution_logs": "User skipped."},
-                    as_node="executor_tool_node"
                 )
                 for event in app.stream(None, config=config):
                      for key, value in event.items():
@@ -198,14 +188,13 @@ for i, target_file in enumerate(target_files):
                 feedback = input("   Reason for rejection: ")
                 print("Sending feedback to Agent B...")
                 
-                app.update_state(
+                resume_with(
+                    app,
                     config,
                     {
-                        "execution_status": "FAILURE", 
+                        "execution_status": "REJECTED",
                         "execution_logs": f"HUMAN REJECTION: {feedback}",
-                        "iteration_count": snapshot.values.get("iteration_count", 0)
                     },
-                    as_node="executor_tool_node" 
                 )
                 
                 print(f"--- Agent B is attempting to fix {filename}... ---")
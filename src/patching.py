@@ -0,0 +1,65 @@
+"""Anchored search/replace patches for Agent B's patch-output mode.
+
+On large modules Agent B returns only the edits it wants to make instead of
+the whole file. Each edit names a block of the *current* file verbatim and the
+text that replaces it. Edits are applied locally and strictly: an anchor must
+match exactly one location, and the patched file must still parse. Anything
+else raises :class:`PatchError` so the caller can fall back to full-file output.
+"""
+from __future__ import annotations
+
+import ast
+from typing import Iterable, Tuple
+
+
+class PatchError(ValueError):
+    """An edit could not be applied cleanly to the current file."""
+
+
+def _locate(source: str, search: str) -> Tuple[int, int]:
+    """Return the (start, end) span of the single location ``search`` anchors to."""
+    count = source.count(search)
+    if count == 1:
+        start = source.index(search)
+        return start, start + len(search)
+    if count > 1:
+        raise PatchError(f"Anchor is ambiguous ({count} matches): {search[:80]!r}")
+
+    # Models often drop trailing whitespace; retry line-by-line ignoring it.
+    lines = source.splitlines(keepends=True)
+    wanted = [line.rstrip() for line in search.splitlines()]
+    if not wanted:
+        raise PatchError("Empty anchor.")
+    hits = [
+        i for i in range(len(lines) - len(wanted) + 1)
+        if [line.rstrip() for line in lines[i:i + len(wanted)]] == wanted
+    ]
+    if len(hits) != 1:
+        raise PatchError(f"Anchor matched {len(hits)} locations: {search[:80]!r}")
+    start = sum(len(line) for line in lines[:hits[0]])
+    end = start + sum(len(line) for line in lines[hits[0]:hits[0] + len(wanted)])
+    # Keep the newline that terminated the last matched line.
+    if lines[hits[0] + len(wanted) - 1].endswith("\n") and not search.endswith("\n"):
+        end -= 1
+    return start, end
+
+
+def apply_edits(source: str, edits: Iterable[Tuple[str, str]]) -> str:
+    """Apply ``(search, replace)`` edits in order and return the validated result."""
+    patched = source
+    applied = 0
+    for search, replace in edits:
+        if not search:
+            raise PatchError("Edit has an empty search block.")
+        start, end = _locate(patched, search)
+        patched = patched[:start] + replace + patched[end:]
+        applied += 1
+
+    if not applied:
+        raise PatchError("Patch contained no edits.")
+
+    try:
+        ast.parse(patched)
+    except SyntaxError as exc:
+        raise PatchError(f"Patched file does not parse: {exc}") from exc
+    return patched
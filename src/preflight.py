@@ -0,0 +1,212 @@
+"""Static checks on the code and tests before they are sent to a sandbox.
+
+Runs as ``preflight_node`` between Agent T and ``executor_tool_node``. A
+syntax error, a misspelt name or an import of a module that is not in the
+repo, the stdlib or ``pypi_dependencies`` fails the run before it costs a
+sandbox. The checks are:
+
+1. ``compile()`` of the refactored file and of the test file.
+2. Every absolute import resolves to the repo map, the stdlib, the test
+   tooling or a declared dependency. Imports guarded by ``try`` or
+   ``if TYPE_CHECKING:`` are skipped.
+3. Names that are loaded but never bound anywhere in the file, imported or
+   builtin. The check ignores scopes: a name bound anywhere counts. It
+   catches typos and missing imports without flagging valid code. For the
+   refactored file, names the original file already left undefined are not
+   reported.
+
+Problems in the refactored file go back to Agent B. Problems in the tests, and
+imports the original file already had, go back to Agent T.
+"""
+from __future__ import annotations
+
+import ast
+import builtins
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set
+
+from src.suite_discovery import module_name
+
+PREFLIGHT_ENABLED = os.environ.get("PREFLIGHT_ENABLED", "true").lower() == "true"
+
+# Importable in every sandbox: the test tooling and what it pulls in.
+TOOLING_MODULES = {
+    "pytest", "_pytest", "pytest_cov", "xdist", "pluggy", "iniconfig", "packaging", "coverage", "execnet",
+}
+# Distributions whose import name differs from the project name.
+IMPORT_ALIASES = {
+    "beautifulsoup4": "bs4", "pillow": "PIL", "pyyaml": "yaml", "scikit-learn": "sklearn",
+    "scikit-image": "skimage", "python-dateutil": "dateutil", "opencv-python": "cv2",
+    "opencv-python-headless": "cv2", "pyjwt": "jwt", "python-dotenv": "dotenv", "attrs": "attr",
+    "protobuf": "google", "psycopg2-binary": "psycopg2", "msgpack-python": "msgpack",
+}
+_MODULE_DUNDERS = {"__file__", "__name__", "__doc__", "__spec__", "__loader__", "__package__",
+                   "__builtins__", "__path__", "__annotations__", "__dict__", "__debug__",
+                   "__class__", "__module__", "__qualname__"}
+_REQUIREMENT_NAME = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+@dataclass
+class PreflightReport:
+    target_errors: List[str] = field(default_factory=list)
+    test_errors: List[str] = field(default_factory=list)
+    dependency_errors: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.target_errors or self.test_errors or self.dependency_errors)
+
+    @property
+    def next_node(self) -> str:
+        """Agent that has to fix the first problem found (the refactorer wins)."""
+        if self.ok:
+            return "executor_tool_node"
+        return "refactorer_node" if self.target_errors else "test_engineer_node"
+
+    def render(self) -> str:
+        return "\n".join(f"- {error}" for error in
+                         self.target_errors + self.test_errors + self.dependency_errors)
+
+
+def _compile(source: str, path: str) -> ast.Module:
+    compile(source or "", path, "exec", dont_inherit=True)
+    return ast.parse(source or "", filename=path)
+
+
+def _syntax_error(error: SyntaxError, path: str) -> str:
+    return f"{path}:{error.lineno}: SyntaxError: {error.msg}"
+
+
+def repo_import_names(paths: Iterable[str]) -> Set[str]:
+    """Every package/module name in the repo map, at any depth (the sandbox ``sys.path`` varies)."""
+    names = set()
+    for path in paths:
+        if path.endswith(".py"):
+            names.update(part for part in module_name(path).split(".") if part)
+    return names
+
+
+def dependency_import_names(dependencies) -> Set[str]:
+    names = set()
+    for requirement in dependencies or []:
+        match = _REQUIREMENT_NAME.match(str(requirement))
+        if not match:
+            continue
+        project = re.sub(r"[-_.]+", "-", match.group(1)).lower()
+        names.add(IMPORT_ALIASES.get(project, project.replace("-", "_")))
+        # Namespace distributions (google-cloud-storage -> google.cloud.storage).
+        names.add(project.split("-")[0])
+    return names
+
+
+def _type_checking(test: ast.expr) -> bool:
+    return getattr(test, "id", None) == "TYPE_CHECKING" or getattr(test, "attr", None) == "TYPE_CHECKING"
+
+
+def _guarded(tree: ast.Module) -> Set[int]:
+    """ids of import nodes inside a ``try`` body (optional) or ``if TYPE_CHECKING:`` (never run)."""
+    guarded = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Try):
+            body = node.body
+        elif isinstance(node, ast.If) and _type_checking(node.test):
+            body = node.body
+        else:
+            continue
+        for child in body:
+            guarded.update(id(n) for n in ast.walk(child) if isinstance(n, (ast.Import, ast.ImportFrom)))
+    return guarded
+
+
+def imported_modules(tree: ast.Module) -> Dict[str, int]:
+    """Top-level name -> first line of every unguarded absolute import."""
+    guarded = _guarded(tree)
+    found: Dict[str, int] = {}
+    for node in ast.walk(tree):
+        if id(node) in guarded:
+            continue
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                found.setdefault(alias.name.split(".")[0], node.lineno)
+        elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+            found.setdefault(node.module.split(".")[0], node.lineno)
+    return found
+
+
+def undefined_names(tree: ast.Module) -> Dict[str, int]:
+    """Loaded name -> first line, for names bound nowhere in the file and not builtin."""
+    bound = set(dir(builtins)) | _MODULE_DUNDERS
+    loaded: Dict[str, int] = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+            return {}  # star imports make every name potentially defined
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.setdefault(node.id, node.lineno)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+    return {name: line for name, line in loaded.items() if name not in bound}
+
+
+def check(file_path: str, code: str, test_path: str, test_code: str, repo_paths: Iterable[str],
+          dependencies=None, original_code: str = "") -> PreflightReport:
+    """Run the pre-flight checks on the refactored file and its tests."""
+    report = PreflightReport()
+    trees = {}
+    for path, source, errors in ((file_path, code, report.target_errors),
+                                 (test_path, test_code, report.test_errors)):
+        try:
+            trees[path] = _compile(source, path)
+        except SyntaxError as error:
+            errors.append(_syntax_error(error, path))
+        except ValueError as error:  # e.g. source containing null bytes
+            errors.append(f"{path}: {error}")
+
+    importable = (set(sys.stdlib_module_names) | TOOLING_MODULES
+                  | repo_import_names(list(repo_paths) + [file_path, test_path])
+                  | dependency_import_names(dependencies))
+    try:
+        original = ast.parse(original_code or "")
+    except SyntaxError:
+        original = ast.Module(body=[], type_ignores=[])
+    already_imported = set(imported_modules(original))
+    already_undefined = set(undefined_names(original))
+
+    if file_path in trees:
+        tree = trees[file_path]
+        for name, line in sorted(imported_modules(tree).items(), key=lambda item: item[1]):
+            if name in importable:
+                continue
+            message = (f"{file_path}:{line}: `import {name}` is not in the repo, the stdlib "
+                       f"or pypi_dependencies")
+            # An import the file already had needs declaring; a new one may be a mistake.
+            (report.dependency_errors if name in already_imported else report.target_errors).append(message)
+        for name, line in sorted(undefined_names(tree).items(), key=lambda item: item[1]):
+            if name not in already_undefined:
+                report.target_errors.append(f"{file_path}:{line}: undefined name `{name}`")
+    if test_path in trees:
+        tree = trees[test_path]
+        for name, line in sorted(imported_modules(tree).items(), key=lambda item: item[1]):
+            if name not in importable:
+                report.test_errors.append(f"{test_path}:{line}: `import {name}` is not in the repo, "
+                                          f"the stdlib or pypi_dependencies")
+        for name, line in sorted(undefined_names(tree).items(), key=lambda item: item[1]):
+            report.test_errors.append(f"{test_path}:{line}: undefined name `{name}`")
+    return report
@@ -0,0 +1,320 @@
+"""Hedged requests, circuit breakers and failover for chat-model calls.
+
+Every agent's LLM call runs through :func:`call` (or :func:`acall` on the async
+path) as an :class:`Attempt` keyed by ``"<provider>:<model>@<key fingerprint>"``,
+so one tenant's failing key never trips the breaker of another tenant's:
+
+* **Hedging** — once a key has enough latency samples, a call that is still
+  running after that key's p95 gets a duplicate request. Whichever finishes
+  first wins, so one slow backend replica no longer sets the tail.
+* **Circuit breaking** — consecutive failures open the key's breaker. While
+  open, calls are refused immediately; after ``BREAKER_RESET_SECONDS`` a single
+  half-open probe is let through, and its outcome closes or re-opens it.
+* **Failover** — if the primary fails or its breaker is open and the tenant
+  configured a fallback model, the call is re-issued on the fallback.
+
+State is per worker process. ``ValueError`` (which covers output parsing and
+schema validation errors) means the provider answered, and 401/403 mean the key
+itself was refused, so neither counts as a provider failure or fails over.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "true").lower() == "true"
+# Latency samples a key needs before its p95 is trusted as a hedge delay.
+HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Never hedge sooner than this, however fast the p95 is.
+HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "2.0"))
+BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+
+_LATENCY_WINDOW = 200
+
+
+class CircuitOpenError(RuntimeError):
+    """A model's circuit breaker is open and no fallback model is available."""
+
+    def __init__(self, key: str):
+        # The key fingerprint stays out of the message (it ends up in PR comments).
+        super().__init__(f"Circuit breaker open for {key.split('@')[0]}: the provider is failing repeatedly.")
+        self.key = key
+
+
+class CircuitBreaker:
+    """Closed → open after ``failure_threshold`` failures → half-open probe after ``reset_timeout``."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES,
+                 reset_timeout: float = BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """May a call go out now? In half-open state only the single probe may."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+    def release_probe(self) -> None:
+        """The half-open probe ended without a verdict (cancelled, key refused): let the next call probe."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = self._clock() - self.reset_timeout
+
+
+class LatencyTracker:
+    """Sliding window of successful call durations."""
+
+    def __init__(self, window: int = _LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self, min_samples: Optional[int] = None) -> Optional[float]:
+        if min_samples is None:
+            min_samples = HEDGE_MIN_SAMPLES
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_registry_lock = threading.Lock()
+_pool: Optional[ContextThreadPoolExecutor] = None
+
+
+def breaker_for(key: str) -> CircuitBreaker:
+    with _registry_lock:
+        return _breakers.setdefault(key, CircuitBreaker())
+
+
+def latency_for(key: str) -> LatencyTracker:
+    with _registry_lock:
+        return _latencies.setdefault(key, LatencyTracker())
+
+
+def reset() -> None:
+    """Forget all breaker and latency state (tests, or after a config change)."""
+    with _registry_lock:
+        _breakers.clear()
+        _latencies.clear()
+
+
+def _executor() -> ContextThreadPoolExecutor:
+    # Context-propagating pool so callbacks (metering, tracing) see hedged calls.
+    global _pool
+    with _registry_lock:
+        if _pool is None:
+            _pool = ContextThreadPoolExecutor(max_workers=32, thread_name_prefix="reporover-hedge")
+    return _pool
+
+
+@dataclass
+class Attempt:
+    """One way of making the call: a breaker/latency key and a zero-argument callable."""
+
+    key: str
+    fn: Callable[[], Any]
+
+
+_AUTH_STATUSES = (401, 403)
+_AUTH_ERRORS = ("AuthenticationError", "PermissionDeniedError", "PermissionDenied", "Unauthenticated")
+
+
+def attempt_key(provider: str, model: str, scope: str = "") -> str:
+    """Breaker/latency key for a model, scoped to the tenant key that calls it."""
+    return f"{provider}:{model}@{scope}" if scope else f"{provider}:{model}"
+
+
+def _auth_error(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return status in _AUTH_STATUSES or type(exc).__name__ in _AUTH_ERRORS
+
+
+def _counts_as_failure(exc: BaseException) -> bool:
+    return not isinstance(exc, ValueError) and not _auth_error(exc)
+
+
+def _hedge_delay(key: str, hedge: bool) -> Optional[float]:
+    if not (hedge and HEDGE_ENABLED) or breaker_for(key).state != CircuitBreaker.CLOSED:
+        return None
+    p95 = latency_for(key).p95()
+    return None if p95 is None else max(p95, HEDGE_MIN_DELAY)
+
+
+def _record(key: str, started: float, exc: Optional[BaseException]) -> None:
+    if exc is not None and _auth_error(exc):
+        # A refused key says nothing about the provider's health.
+        breaker_for(key).release_probe()
+        return
+    if exc is not None and _counts_as_failure(exc):
+        breaker_for(key).record_failure()
+        return
+    breaker_for(key).record_success()
+    if exc is None:
+        latency_for(key).observe(time.monotonic() - started)
+
+
+# --------------------------------------------------------------------------- #
+# Synchronous path
+# --------------------------------------------------------------------------- #
+
+def _timed(attempt: Attempt) -> Any:
+    started = time.monotonic()
+    try:
+        result = attempt.fn()
+    except Exception as exc:
+        _record(attempt.key, started, exc)
+        raise
+    _record(attempt.key, started, None)
+    return result
+
+
+def _hedged(attempt: Attempt, delay: float) -> Any:
+    pool = _executor()
+    first = pool.submit(_timed, attempt)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeout:
+        pass
+    logger.info("Hedging slow call to %s after %.1fs", attempt.key, delay)
+    pending = {first, pool.submit(_timed, attempt)}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # The loser cannot be interrupted; it finishes in the background.
+                return future.result()
+            error = error or future.exception()
+    raise error
+
+
+def _run(attempt: Attempt, hedge: bool) -> Any:
+    delay = _hedge_delay(attempt.key, hedge)
+    if delay is None:
+        return _timed(attempt)
+    return _hedged(attempt, delay)
+
+
+def call(primary: Attempt, fallback: Optional[Attempt] = None, hedge: bool = True) -> Any:
+    """Run ``primary`` with hedging and circuit breaking, failing over to ``fallback``."""
+    if breaker_for(primary.key).allow():
+        try:
+            return _run(primary, hedge)
+        except Exception as exc:
+            if fallback is None or not _counts_as_failure(exc):
+                raise
+            logger.warning("Failing over from %s to %s: %s", primary.key, fallback.key, exc)
+    elif fallback is None:
+        raise CircuitOpenError(primary.key)
+
+    if not breaker_for(fallback.key).allow():
+        raise CircuitOpenError(fallback.key)
+    return _run(fallback, hedge)
+
+
+# --------------------------------------------------------------------------- #
+# Async path (attempt.fn returns an awaitable)
+# --------------------------------------------------------------------------- #
+
+async def _atimed(attempt: Attempt) -> Any:
+    started = time.monotonic()
+    try:
+        result = await attempt.fn()
+    except asyncio.CancelledError:
+        # A cancelled call (a hedge loser, a superseded run) says nothing about the provider's health.
+        breaker_for(attempt.key).release_probe()
+        raise
+    except Exception as exc:
+        _record(attempt.key, started, exc)
+        raise
+    _record(attempt.key, started, None)
+    return result
+
+
+async def _ahedged(attempt: Attempt, delay: float) -> Any:
+    first = asyncio.ensure_future(_atimed(attempt))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+    logger.info("Hedging slow call to %s after %.1fs", attempt.key, delay)
+    pending = {first, asyncio.ensure_future(_atimed(attempt))}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _arun(attempt: Attempt, hedge: bool) -> Any:
+    delay = _hedge_delay(attempt.key, hedge)
+    if delay is None:
+        return await _atimed(attempt)
+    return await _ahedged(attempt, delay)
+
+
+async def acall(primary: Attempt, fallback: Optional[Attempt] = None, hedge: bool = True) -> Any:
+    """Async counterpart of :func:`call`; ``fn`` on each attempt returns an awaitable."""
+    if breaker_for(primary.key).allow():
+        try:
+            return await _arun(primary, hedge)
+        except Exception as exc:
+            if fallback is None or not _counts_as_failure(exc):
+                raise
+            logger.warning("Failing over from %s to %s: %s", primary.key, fallback.key, exc)
+    elif fallback is None:
+        raise CircuitOpenError(primary.key)
+
+    if not breaker_for(fallback.key).allow():
+        raise CircuitOpenError(fallback.key)
+    return await _arun(fallback, hedge)
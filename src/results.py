@@ -0,0 +1,210 @@
+"""Structured results from the reports a pytest run leaves in the workspace.
+
+The executor used to route on substrings of the raw log (``"ModuleNotFoundError"
+in logs``) and paste the whole log into the next prompt. Every run now writes
+a JUnit XML report and a coverage.py JSON report. :func:`summarize_run` turns
+them into a small dict kept in state as ``execution_result``:
+
+* ``outcome``: ``passed`` / ``tests_failed`` / ``dependency_error`` /
+  ``coverage_low`` / ``no_tests`` / ``timed_out`` (a wall-clock or CPU
+  deadline killed the run)
+* ``tests``: pass/fail/error/skip counts
+* ``failures``: failing test ids with the assertion and a trimmed traceback
+* ``missing_modules``: modules a test could not import
+* ``coverage``: the percentage, the threshold, and the missing lines of the
+  file under review. Unknown coverage (no report, or the file is not in it)
+  counts as ``coverage_low``, never as a pass.
+
+Routing reads ``outcome``, and agents get :func:`render_result` instead of the
+log. When a run leaves no JUnit report (pytest crashed before writing one),
+the old log heuristics still apply.
+"""
+from __future__ import annotations
+
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional
+
+JUNIT_XML = ".reporover/junit.xml"
+
+MAX_FAILURES = 10
+TRACEBACK_LINES = 12
+
+PASSED = "passed"
+TESTS_FAILED = "tests_failed"
+DEPENDENCY_ERROR = "dependency_error"
+COVERAGE_LOW = "coverage_low"
+NO_TESTS = "no_tests"
+TIMED_OUT = "timed_out"
+
+# Appended to stderr by the executor backends when a deadline kills the run.
+_DEADLINE_MARKERS = ("TIMEOUT: killed after", "CPU LIMIT: killed after")
+
+_PARAMS = re.compile(r"\[.*\]$")
+_MISSING_MODULE = re.compile(r"No module named '([^']+)'")
+_LOCATION = re.compile(r"^\S+\.py:\d+:")
+
+
+def junit_test_id(classname: str, name: str, test_path: str) -> str:
+    """Rebuild a pytest node id (``path::Class::test``) from a JUnit ``classname``/``name`` pair."""
+    if not classname:
+        # Collection errors are reported against the module itself.
+        return f"{name.replace('.', '/')}.py"
+    module = test_path[:-3].replace("/", ".") if test_path.endswith(".py") else test_path.replace("/", ".")
+    if classname == module:
+        return f"{test_path}::{name}"
+    if classname.startswith(module + "."):
+        return f"{test_path}::{classname[len(module) + 1:].replace('.', '::')}::{name}"
+    return f"{classname.replace('.', '/')}.py::{name}"
+
+
+def _cases(junit_xml: str):
+    try:
+        root = ET.fromstring(junit_xml or "")
+    except (ET.ParseError, TypeError):
+        return None
+    return list(root.iter("testcase"))
+
+
+def junit_durations(junit_xml: str, test_path: str) -> Dict[str, float]:
+    """Seconds per test id; parametrized cases are summed under their function's id."""
+    durations: Dict[str, float] = {}
+    for case in _cases(junit_xml) or []:
+        name = _PARAMS.sub("", case.get("name", ""))
+        test_id = junit_test_id(case.get("classname", ""), name, test_path)
+        try:
+            durations[test_id] = durations.get(test_id, 0.0) + float(case.get("time") or 0)
+        except ValueError:
+            continue
+    return durations
+
+
+def trim_traceback(text: str, max_lines: int = TRACEBACK_LINES) -> str:
+    """Keep the failing source line, the ``E`` lines and the final location of a pytest traceback."""
+    lines = (text or "").splitlines()
+    keep = [line for line in lines if line.startswith(">") or line.lstrip().startswith("E ") or _LOCATION.match(line)]
+    keep = keep or lines[-max_lines:]
+    if len(keep) > max_lines:
+        keep = keep[: max_lines - 1] + [keep[-1]]
+    return "\n".join(line.rstrip() for line in keep)
+
+
+def _line_ranges(lines: Iterable[int]) -> str:
+    ranges: List[str] = []
+    start = previous = None
+    for line in sorted(set(lines)):
+        if previous is not None and line == previous + 1:
+            previous = line
+            continue
+        if start is not None:
+            ranges.append(str(start) if start == previous else f"{start}-{previous}")
+        start = previous = line
+    if start is not None:
+        ranges.append(str(start) if start == previous else f"{start}-{previous}")
+    return ", ".join(ranges)
+
+
+def _outcome_from_logs(logs: str, exit_code: int) -> str:
+    # No JUnit report: the pre-structured heuristics.
+    if "ModuleNotFoundError" in logs:
+        return DEPENDENCY_ERROR
+    if "Coverage failure" in logs or "Required test coverage of" in logs:
+        return COVERAGE_LOW
+    return PASSED if exit_code == 0 else TESTS_FAILED
+
+
+def summarize_run(junit_reports: Iterable[str], test_path: str, exit_code: int, logs: str,
+                  coverage_percent: Optional[float], missing_lines: Iterable[int],
+                  threshold: float, scope: str = "module") -> dict:
+    """Fold one run's (possibly sharded) JUnit reports and coverage numbers into ``execution_result``."""
+    counts = {"passed": 0, "failed": 0, "errors": 0, "skipped": 0}
+    failures: List[dict] = []
+    missing_modules: List[str] = []
+    parsed = False
+    for report in junit_reports:
+        cases = _cases(report)
+        if cases is None:
+            continue
+        parsed = True
+        for case in cases:
+            problem = case.find("failure")
+            kind = "failure"
+            if problem is None:
+                problem, kind = case.find("error"), "error"
+            if problem is None:
+                counts["skipped" if case.find("skipped") is not None else "passed"] += 1
+                continue
+            counts["failed" if kind == "failure" else "errors"] += 1
+            text = problem.text or ""
+            for module in _MISSING_MODULE.findall(text + (problem.get("message") or "")):
+                if module not in missing_modules:
+                    missing_modules.append(module)
+            if len(failures) < MAX_FAILURES:
+                failures.append({
+                    "test_id": junit_test_id(case.get("classname", ""), case.get("name", ""), test_path),
+                    "kind": kind,
+                    "message": ((problem.get("message") or "").strip().splitlines() or [""])[0][:300],
+                    "traceback": trim_traceback(text),
+                })
+
+    # Fail closed: no report, or a report that does not list the file, never passes the gate.
+    coverage_low = threshold > 0 and (coverage_percent is None or coverage_percent < threshold)
+    if exit_code and any(marker in (logs or "") for marker in _DEADLINE_MARKERS):
+        outcome = TIMED_OUT
+    elif not parsed:
+        outcome = _outcome_from_logs(logs, exit_code)
+        if outcome == PASSED and coverage_low:
+            outcome = COVERAGE_LOW
+    elif missing_modules:
+        outcome = DEPENDENCY_ERROR
+    elif counts["failed"] or counts["errors"]:
+        outcome = TESTS_FAILED
+    elif not counts["passed"]:
+        outcome = NO_TESTS
+    elif coverage_low:
+        outcome = COVERAGE_LOW
+    elif exit_code:
+        outcome = _outcome_from_logs(logs, exit_code)
+    else:
+        outcome = PASSED
+
+    return {
+        "outcome": outcome,
+        "exit_code": exit_code,
+        "tests": counts,
+        "failures": failures,
+        "missing_modules": missing_modules,
+        "coverage": {
+            "percent": None if coverage_percent is None else round(coverage_percent, 2),
+            "threshold": threshold,
+            "scope": scope,
+            "missing_lines": sorted(set(missing_lines)),
+        },
+    }
+
+
+def render_result(result: Optional[dict]) -> str:
+    """Compact text of an ``execution_result`` for agent prompts and failure messages."""
+    if not result:
+        return ""
+    tests = result.get("tests") or {}
+    lines = [
+        f"TESTS: {tests.get('passed', 0)} passed, {tests.get('failed', 0)} failed, "
+        f"{tests.get('errors', 0)} errors, {tests.get('skipped', 0)} skipped (outcome: {result.get('outcome')})"
+    ]
+    for failure in result.get("failures") or []:
+        lines.append(f"{failure['kind'].upper()} {failure['test_id']}: {failure['message']}")
+        if failure.get("traceback"):
+            lines.extend(f"    {line}" for line in failure["traceback"].splitlines())
+    if result.get("missing_modules"):
+        lines.append(f"MISSING MODULES: {', '.join(result['missing_modules'])}")
+    coverage = result.get("coverage") or {}
+    if coverage.get("percent") is None and result.get("outcome") == COVERAGE_LOW:
+        lines.append(f"COVERAGE ({coverage.get('scope')}): unknown, the coverage report did not include the file "
+                     f"(threshold {coverage.get('threshold')}%)")
+    elif coverage.get("percent") is not None:
+        line = f"COVERAGE ({coverage.get('scope')}): {coverage['percent']:.1f}% (threshold {coverage.get('threshold')}%)"
+        if coverage.get("missing_lines"):
+            line += f"; lines never executed: {_line_ranges(coverage['missing_lines'])}"
+        lines.append(line)
+    return "\n".join(lines)
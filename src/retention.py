@@ -0,0 +1,150 @@
+"""Retention for checkpointed review threads.
+
+Each graph step writes a checkpoint (plus channel blobs and pending writes)
+under the session's ``langgraph_thread_id``. Only the latest one is needed to
+resume, and none once the review is over. A :class:`CheckpointStore` prunes
+them in three ways:
+
+* :meth:`~CheckpointStore.keep_latest` while a session waits on a human: every
+  older checkpoint of the thread and what only it referenced;
+* :meth:`~CheckpointStore.delete` when the session completes or its PR closes;
+* :meth:`~CheckpointStore.thread_ids`: batches of the stored threads for the
+  background sweep (``engine.tasks.sweep_checkpoints``). The sweep removes
+  threads whose session is gone, completed or idle for ``CHECKPOINT_ABANDON_DAYS``.
+
+State blobs (:mod:`src.blobstore`) are shared across threads. ``delete`` also
+deletes the blobs no remaining thread references; the sweep drops the rest by
+``touched_at``.
+"""
+from __future__ import annotations
+
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Sequence
+
+SWEEP_BATCH = int(os.environ.get("CHECKPOINT_SWEEP_BATCH", "200"))
+ABANDON_DAYS = float(os.environ.get("CHECKPOINT_ABANDON_DAYS", "14"))
+# A live thread writes (and so touches its blobs) at least every ABANDON_DAYS.
+BLOB_RETENTION_SECONDS = int((ABANDON_DAYS + 1) * 86400)
+
+
+class CheckpointStore(ABC):
+    @abstractmethod
+    def thread_ids(self, after: str = "", limit: int = SWEEP_BATCH) -> List[str]:
+        """Up to ``limit`` stored thread ids greater than ``after``, in order."""
+
+    @abstractmethod
+    def keep_latest(self, thread_ids: Sequence[str]) -> int:
+        """Drop all but the latest checkpoint of each thread; returns checkpoints removed."""
+
+    @abstractmethod
+    def delete(self, thread_ids: Sequence[str]) -> None: ...
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """Prunes one or more in-process ``MemorySaver`` instances through the saver API.
+
+    A saver cannot delete single checkpoints, so ``keep_latest`` reads each
+    namespace's latest checkpoint (and its pending writes), deletes the thread
+    and puts them back. That is O(thread size), which is fine for the dev and
+    test checkpointer this store serves.
+    """
+
+    def __init__(self, savers: Iterable):
+        self.savers = list(savers)
+
+    def thread_ids(self, after="", limit=SWEEP_BATCH):
+        ids = sorted({saved.config["configurable"]["thread_id"] for saver in self.savers
+                      for saved in saver.list(None)})
+        return [thread for thread in ids if thread > after][:limit]
+
+    def keep_latest(self, thread_ids):
+        removed = 0
+        for saver in self.savers:
+            for thread in thread_ids:
+                latest: Dict[str, object] = {}
+                stored = 0
+                for saved in saver.list({"configurable": {"thread_id": thread}}):
+                    stored += 1
+                    # Newest first within each namespace.
+                    latest.setdefault(saved.config["configurable"]["checkpoint_ns"], saved)
+                if stored == len(latest):
+                    continue
+                saver.delete_thread(thread)
+                for saved in latest.values():
+                    self._put_back(saver, saved)
+                removed += stored - len(latest)
+        return removed
+
+    @staticmethod
+    def _put_back(saver, saved) -> None:
+        checkpoint = saved.checkpoint
+        # The parent stays referenced (as in Postgres) even though it is gone.
+        parent = saved.parent_config or {"configurable": {
+            key: saved.config["configurable"][key] for key in ("thread_id", "checkpoint_ns")}}
+        config = saver.put(parent, checkpoint, saved.metadata, dict(checkpoint["channel_versions"]))
+        writes: Dict[str, list] = {}
+        for task_id, channel, value in saved.pending_writes or []:
+            writes.setdefault(task_id, []).append((channel, value))
+        for task_id, task_writes in writes.items():
+            saver.put_writes(config, task_writes, task_id)
+
+    def delete(self, thread_ids):
+        for saver in self.savers:
+            for thread in thread_ids:
+                saver.delete_thread(thread)
+
+
+class PostgresCheckpointStore(CheckpointStore):
+    """Prunes the ``PostgresSaver`` / ``AsyncPostgresSaver`` tables (shared by both)."""
+
+    def __init__(self, pool, blobs=None):
+        self.pool = pool
+        self.blobs = blobs
+
+    def thread_ids(self, after="", limit=SWEEP_BATCH):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id > %s ORDER BY thread_id LIMIT %s",
+                (after, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def keep_latest(self, thread_ids):
+        thread_ids = list(thread_ids)
+        if not thread_ids:
+            return 0
+        latest = ("SELECT thread_id, checkpoint_ns, max(checkpoint_id) AS checkpoint_id "
+                  "FROM checkpoints WHERE thread_id = ANY(%s) GROUP BY thread_id, checkpoint_ns")
+        with self.pool.connection() as conn, conn.transaction():
+            conn.execute(
+                f"DELETE FROM checkpoint_writes w USING ({latest}) l "
+                "WHERE w.thread_id = l.thread_id AND w.checkpoint_ns = l.checkpoint_ns "
+                "AND w.checkpoint_id <> l.checkpoint_id",
+                (thread_ids,),
+            )
+            removed = conn.execute(
+                f"DELETE FROM checkpoints c USING ({latest}) l "
+                "WHERE c.thread_id = l.thread_id AND c.checkpoint_ns = l.checkpoint_ns "
+                "AND c.checkpoint_id <> l.checkpoint_id",
+                (thread_ids,),
+            ).rowcount
+            # Channel blobs survive only at the versions the remaining checkpoint points to.
+            conn.execute(
+                "DELETE FROM checkpoint_blobs b WHERE b.thread_id = ANY(%s) AND NOT EXISTS ("
+                " SELECT 1 FROM checkpoints c WHERE c.thread_id = b.thread_id"
+                " AND c.checkpoint_ns = b.checkpoint_ns"
+                " AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version)",
+                (thread_ids,),
+            )
+        return removed
+
+    def delete(self, thread_ids):
+        thread_ids = list(thread_ids)
+        if not thread_ids:
+            return
+        with self.pool.connection() as conn, conn.transaction():
+            for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ANY(%s)", (thread_ids,))
+        if self.blobs is not None:
+            self.blobs.release(thread_ids)
@@ -0,0 +1,46 @@
+"""Process-wide asyncio runtime for the async graph execution path.
+
+Celery tasks are synchronous, but the review graph spends nearly all of its
+time waiting on the LLM provider and the sandbox. Rather than blocking one
+worker process per review, a single event loop runs on a daemon thread and
+every review's ``astream`` is scheduled onto it. The calling task thread only
+waits on the result, so a worker started with a thread (or gevent) pool can
+keep dozens of reviews in flight inside one process::
+
+    GRAPH_EXECUTION=async celery -A reporover worker --pool threads -c 50
+
+Async checkpointers (``AsyncPostgresSaver``) are bound to this same loop, which
+lets their synchronous wrappers (``get_state`` / ``update_state``) be called
+from task threads as well.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def async_enabled() -> bool:
+    """True when graphs should be driven through ``astream`` (``GRAPH_EXECUTION=async``)."""
+    return os.environ.get("GRAPH_EXECUTION", "sync").lower() == "async"
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return (starting once) the event loop shared by every review in this process."""
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="reporover-graph-loop", daemon=True)
+            thread.start()
+            _loop = loop
+    return _loop
+
+
+def run(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Run ``coro`` on the shared loop and block the calling thread for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
@@ -0,0 +1,652 @@
+"""Warm E2B sandbox pool for the executor node.
+
+Creating a sandbox and installing the test tooling (pytest, pytest-cov,
+pytest-xdist) in it used to be the first thing every executor run did, and it
+dominated approve-to-result latency. The pool keeps sandboxes that already have the test tooling
+installed, per tenant (E2B key), and hands them out on lease:
+
+* ``lease`` returns the sandbox parked for the review session if there is one
+  (the self-healing loop keeps its sandbox and installed dependencies), else
+  an idle warm sandbox, else a new one while the tenant is under
+  ``SANDBOX_POOL_MAX``. At the cap it waits for a return.
+* ``release`` parks the sandbox for its session (``keep=True``), or resets
+  it and returns it to the idle pool. A reset wipes the workspace and checks
+  the interpreter's installed packages against the fingerprint taken when the
+  sandbox was created: a run that ``pip install``-ed into the interpreter would
+  otherwise mask a missing dependency for the next review, so such a sandbox
+  is killed instead. Broken sandboxes are killed too.
+* Agent-declared dependencies are installed into a per-sandbox environment
+  keyed by the normalized dependency set and the sandbox's Python version
+  (:func:`ensure_env`). A repeat run with the same set skips ``pip`` entirely,
+  and ``lease`` prefers idle sandboxes that already hold the wanted env.
+* A review session keeps its sandbox for at most ``SANDBOX_SESSION_TTL_SECONDS``.
+  Each sandbox remembers the content hash of every file it holds, so
+  :func:`hydrate` uploads only the files that changed since the last run.
+* Idle and parked sandboxes older than ``SANDBOX_POOL_IDLE_SECONDS`` are
+  killed on the next pool operation, well before E2B's own timeout.
+
+Idle sandboxes belong to one worker process. Parked ones are also recorded in
+a :class:`SessionRegistry`. It is shared through Redis (``SANDBOX_REGISTRY_URL``,
+falling back to ``GOVERNOR_REDIS_URL`` / ``CELERY_BROKER_URL``), so the retry
+after ``/approve`` reconnects to the session's sandbox by id from whichever
+prefork process runs it, and ``discard`` kills it from any process. Claiming
+a record is atomic, so only one process ever holds a parked sandbox. Records
+outlive their sandbox's expiry by ``_RECORD_GRACE_SECONDS``, so a process
+evicting an expired sandbox still finds the record and kills it; a missing
+record means another process claimed the sandbox, and an unreachable registry
+means nobody could, so the sandbox is killed then too.
+``SANDBOX_POOL_MAX=0`` turns pooling off, so every run gets a fresh sandbox
+that is killed afterwards.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shlex
+import tarfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE = "/home/user/workspace"
+ENV_ROOT = "/home/user/.reporover/envs"
+TEST_TOOLING = "pytest pytest-cov pytest-xdist"
+# Fingerprint of every package the interpreter can import (site and user site).
+INTERPRETER_BASELINE = "/home/user/.reporover/interpreter.sha256"
+_FINGERPRINT = "python -m pip freeze --all 2>/dev/null | sha256sum"
+
+POOL_MAX = int(os.environ.get("SANDBOX_POOL_MAX", "4"))
+POOL_IDLE_SECONDS = float(os.environ.get("SANDBOX_POOL_IDLE_SECONDS", "600"))
+# Idle sandboxes to keep ready per tenant after a lease (warmed in the background).
+POOL_WARM = int(os.environ.get("SANDBOX_POOL_WARM", "1"))
+LEASE_TIMEOUT = float(os.environ.get("SANDBOX_LEASE_TIMEOUT", "120"))
+SESSION_TTL_SECONDS = float(os.environ.get("SANDBOX_SESSION_TTL_SECONDS", "1800"))
+REGISTRY_URL = (os.environ.get("SANDBOX_REGISTRY_URL") or os.environ.get("GOVERNOR_REDIS_URL")
+                or os.environ.get("CELERY_BROKER_URL") or "")
+# How long a registry record outlives its sandbox's expiry, so eviction can still claim it.
+_RECORD_GRACE_SECONDS = 3600
+
+
+def run_command(sbx, cmd: str, **kwargs):
+    """``sbx.commands.run`` that returns non-zero exits as a result instead of raising.
+
+    The E2B SDK raises ``CommandExitException`` (itself a ``CommandResult``)
+    for any non-zero exit, which is the normal outcome of a failing test run.
+    """
+    from e2b.sandbox.commands.command_handle import CommandExitException
+
+    try:
+        return sbx.commands.run(cmd, **kwargs)
+    except CommandExitException as result:
+        return result
+
+
+def pack_files(files: Dict[str, str]) -> bytes:
+    """Pack a ``{relative path: content}`` map into one gzipped tar, in memory.
+
+    Absolute paths and paths escaping the workspace are dropped.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=6) as archive:
+        for path, content in sorted(files.items()):
+            name = os.path.normpath(path)
+            if os.path.isabs(name) or name == ".." or name.startswith("../"):
+                logger.warning("Not hydrating %r: outside the workspace.", path)
+                continue
+            data = content.encode("utf-8") if isinstance(content, str) else bytes(content or b"")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o644
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+@dataclass
+class Hydration:
+    files: int
+    archive_bytes: int
+    seconds: float
+    unchanged: int = 0
+
+    def summary(self) -> str:
+        skipped = f", {self.unchanged} unchanged skipped" if self.unchanged else ""
+        return (f"Hydrated {self.files} files ({self.archive_bytes / 1024:.0f} KiB archive{skipped}) "
+                f"in {self.seconds:.2f}s.")
+
+
+def content_hash(content) -> str:
+    data = content.encode("utf-8") if isinstance(content, str) else bytes(content or b"")
+    return hashlib.sha256(data).hexdigest()
+
+
+def hydrate(sbx, files: Dict[str, str], root: str = WORKSPACE,
+            uploaded: Optional[Dict[str, str]] = None) -> Hydration:
+    """Upload ``files`` as one archive and unpack it under ``root`` with a single command.
+
+    ``uploaded`` maps path -> content hash of what the sandbox already holds.
+    When given, unchanged files are skipped, files no longer present are
+    removed, and the map is updated after a successful upload.
+    """
+    started = time.monotonic()
+    hashes = {path: content_hash(content) for path, content in files.items()}
+    known = uploaded if uploaded is not None else {}
+    changed = {path: content for path, content in files.items() if known.get(path) != hashes[path]}
+    removed = sorted(set(known) - set(files))
+    if not changed and not removed:
+        return Hydration(files=0, archive_bytes=0, seconds=time.monotonic() - started, unchanged=len(files))
+
+    steps = [f"mkdir -p {root}"]
+    if removed:
+        steps.append("rm -f " + " ".join(shlex.quote(f"{root}/{path}") for path in removed))
+    archive = pack_files(changed) if changed else b""
+    if changed:
+        remote = f"/tmp/reporover-hydrate-{hashlib.sha256(archive).hexdigest()[:12]}.tar.gz"
+        sbx.files.write(remote, archive)
+        steps.append(f"tar -xzf {remote} -C {root} && rm -f {remote}")
+    result = run_command(sbx, " && ".join(steps), timeout=120)
+    if getattr(result, "exit_code", 0):
+        raise RuntimeError(f"Sandbox hydration failed:\n{result.stderr}")
+    if uploaded is not None:
+        for path in removed:
+            uploaded.pop(path, None)
+        uploaded.update({path: hashes[path] for path in changed})
+    return Hydration(files=len(changed), archive_bytes=len(archive), seconds=time.monotonic() - started,
+                     unchanged=len(files) - len(changed))
+
+
+def _tenant(api_key: Optional[str]) -> str:
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _create_e2b_sandbox(api_key: Optional[str]):
+    from e2b_code_interpreter import Sandbox
+
+    # Outlive the pool's own idle eviction so E2B never kills a leased sandbox.
+    sbx = Sandbox(api_key=api_key, timeout=int(POOL_IDLE_SECONDS) + 300)
+    run_command(sbx, f"pip install -q {TEST_TOOLING} && mkdir -p {WORKSPACE} {ENV_ROOT} "
+                     f"&& {_FINGERPRINT} > {INTERPRETER_BASELINE}", timeout=300)
+    return sbx
+
+
+def _connect_e2b_sandbox(sandbox_id: str, api_key: Optional[str]):
+    from e2b_code_interpreter import Sandbox
+
+    sbx = Sandbox.connect(sandbox_id, api_key=api_key)
+    sbx.set_timeout(int(POOL_IDLE_SECONDS) + 300)
+    return sbx
+
+
+def _kill_e2b_sandbox(sandbox_id: str, api_key: Optional[str]) -> None:
+    from e2b_code_interpreter import Sandbox
+
+    Sandbox.kill(sandbox_id=sandbox_id, api_key=api_key)
+
+
+@dataclass
+class PooledSandbox:
+    sbx: object
+    tenant: str
+    api_key: Optional[str] = field(repr=False, default=None)
+    session: Optional[str] = None
+    last_used: float = 0.0
+    python: Optional[str] = None
+    envs: Dict[str, str] = field(default_factory=dict)  # env key -> site dir
+    uploaded: Dict[str, str] = field(default_factory=dict)  # workspace path -> content hash
+    session_started: float = 0.0
+
+    def has_env(self, dependencies) -> bool:
+        return self.python is not None and env_key(dependencies, self.python) in self.envs
+
+    @property
+    def sandbox_id(self) -> str:
+        return str(getattr(self.sbx, "sandbox_id", None) or id(self.sbx))
+
+
+# --------------------------------------------------------------------------- #
+# Parked-session registry
+# --------------------------------------------------------------------------- #
+
+class SessionRegistry(ABC):
+    """Which sandbox (by id) is parked for which review session, across processes."""
+
+    @abstractmethod
+    def park(self, session: str, record: dict, ttl: float) -> None: ...
+
+    @abstractmethod
+    def claim(self, session: str, sandbox_id: Optional[str] = None) -> Optional[dict]:
+        """Remove and return the session's record (only if it is ``sandbox_id``, when given)."""
+
+
+class MemorySessionRegistry(SessionRegistry):
+    """Registry for a single process (tests, or no Redis configured)."""
+
+    def __init__(self):
+        self._records: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def park(self, session, record, ttl):
+        with self._lock:
+            self._records[session] = record
+
+    def claim(self, session, sandbox_id=None):
+        with self._lock:
+            record = self._records.get(session)
+            if record is None or (sandbox_id is not None and record["sandbox_id"] != sandbox_id):
+                return None
+            return self._records.pop(session)
+
+
+_CLAIM_LUA = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then return false end
+if ARGV[1] ~= '' and cjson.decode(raw)['sandbox_id'] ~= ARGV[1] then return false end
+redis.call('DEL', KEYS[1])
+return raw
+"""
+
+
+class RedisSessionRegistry(SessionRegistry):
+    PREFIX = "reporover:sandbox-session"
+
+    def __init__(self, client):
+        self.client = client
+        self._claim = client.register_script(_CLAIM_LUA)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisSessionRegistry":
+        import redis
+
+        options = {"ssl_cert_reqs": None} if url.startswith("rediss://") else {}
+        return cls(redis.Redis.from_url(url, decode_responses=True, **options))
+
+    def park(self, session, record, ttl):
+        self.client.set(f"{self.PREFIX}:{session}", json.dumps(record), ex=max(int(ttl), 1))
+
+    def claim(self, session, sandbox_id=None):
+        raw = self._claim(keys=[f"{self.PREFIX}:{session}"], args=[sandbox_id or ""])
+        return json.loads(raw) if raw else None
+
+
+# --------------------------------------------------------------------------- #
+# Dependency environments
+# --------------------------------------------------------------------------- #
+
+_REQUIREMENT_NAME = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)(.*)$")
+
+# Last measured install time per env key (this process), used to report savings.
+_install_seconds: Dict[str, float] = {}
+
+
+def normalize_dependencies(dependencies) -> List[str]:
+    """Canonical, de-duplicated, sorted requirement strings (PEP 503 names, no spaces)."""
+    normalized = set()
+    for requirement in dependencies or []:
+        match = _REQUIREMENT_NAME.match(str(requirement))
+        if not match:
+            continue
+        name = re.sub(r"[-_.]+", "-", match.group(1)).lower()
+        normalized.add(name + re.sub(r"\s+", "", match.group(2)))
+    return sorted(normalized)
+
+
+def env_key(dependencies, python_version: str) -> str:
+    payload = "\n".join([f"python={python_version}"] + normalize_dependencies(dependencies))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class DependencyInstallError(RuntimeError):
+    """``pip`` could not install the agent-declared dependency set."""
+
+
+@dataclass
+class EnvResult:
+    key: str
+    site_dir: str
+    cached: bool
+    install_seconds: float = 0.0
+    saved_seconds: float = 0.0
+
+    def summary(self) -> str:
+        if self.cached:
+            return f"Dependency env {self.key} reused; skipped install (saved ~{self.saved_seconds:.1f}s)."
+        return f"Dependency env {self.key} built in {self.install_seconds:.1f}s."
+
+
+def _python_version(sbx) -> str:
+    result = run_command(sbx, "python -c 'import sys; print(\"%d.%d\" % sys.version_info[:2])'", timeout=30)
+    version = getattr(result, "stdout", "")
+    return version.strip() if isinstance(version, str) else ""
+
+
+def ensure_env(pooled: PooledSandbox, dependencies, timeout: float = 300):
+    """Install ``dependencies`` into a cached site dir in the sandbox; None when there are none.
+
+    Raises :class:`DependencyInstallError` with pip's output when the install fails.
+    """
+    requirements = normalize_dependencies(dependencies)
+    if not requirements:
+        return None
+    if pooled.python is None:
+        pooled.python = _python_version(pooled.sbx)
+    key = env_key(requirements, pooled.python)
+    if key in pooled.envs:
+        return EnvResult(key, pooled.envs[key], cached=True, saved_seconds=_install_seconds.get(key, 0.0))
+
+    site_dir = f"{ENV_ROOT}/{key}"
+    quoted = " ".join(shlex.quote(r) for r in requirements)
+    started = time.monotonic()
+    # The finished env is read-only so a test run cannot change it for the next one.
+    result = run_command(pooled.sbx, f"chmod -R u+w {site_dir} 2>/dev/null; rm -rf {site_dir} && "
+                                     f"pip install -q --target {site_dir} {quoted} && chmod -R a-w {site_dir}",
+                         timeout=timeout)
+    elapsed = time.monotonic() - started
+    if getattr(result, "exit_code", 0):
+        raise DependencyInstallError(f"pip install failed:\n{result.stdout}\n{result.stderr}")
+    _install_seconds[key] = elapsed
+    pooled.envs[key] = site_dir
+    return EnvResult(key, site_dir, cached=False, install_seconds=elapsed)
+
+
+class SandboxPool:
+    """Per-tenant pool of warm sandboxes with lease / release / reset semantics."""
+
+    def __init__(self, factory: Callable[[Optional[str]], object] = _create_e2b_sandbox,
+                 max_size: int = POOL_MAX, idle_seconds: float = POOL_IDLE_SECONDS,
+                 warm: int = POOL_WARM, clock=time.monotonic, session_ttl: float = SESSION_TTL_SECONDS,
+                 registry: Optional[SessionRegistry] = None,
+                 connect: Callable[[str, Optional[str]], object] = _connect_e2b_sandbox,
+                 kill_by_id: Callable[[str, Optional[str]], None] = _kill_e2b_sandbox):
+        self.factory = factory
+        self.registry = registry if registry is not None else MemorySessionRegistry()
+        self.connect = connect
+        self.kill_by_id = kill_by_id
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.session_ttl = session_ttl
+        self.warm = warm
+        self._clock = clock
+        self._idle: Dict[str, List[PooledSandbox]] = {}
+        self._parked: Dict[str, PooledSandbox] = {}
+        self._counts: Dict[str, int] = {}  # live sandboxes (leased + idle + parked + warming) per tenant
+        self._cond = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def spare(self, api_key: Optional[str]) -> Optional[int]:
+        """Sandboxes this tenant could lease now without waiting; None when pooling is off."""
+        if not self.enabled:
+            return None
+        tenant = _tenant(api_key)
+        with self._cond:
+            return self.max_size - self._counts.get(tenant, 0) + len(self._idle.get(tenant, []))
+
+    # --- lease --------------------------------------------------------------
+    def lease(self, api_key: Optional[str], session: Optional[str] = None,
+              dependencies=None) -> PooledSandbox:
+        tenant = _tenant(api_key)
+        deadline = self._clock() + LEASE_TIMEOUT
+        if session and self.enabled:
+            parked = self._claim_parked(session, tenant, api_key)
+            if parked is not None:
+                with self._cond:
+                    return self._hand_out(parked, session)
+        with self._cond:
+            self._evict_expired()
+            while True:
+                if self._idle.get(tenant):
+                    return self._hand_out(self._take_idle(tenant, dependencies), session)
+                if not self.enabled or self._counts.get(tenant, 0) < self.max_size:
+                    self._counts[tenant] = self._counts.get(tenant, 0) + 1
+                    break
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    raise RuntimeError(f"Sandbox pool exhausted ({self.max_size} in use for this tenant).")
+                self._cond.wait(timeout=min(remaining, 5.0))
+
+        try:
+            sbx = self.factory(api_key)
+        except Exception:
+            self._forget(tenant)
+            raise
+        self._prewarm(api_key, tenant)
+        now = self._clock()
+        return PooledSandbox(sbx=sbx, tenant=tenant, api_key=api_key, session=session, last_used=now,
+                             session_started=now)
+
+    def _claim_parked(self, session: str, tenant: str, api_key: Optional[str]) -> Optional[PooledSandbox]:
+        """The sandbox parked for ``session`` by this or another process, now held by this one."""
+        record, reachable = self._claim(session)
+        with self._cond:
+            local = self._parked.pop(session, None)
+            if local is not None and reachable and (record is None or record["sandbox_id"] != local.sandbox_id):
+                # Another process claimed it; it is not ours to use.
+                self._forget(local.tenant)
+                local = None
+        if local is not None:
+            if not self._expired(local):
+                return local
+            self._kill_later([local])
+            return None
+        if record is None:
+            return None
+        if record["expires_at"] <= time.time():
+            self._kill_later([], [(record["sandbox_id"], api_key)])
+            return None
+        try:
+            sbx = self.connect(record["sandbox_id"], api_key)
+        except Exception:
+            logger.info("Parked sandbox %s is gone; leasing another.", record["sandbox_id"], exc_info=True)
+            return None
+        now = self._clock()
+        with self._cond:
+            self._counts[tenant] = self._counts.get(tenant, 0) + 1
+        return PooledSandbox(
+            sbx=sbx, tenant=tenant, api_key=api_key, session=session, last_used=now,
+            session_started=now - record["session_age"] - (time.time() - record["parked_at"]),
+            python=record["python"], envs=dict(record["envs"]), uploaded=dict(record["uploaded"]),
+        )
+
+    def _claim(self, session: str, sandbox_id: Optional[str] = None):
+        """``(record, reachable)``: the claimed record, and whether the registry answered at all."""
+        try:
+            return self.registry.claim(session, sandbox_id), True
+        except Exception:
+            # Nobody can claim through an unreachable registry, so a local copy is still ours.
+            logger.warning("Sandbox session registry unavailable.", exc_info=True)
+            return None, False
+
+    def _take_idle(self, tenant: str, dependencies) -> PooledSandbox:
+        # Prefer a sandbox that already holds this dependency set's env.
+        idle = self._idle[tenant]
+        for index in range(len(idle) - 1, -1, -1):
+            if dependencies and idle[index].has_env(dependencies):
+                return idle.pop(index)
+        return idle.pop()
+
+    def _hand_out(self, pooled: PooledSandbox, session: Optional[str]) -> PooledSandbox:
+        if pooled.session != session or not session:
+            pooled.session_started = self._clock()
+        pooled.session = session
+        pooled.last_used = self._clock()
+        self._prewarm(pooled.api_key, pooled.tenant)
+        return pooled
+
+    # --- return -------------------------------------------------------------
+    def release(self, pooled: PooledSandbox, keep: bool = False, healthy: bool = True) -> None:
+        """Park for the session (``keep``), reset into the idle pool, or kill if unhealthy."""
+        if not self.enabled or not healthy:
+            self._kill(pooled)
+            return
+        if keep and pooled.session:
+            with self._cond:
+                pooled.last_used = self._clock()
+                previous = self._parked.pop(pooled.session, None)
+                self._parked[pooled.session] = pooled
+                self._cond.notify_all()
+            if previous is not None and previous is not pooled:
+                self._kill(previous)
+            record = self._record(pooled)
+            try:
+                self.registry.park(pooled.session, record, record["expires_at"] - time.time() + _RECORD_GRACE_SECONDS)
+            except Exception:
+                # Without the registry only this process can hand the sandbox back to its session.
+                logger.warning("Sandbox session registry unavailable.", exc_info=True)
+            return
+        if not self.reset(pooled):
+            return
+        with self._cond:
+            pooled.session = None
+            pooled.last_used = self._clock()
+            self._idle.setdefault(pooled.tenant, []).append(pooled)
+            self._cond.notify_all()
+
+    def reset(self, pooled: PooledSandbox) -> bool:
+        """Wipe the workspace and verify the interpreter is as created; kills the sandbox otherwise.
+
+        Dependency envs survive: they are keyed by content, read-only, and the
+        pool never hands a sandbox to another tenant.
+        """
+        try:
+            result = run_command(pooled.sbx, f"rm -rf {WORKSPACE} && mkdir -p {WORKSPACE} && "
+                                             f"{_FINGERPRINT} | cmp -s - {INTERPRETER_BASELINE}", timeout=60)
+        except Exception:
+            logger.warning("Sandbox reset failed; discarding it.", exc_info=True)
+            self._kill(pooled)
+            return False
+        if getattr(result, "exit_code", 0):
+            logger.info("Sandbox interpreter packages changed during the run; discarding it.")
+            self._kill(pooled)
+            return False
+        pooled.uploaded.clear()
+        return True
+
+    def discard(self, session: str, api_key: Optional[str] = None) -> None:
+        """Kill the sandbox parked for a finished (or superseded) review session, from any process."""
+        record, _ = self._claim(session)
+        with self._cond:
+            pooled = self._parked.pop(session, None)
+        if pooled is not None:
+            self._kill(pooled)
+            if record is None or record["sandbox_id"] == pooled.sandbox_id:
+                return
+        if record is not None:
+            self._kill_by_id(record["sandbox_id"], api_key)
+
+    def _record(self, pooled: PooledSandbox) -> dict:
+        """What another process needs to reconnect to a parked sandbox and carry on."""
+        session_age = self._clock() - pooled.session_started
+        now = time.time()
+        return {
+            "sandbox_id": pooled.sandbox_id, "python": pooled.python, "envs": pooled.envs,
+            "uploaded": pooled.uploaded, "session_age": session_age, "parked_at": now,
+            "expires_at": now + min(self.idle_seconds, self.session_ttl - session_age),
+        }
+
+    def _kill_by_id(self, sandbox_id: str, api_key: Optional[str]) -> None:
+        try:
+            self.kill_by_id(sandbox_id, api_key)
+        except Exception:
+            logger.debug("Sandbox kill by id failed (already gone?)", exc_info=True)
+
+    # --- housekeeping -------------------------------------------------------
+    def _evict_expired(self) -> None:
+        # Caller holds the lock; kills happen outside it on a helper thread.
+        horizon = self._clock() - self.idle_seconds
+        parked = [p for p in self._parked.values() if self._expired(p)]
+        for pooled in parked:
+            self._parked.pop(pooled.session, None)
+        expired = []
+        for tenant, idle in self._idle.items():
+            expired += [p for p in idle if p.last_used < horizon]
+            self._idle[tenant] = [p for p in idle if p.last_used >= horizon]
+        if parked or expired:
+            self._kill_later(expired, parked=parked)
+
+    def _expired(self, pooled: PooledSandbox) -> bool:
+        now = self._clock()
+        return pooled.last_used < now - self.idle_seconds or pooled.session_started < now - self.session_ttl
+
+    def _kill_later(self, pooled: List[PooledSandbox], by_id=(), parked=()) -> None:
+        def _kill_all():
+            for sandbox in parked:
+                # The record outlives the sandbox, so only a claim by another process removes it.
+                record, reachable = self._claim(sandbox.session, sandbox.sandbox_id)
+                if reachable and record is None:
+                    self._forget(sandbox.tenant)
+                else:
+                    self._kill(sandbox)
+            for sandbox in pooled:
+                self._kill(sandbox)
+            for sandbox_id, api_key in by_id:
+                self._kill_by_id(sandbox_id, api_key)
+
+        threading.Thread(target=_kill_all, daemon=True).start()
+
+    def _prewarm(self, api_key: Optional[str], tenant: str) -> None:
+        if not self.enabled or self.warm <= 0:
+            return
+        with self._cond:
+            missing = min(self.warm - len(self._idle.get(tenant, [])), self.max_size - self._counts.get(tenant, 0))
+            if missing <= 0:
+                return
+            self._counts[tenant] = self._counts.get(tenant, 0) + missing
+
+        def _warm():
+            for _ in range(missing):
+                try:
+                    sbx = self.factory(api_key)
+                except Exception:
+                    logger.warning("Sandbox pre-warm failed.", exc_info=True)
+                    self._forget(tenant)
+                    continue
+                with self._cond:
+                    self._idle.setdefault(tenant, []).append(
+                        PooledSandbox(sbx=sbx, tenant=tenant, api_key=api_key, last_used=self._clock())
+                    )
+                    self._cond.notify_all()
+
+        threading.Thread(target=_warm, name="reporover-sandbox-warm", daemon=True).start()
+
+    def _forget(self, tenant: str) -> None:
+        with self._cond:
+            self._counts[tenant] = max(self._counts.get(tenant, 1) - 1, 0)
+            self._cond.notify_all()
+
+    def _kill(self, pooled: PooledSandbox) -> None:
+        try:
+            pooled.sbx.kill()
+        except Exception:
+            logger.debug("Sandbox kill failed (already gone?)", exc_info=True)
+        self._forget(pooled.tenant)
+
+    def shutdown(self) -> None:
+        with self._cond:
+            everything = list(self._parked.values()) + [p for idle in self._idle.values() for p in idle]
+            self._parked.clear()
+            self._idle.clear()
+        for pooled in everything:
+            self._kill(pooled)
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    """Process-wide sandbox pool (lazy singleton)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            registry = RedisSessionRegistry.from_url(REGISTRY_URL) if REGISTRY_URL.startswith("redis") else None
+            _pool = SandboxPool(registry=registry)
+        return _pool
@@ -0,0 +1,155 @@
+"""Compressed checkpoint serialization.
+
+LangGraph's default serializer already encodes checkpoint values as msgpack.
+:class:`CompressingSerializer` wraps it (usually through
+:class:`src.blobstore.OffloadingSerializer`) and compresses every payload of at
+least ``CHECKPOINT_COMPRESS_MIN_BYTES`` with zlib.
+``CHECKPOINT_COMPRESSION=zstd`` opts into zstd, which needs the ``zstandard``
+package (not a dependency; without it the serializer falls back to zlib), and
+``none`` disables compression. The codec is appended to the payload's type tag
+(``msgpack+zlib``), so:
+
+* both ``PostgresSaver`` and ``MemorySaver`` store it like any other typed value;
+* checkpoints written before compression, or below the threshold, load as-is;
+* a process configured with another codec still reads every existing payload.
+
+Each serializer counts its calls, bytes in and out and the time spent in each
+direction (:meth:`CompressingSerializer.stats`). Inside :func:`measuring` the
+same counts also go to the caller's dict, so a graph run can report its own
+share (the review tasks meter it per session).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION = os.environ.get("CHECKPOINT_COMPRESSION", "zlib").lower()
+COMPRESS_MIN_BYTES = int(os.environ.get("CHECKPOINT_COMPRESS_MIN_BYTES", "512"))
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def _zstd() -> Optional[Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    # (De)compressor objects are not thread-safe; build one per call (cheap at these sizes).
+    return (lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data))
+
+
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (lambda data: zlib.compress(data, ZLIB_LEVEL), zlib.decompress),
+}
+_ZSTD = _zstd()
+if _ZSTD is not None:
+    CODECS["zstd"] = _ZSTD
+
+
+# Counters of the run in progress (see measuring); tasks it spawns share the same dict.
+_run_stats: ContextVar[Optional[dict]] = ContextVar("reporover_serde_run_stats", default=None)
+_run_lock = threading.Lock()
+
+
+def new_stats() -> dict:
+    return {"dumps": 0, "loads": 0, "dumps_seconds": 0.0, "loads_seconds": 0.0,
+            "raw_bytes": 0, "stored_bytes": 0, "compressed": 0}
+
+
+@contextmanager
+def measuring(stats: dict):
+    """Also count every checkpoint (de)serialization made in this context into ``stats``."""
+    token = _run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _run_stats.reset(token)
+
+
+def pick_codec(name: str = COMPRESSION) -> Optional[str]:
+    """The codec to write with: ``name`` if available, zlib if zstd is missing, None for ``none``."""
+    if name in ("", "none", "off"):
+        return None
+    if name in CODECS:
+        return name
+    if name == "zstd":
+        logger.warning("zstandard is not installed; compressing checkpoints with zlib.")
+        return "zlib"
+    raise ValueError(f"Unknown checkpoint compression {name!r}; expected zstd, zlib or none.")
+
+
+class CompressingSerializer:
+    """Wrap a LangGraph serializer and compress its typed payloads above a size threshold."""
+
+    def __init__(self, inner, codec: Optional[str] = None, min_bytes: int = COMPRESS_MIN_BYTES):
+        self.inner = inner
+        self.codec = pick_codec() if codec is None else pick_codec(codec)
+        self.min_bytes = min_bytes
+        self._lock = threading.Lock()
+        self._stats = new_stats()
+
+    # --- untyped protocol (delegated) -----------------------------------------
+    def dumps(self, obj: Any) -> bytes:
+        return self.inner.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.inner.loads(data)
+
+    # --- typed protocol -------------------------------------------------------
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        started = time.perf_counter()
+        type_, data = self.inner.dumps_typed(obj)
+        raw = len(data or b"")
+        compressed = False
+        if self.codec and data and raw >= self.min_bytes:
+            packed = CODECS[self.codec][0](data)
+            # Already-dense payloads (or tiny gains) are kept as they are.
+            if len(packed) < raw * 0.9:
+                type_, data, compressed = f"{type_}+{self.codec}", packed, True
+        self._record("dumps", time.perf_counter() - started, raw, len(data or b""), compressed)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        started = time.perf_counter()
+        type_, payload = data
+        base, _, codec = type_.rpartition("+")
+        if base and codec in CODECS:
+            type_, payload = base, CODECS[codec][1](payload)
+        elif base and codec == "zstd":
+            raise RuntimeError("This checkpoint is zstd-compressed; install the zstandard package to read it.")
+        value = self.inner.loads_typed((type_, payload))
+        self._record("loads", time.perf_counter() - started)
+        return value
+
+    # --- timings --------------------------------------------------------------
+    def _record(self, op: str, seconds: float, raw: int = 0, stored: int = 0, compressed: bool = False) -> None:
+        run = _run_stats.get()
+        for stats, lock in ((self._stats, self._lock), (run, _run_lock)):
+            if stats is None:
+                continue
+            with lock:
+                stats[op] += 1
+                stats[f"{op}_seconds"] += seconds
+                stats["raw_bytes"] += raw
+                stats["stored_bytes"] += stored
+                stats["compressed"] += int(compressed)
+
+    def stats(self) -> dict:
+        """Calls, bytes and seconds spent (de)serializing since this serializer was built."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["codec"] = self.codec or "none"
+        snapshot["ratio"] = round(snapshot["stored_bytes"] / snapshot["raw_bytes"], 3) if snapshot["raw_bytes"] else None
+        for op in ("dumps", "loads"):
+            calls = snapshot[op]
+            snapshot[f"{op}_avg_ms"] = round(snapshot[f"{op}_seconds"] * 1000 / calls, 3) if calls else None
+        return snapshot
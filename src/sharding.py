@@ -0,0 +1,97 @@
+"""Split a test run across sandboxes and merge the pieces back.
+
+Shards are balanced with the longest-processing-time heuristic on test
+durations recorded by earlier runs (JUnit ``time``). Tests never timed before
+are given the median known duration. The ids come from pytest's own
+collection (:func:`collect_command`), so unittest classes, nested classes and
+parametrized cases are all sharded. Each shard writes its own coverage.py
+JSON report, and :func:`merge_coverage` unions them: a line counts as executed
+if any shard executed it.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import shlex
+import statistics
+from typing import Dict, Iterable, List, Optional
+
+
+def collect_command(test_path: str) -> str:
+    return f"python -m pytest --collect-only -q -p no:cacheprovider {shlex.quote(test_path)}"
+
+
+def collected_test_ids(output: str) -> List[str]:
+    """Node ids from ``pytest --collect-only -q`` output (the summary and warnings are skipped)."""
+    return [line.strip() for line in (output or "").splitlines()
+            if "::" in line and not line[:1].isspace() and " " not in line.strip()]
+
+
+def plan_shards(test_ids: List[str], durations: Dict[str, float], shards: int) -> List[List[str]]:
+    """Partition ``test_ids`` into at most ``shards`` groups of roughly equal total duration."""
+    shards = max(1, min(shards, len(test_ids)))
+    if shards == 1:
+        return [list(test_ids)]
+    known = [durations[t] for t in test_ids if t in durations]
+    default = statistics.median(known) if known else 1.0
+    heap = [(0.0, index) for index in range(shards)]
+    groups: List[List[str]] = [[] for _ in range(shards)]
+    for test_id in sorted(test_ids, key=lambda t: (-durations.get(t, default), t)):
+        load, index = heapq.heappop(heap)
+        groups[index].append(test_id)
+        heapq.heappush(heap, (load + durations.get(test_id, default), index))
+    return [group for group in groups if group]
+
+
+def merge_coverage(reports: Iterable[str]) -> str:
+    """Union several coverage.py JSON reports (as text) into one report."""
+    files: Dict[str, dict] = {}
+    for raw in reports:
+        try:
+            report = json.loads(raw or "{}")
+        except (TypeError, ValueError):
+            continue
+        for name, data in (report.get("files") or {}).items():
+            merged = files.setdefault(name, {"executed": set(), "statements": set(), "contexts": {}})
+            executed = set(data.get("executed_lines") or [])
+            merged["executed"] |= executed
+            merged["statements"] |= executed | set(data.get("missing_lines") or [])
+            for line, contexts in (data.get("contexts") or {}).items():
+                seen = merged["contexts"].setdefault(line, [])
+                seen.extend(c for c in contexts if c not in seen)
+
+    out_files = {}
+    covered = statements = 0
+    for name, merged in files.items():
+        executed, missing = sorted(merged["executed"]), sorted(merged["statements"] - merged["executed"])
+        covered += len(executed)
+        statements += len(merged["statements"])
+        out_files[name] = {
+            "executed_lines": executed,
+            "missing_lines": missing,
+            "contexts": merged["contexts"],
+            "summary": {
+                "covered_lines": len(executed),
+                "num_statements": len(merged["statements"]),
+                "percent_covered": _percent(len(executed), len(merged["statements"])),
+            },
+        }
+    totals = {"covered_lines": covered, "num_statements": statements, "percent_covered": _percent(covered, statements)}
+    return json.dumps({"files": out_files, "totals": totals})
+
+
+def coverage_percent(coverage_json: str, source_path: str) -> Optional[float]:
+    """Statement coverage of one file in a coverage.py JSON report; None when absent."""
+    try:
+        report = json.loads(coverage_json or "{}")
+    except (TypeError, ValueError):
+        return None
+    for name, data in (report.get("files") or {}).items():
+        if name.replace("\\", "/").endswith(source_path):
+            executed = len(data.get("executed_lines") or [])
+            return _percent(executed, executed + len(data.get("missing_lines") or []))
+    return None
+
+
+def _percent(covered: int, total: int) -> float:
+    return 100.0 * covered / total if total else 100.0
@@ -29,16 +29,22 @@ class AgentState(TypedDict):
     # --- Executor Artifacts ---
     execution_status: str
     execution_logs: Optional[str]
+    execution_result: Optional[dict]   # structured JUnit/coverage summary (src/results.py)
     iteration_count: int
     sandbox_session_id: Optional[str]
+    run_full_suite: bool                       # /approve full: skip test impact selection
+    test_coverage_map: Dict[str, List[str]]    # test id -> symbols it executed in earlier runs
+    test_durations: Dict[str, float]           # test id -> seconds, for balancing shards
 
     # --- Agent C Artifacts ---
     documentation_diff: Optional[str]
     updated_readme: Optional[str]
+    documentation_for: Optional[str]  # hash of the code the docs describe
 
     # --- Agent T (Test Engineer) Artifacts ---
     existing_test_path: Optional[str]
     existing_test_code: Optional[str]
+    related_test_paths: List[str]   # every test file importing the target
     final_test_code: Optional[str]
     coverage_score: Optional[float]
     pypi_dependencies: List[str]    
@@ -0,0 +1,117 @@
+"""Locate and load the tests that cover a reviewed file.
+
+Runs as ``test_discovery_node``, a branch parallel to Agent A: nothing here
+depends on the review, so finding the suite overlaps with the reviewer's LLM
+call instead of preceding it. The suite Agent T edits (and ``/approve`` pushes)
+is only ever the file named after the target (``test_<name>.py`` /
+``<name>_test.py``). Other test files that import the target module are
+reported as ``related_test_paths``, read-only context that is never rewritten.
+Files already in the repo map are used as-is. Others come from an optional
+``test_source`` in ``config["configurable"]`` that can list and read the
+branch's test files.
+"""
+from __future__ import annotations
+
+import ast
+import os
+from typing import Dict, Iterable, List, Optional, Protocol
+
+# Cap on test files fetched from the branch only to check what they import.
+MAX_FETCHED_TESTS = int(os.environ.get("TEST_DISCOVERY_MAX_FETCH", "8"))
+
+
+class TestSource(Protocol):
+    def test_paths(self) -> List[str]: ...
+    def read(self, path: str) -> str: ...
+
+
+class BranchTestSource:
+    """Lists and reads test files on a PR branch through a :class:`GitHubConnector`."""
+
+    def __init__(self, gh, branch: str):
+        self.gh = gh
+        self.branch = branch
+
+    def test_paths(self) -> List[str]:
+        return self.gh.list_test_files(branch=self.branch)
+
+    def read(self, path: str) -> str:
+        return self.gh.get_file_content(path, branch=self.branch)
+
+
+def is_test_path(path: str) -> bool:
+    name = path.rsplit("/", 1)[-1]
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+
+def conventional_test_names(file_path: str) -> tuple:
+    """Conventional test file names for ``file_path``: ``test_x.py`` and ``x_test.py``."""
+    name = file_path.rsplit("/", 1)[-1]
+    return f"test_{name}", f"{name[:-3] if name.endswith('.py') else name}_test.py"
+
+
+def module_name(file_path: str) -> str:
+    """Dotted import path of a repo file (``src/pkg/mod.py`` -> ``src.pkg.mod``)."""
+    dotted = file_path[:-3] if file_path.endswith(".py") else file_path
+    dotted = dotted.replace("/", ".")
+    return dotted[: -len(".__init__")] if dotted.endswith(".__init__") else dotted
+
+
+def imports_module(source: str, file_path: str) -> bool:
+    """True when ``source`` imports the module defined by ``file_path`` (by full or trailing dotted path)."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return False
+    target = module_name(file_path)
+    parts = target.split(".")
+    suffixes = {".".join(parts[i:]) for i in range(len(parts))}
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+        else:
+            continue
+        if any(name in suffixes for name in names):
+            return True
+    return False
+
+
+def _name_match(paths: Iterable[str], file_path: str) -> Optional[str]:
+    expected = conventional_test_names(file_path)
+    for path in paths:
+        if path.rsplit("/", 1)[-1] in expected:
+            return path
+    return None
+
+
+def discover(file_path: str, repo_files: Dict[str, str], source: Optional[TestSource] = None) -> dict:
+    """Return the named suite (``existing_test_path`` / ``existing_test_code``) and every test importing the target."""
+    tests = {path: code for path, code in repo_files.items() if is_test_path(path)}
+
+    if source is not None:
+        try:
+            remote = [p for p in source.test_paths() if p not in tests]
+        except Exception as exc:
+            print(f"   Test discovery could not list branch tests: {exc}")
+            remote = []
+        stem = file_path.rsplit("/", 1)[-1][:-3]
+        # Named matches first, then tests whose name mentions the module.
+        named = _name_match(remote, file_path)
+        wanted = ([named] if named else []) + [p for p in remote if stem in p.rsplit("/", 1)[-1] and p != named]
+        for path in wanted[:MAX_FETCHED_TESTS]:
+            try:
+                tests[path] = source.read(path)
+            except Exception as exc:
+                print(f"   Test discovery could not load {path}: {exc}")
+
+    related = sorted(path for path, code in tests.items() if imports_module(code, file_path))
+    # Only a name match is the target's own suite; an importer may test something else entirely.
+    existing = _name_match(sorted(tests), file_path)
+    return {
+        "existing_test_path": existing,
+        "existing_test_code": tests.get(existing) if existing else None,
+        "related_test_paths": related,
+    }
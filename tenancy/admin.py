@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import OrganizationConfig, RepoSettings, ReviewSession
+from .models import NodeMetric, OrganizationConfig, RepoSettings, ReviewSession
 
 
 @admin.register(OrganizationConfig)
@@ -32,3 +32,20 @@ class ReviewSessionAdmin(admin.ModelAdmin):
     list_filter = ("current_status",)
     search_fields = ("pr_number", "commit_sha")
     readonly_fields = ("langgraph_thread_id", "updated_at")
+
+
+@admin.register(NodeMetric)
+class NodeMetricAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "session",
+        "node",
+        "kind",
+        "model_name",
+        "input_tokens",
+        "output_tokens",
+        "wall_ms",
+        "created_at",
+    )
+    list_filter = ("kind", "node", "org_config")
+    readonly_fields = ("created_at",)
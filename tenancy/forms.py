@@ -53,6 +53,13 @@ class RepoSettingsForm(forms.ModelForm):
         required=False,
         help_text="Globs skipped during AST parsing, e.g. tests/*",
     )
+    node_models_text = forms.CharField(
+        label="Per-node model overrides (one node=model per line)",
+        widget=forms.Textarea(attrs={"rows": 3}),
+        required=False,
+        help_text="e.g. documenter=gemini-2.5-flash-lite. Nodes: "
+                  + ", ".join(OrganizationConfig.TIERED_NODES) + ".",
+    )
 
     class Meta:
         model = RepoSettings
@@ -64,6 +71,9 @@ class RepoSettingsForm(forms.ModelForm):
             self.fields["ignored_directories_text"].initial = "\n".join(
                 self.instance.ignored_directories or []
             )
+            self.fields["node_models_text"].initial = "\n".join(
+                f"{node}={model}" for node, model in (self.instance.node_models or {}).items()
+            )
 
     def clean(self):
         cleaned = super().clean()
@@ -71,11 +81,24 @@ class RepoSettingsForm(forms.ModelForm):
         cleaned["ignored_directories"] = [
             line.strip() for line in raw.splitlines() if line.strip()
         ]
+
+        node_models = {}
+        for line in cleaned.get("node_models_text", "").splitlines():
+            if not line.strip():
+                continue
+            node, sep, model = line.partition("=")
+            node, model = node.strip(), model.strip()
+            if not sep or not model or node not in OrganizationConfig.TIERED_NODES:
+                self.add_error("node_models_text", f"Invalid override: {line.strip()!r}")
+                continue
+            node_models[node] = model
+        cleaned["node_models"] = node_models
         return cleaned
 
     def save(self, commit=True):
         obj = super().save(commit=False)
         obj.ignored_directories = self.cleaned_data.get("ignored_directories", [])
+        obj.node_models = self.cleaned_data.get("node_models", {})
         if commit:
             obj.save()
         return obj
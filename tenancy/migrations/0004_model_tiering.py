@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenancy', '0003_remove_reviewsession_tenancy_rev_repo_se_94d296_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='auto_escalate',
+            field=models.BooleanField(default=False, help_text='Move retries onto escalation_model once an iteration has failed.'),
+        ),
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='escalation_model',
+            field=models.CharField(blank=True, default='', help_text='Stronger model the refactorer, test engineer and diplomat switch to after a failed iteration.', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='node_models',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-node model overrides, e.g. {"documenter": "gemini-2.5-flash-lite"}. Nodes not listed use llm_model_name.'),
+        ),
+        migrations.AddField(
+            model_name='reposettings',
+            name='node_models',
+            field=models.JSONField(blank=True, default=dict, help_text="Per-node model overrides for this repo; take precedence over the organization's."),
+        ),
+    ]
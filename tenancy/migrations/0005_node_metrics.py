@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenancy', '0004_model_tiering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node', models.CharField(max_length=40)),
+                ('kind', models.CharField(choices=[('llm', 'LLM call'), ('sandbox', 'Sandbox run')], default='llm', max_length=10)),
+                ('provider', models.CharField(blank=True, default='', max_length=40)),
+                ('model_name', models.CharField(blank=True, default='', max_length=100)),
+                ('input_tokens', models.IntegerField(default=0)),
+                ('output_tokens', models.IntegerField(default=0)),
+                ('wall_ms', models.IntegerField(default=0)),
+                ('cost_micro_usd', models.BigIntegerField(default=0, help_text='Estimated cost in millionths of a USD (0 when the model has no configured price).')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('org_config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='tenancy.organizationconfig')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='tenancy.reviewsession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['org_config', 'created_at'], name='tenancy_nod_org_con_ecfe05_idx'), models.Index(fields=['session'], name='tenancy_nod_session_af5cc8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenancy', '0005_node_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='fallback_model',
+            field=models.CharField(blank=True, default='', help_text="Secondary model (same provider and key) used when the primary model's calls fail.", max_length=100),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenancy', '0006_fallback_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='llm_rpm_limit',
+            field=models.PositiveIntegerField(blank=True, default=0, help_text='Requests per minute allowed by the LLM key (0 = learn from 429 responses).'),
+        ),
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='llm_tpm_limit',
+            field=models.PositiveIntegerField(blank=True, default=0, help_text='Tokens per minute allowed by the LLM key (0 = learn from 429 responses).'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenancy', '0007_rate_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nodemetric',
+            name='install_saved_ms',
+            field=models.IntegerField(default=0, help_text='Sandbox runs: dependency install time skipped thanks to a cached environment.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenancy', '0008_sandbox_install_saved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationconfig',
+            name='executor_backend',
+            field=models.CharField(blank=True, choices=[('e2b', 'E2B cloud sandbox'), ('local', 'Local subprocess (on-prem)')], default='', help_text='Sandbox backend for test runs. Local runs execute on the worker host; use only for trusted repos.', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenancy', '0009_executor_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nodemetric',
+            name='raw_bytes',
+            field=models.BigIntegerField(default=0, help_text='Checkpoint serialization: payload bytes before compression.'),
+        ),
+        migrations.AddField(
+            model_name='nodemetric',
+            name='stored_bytes',
+            field=models.BigIntegerField(default=0, help_text='Checkpoint serialization: payload bytes as stored.'),
+        ),
+        migrations.AlterField(
+            model_name='nodemetric',
+            name='kind',
+            field=models.CharField(choices=[('llm', 'LLM call'), ('sandbox', 'Sandbox run'), ('checkpoint', 'Checkpoint serialization')], default='llm', max_length=10),
+        ),
+    ]
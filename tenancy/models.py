@@ -6,6 +6,7 @@ stored here — only tenant config, encrypted BYOK keys, and review-session
 metadata.
 """
 from __future__ import annotations
+import hashlib
 import uuid
 from django.db import models
 from .crypto import decrypt_key, encrypt_key
@@ -19,6 +20,10 @@ class OrganizationConfig(models.Model):
         GROQ = "groq", "Groq"
         LOCAL = "local", "Local Setup / Ollama"
 
+    class ExecutorChoices(models.TextChoices):
+        E2B = "e2b", "E2B cloud sandbox"
+        LOCAL = "local", "Local subprocess (on-prem)"
+
     github_installation_id = models.IntegerField(
         unique=True,
         help_text="Unique installation id supplied by GitHub during app setup.",
@@ -49,8 +54,56 @@ class OrganizationConfig(models.Model):
         help_text="AES-encrypted API key string matching the selected provider."
     )
     encrypted_e2b_key = models.BinaryField(null=True, blank=True)
+
+    # Model tiering: cheap nodes can run on a fast model, hard ones on a strong one.
+    node_models = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Per-node model overrides, e.g. {"documenter": "gemini-2.5-flash-lite"}. '
+                  "Nodes not listed use llm_model_name.",
+    )
+    escalation_model = models.CharField(
+        max_length=100,
+        blank=True,
+        default="",
+        help_text="Stronger model the refactorer, test engineer and diplomat switch to after a failed iteration.",
+    )
+    auto_escalate = models.BooleanField(
+        default=False,
+        help_text="Move retries onto escalation_model once an iteration has failed.",
+    )
+    # Resilience: where calls go when the primary model is failing or its circuit is open.
+    fallback_model = models.CharField(
+        max_length=100,
+        blank=True,
+        default="",
+        help_text="Secondary model (same provider and key) used when the primary model's calls fail.",
+    )
+    # Rate governor: proactive per-key budgets (0 = learn from the provider's 429s).
+    llm_rpm_limit = models.PositiveIntegerField(
+        default=0,
+        blank=True,
+        help_text="Requests per minute allowed by the LLM key (0 = learn from 429 responses).",
+    )
+    llm_tpm_limit = models.PositiveIntegerField(
+        default=0,
+        blank=True,
+        help_text="Tokens per minute allowed by the LLM key (0 = learn from 429 responses).",
+    )
+    # Where the executor node runs tests (blank = the EXECUTOR_BACKEND default).
+    # Operator-only (Django admin): "local" runs tenant code on the worker host.
+    executor_backend = models.CharField(
+        max_length=20,
+        choices=ExecutorChoices.choices,
+        blank=True,
+        default="",
+        help_text="Sandbox backend for test runs. Local runs execute on the worker host; use only for trusted repos.",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Graph nodes whose model can be tiered (keys of ``node_models``).
+    TIERED_NODES = ("reviewer", "refactorer", "test_engineer", "documenter", "diplomat")
+
     def set_llm_key(self, plaintext: str) -> None:
         self.encrypted_llm_key = encrypt_key(plaintext)
 
@@ -74,6 +127,37 @@ class OrganizationConfig(models.Model):
             return bool(self.encrypted_e2b_key)
         return bool(self.encrypted_llm_key and self.encrypted_e2b_key)
 
+    @property
+    def llm_key_fingerprint(self) -> str:
+        """Stable, non-reversible id of the stored LLM key, used to share its rate window."""
+        if not self.encrypted_llm_key:
+            return f"org-{self.pk}"
+        return hashlib.sha256(bytes(self.encrypted_llm_key)).hexdigest()[:32]
+
+    def usage_by_node(self) -> list:
+        """Metered tokens, wall time and estimated cost per graph node (dashboard rollup)."""
+        rows = (
+            self.metrics.values("node", "kind")
+            .annotate(
+                calls=models.Count("id"),
+                input_tokens=models.Sum("input_tokens"),
+                output_tokens=models.Sum("output_tokens"),
+                wall_ms=models.Sum("wall_ms"),
+                install_saved_ms=models.Sum("install_saved_ms"),
+                cost_micro_usd=models.Sum("cost_micro_usd"),
+            )
+            .order_by("node", "kind")
+        )
+        return [
+            {
+                **row,
+                "wall_s": row["wall_ms"] / 1000,
+                "install_saved_s": row["install_saved_ms"] / 1000,
+                "cost_usd": row["cost_micro_usd"] / 1_000_000,
+            }
+            for row in rows
+        ]
+
     def __str__(self) -> str:
         return f"OrganizationConfig(installation={self.github_installation_id})"
 
@@ -99,6 +183,11 @@ class RepoSettings(models.Model):
         default=2,
         help_text="Maximum overlapping active review executions for this repo.",
     )
+    node_models = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Per-node model overrides for this repo; take precedence over the organization's.",
+    )
 
     class Meta:
         constraints = [
@@ -163,3 +252,60 @@ class ReviewSession(models.Model):
             f"ReviewSession(repo={self.repo_settings.repository_name}, "
             f"pr={self.pr_number}, file={self.file_path}, status={self.current_status})"
         )
+
+
+class NodeMetric(models.Model):
+    """One metered LLM call or sandbox run inside a review graph.
+
+    Holds counters and timings only (never prompts or code), attributed to the
+    review session and, denormalised for rollups, to the tenant.
+    """
+
+    class Kind(models.TextChoices):
+        LLM = "llm", "LLM call"
+        SANDBOX = "sandbox", "Sandbox run"
+        CHECKPOINT = "checkpoint", "Checkpoint serialization"
+
+    session = models.ForeignKey(
+        ReviewSession,
+        on_delete=models.CASCADE,
+        related_name="metrics",
+    )
+    org_config = models.ForeignKey(
+        OrganizationConfig,
+        on_delete=models.CASCADE,
+        related_name="metrics",
+    )
+    node = models.CharField(max_length=40)
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.LLM)
+    provider = models.CharField(max_length=40, blank=True, default="")
+    model_name = models.CharField(max_length=100, blank=True, default="")
+    input_tokens = models.IntegerField(default=0)
+    output_tokens = models.IntegerField(default=0)
+    wall_ms = models.IntegerField(default=0)
+    install_saved_ms = models.IntegerField(
+        default=0,
+        help_text="Sandbox runs: dependency install time skipped thanks to a cached environment.",
+    )
+    cost_micro_usd = models.BigIntegerField(
+        default=0,
+        help_text="Estimated cost in millionths of a USD (0 when the model has no configured price).",
+    )
+    raw_bytes = models.BigIntegerField(
+        default=0,
+        help_text="Checkpoint serialization: payload bytes before compression.",
+    )
+    stored_bytes = models.BigIntegerField(
+        default=0,
+        help_text="Checkpoint serialization: payload bytes as stored.",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["org_config", "created_at"]),
+            models.Index(fields=["session"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"NodeMetric(session={self.session_id}, node={self.node}, kind={self.kind})"
@@ -66,3 +66,51 @@ class ConcurrencyModelTests(TestCase):
         self.assertTrue(self.org.has_keys)
         self.assertEqual(self.org.get_gemini_key(), "g-key")
         self.assertEqual(self.org.get_e2b_key(), "e-key")
+
+
+class ModelTieringTests(SimpleTestCase):
+    def test_repo_overrides_org_overrides_default(self):
+        from engine.services import resolve_node_models
+
+        org = OrganizationConfig(llm_model_name="gemini-2.5-flash",
+                                 node_models={"documenter": "gemini-2.5-flash-lite", "refactorer": "gemini-2.5-pro"})
+        repo = RepoSettings(org_config=org, repository_name="o/r", node_models={"refactorer": "gpt-4o"})
+
+        models = resolve_node_models(org, repo)
+        self.assertEqual(models["documenter"], "gemini-2.5-flash-lite")
+        self.assertEqual(models["refactorer"], "gpt-4o")
+        self.assertEqual(models["reviewer"], "gemini-2.5-flash")
+
+    def test_build_llm_uses_node_and_escalation_models(self):
+        from src.agents import _build_llm
+
+        injected = object()
+        config = {"configurable": {
+            "llm": injected,
+            "llm_provider": "openai",
+            "llm_model_name": "gpt-4o-mini",
+            "llm_key": "sk-test",
+            "node_models": {"reviewer": "gpt-4o-mini", "refactorer": "gpt-4o"},
+            "escalation_model": "o3",
+        }}
+        self.assertIs(_build_llm(config, "reviewer"), injected)
+        self.assertEqual(_build_llm(config, "refactorer").model_name, "gpt-4o")
+        self.assertEqual(_build_llm(config, "refactorer", escalate=True).model_name, "o3")
+
+    def test_dashboard_form_collects_node_models(self):
+        from tenancy.views import DynamicConfigForm
+
+        form = DynamicConfigForm({
+            "llm_provider": "gemini",
+            "llm_model_name": "gemini-2.5-flash",
+            "documenter_model": " gemini-2.5-flash-lite ",
+            "reviewer_model": "",
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.node_models(), {"documenter": "gemini-2.5-flash-lite"})
+
+    def test_tenants_cannot_pick_the_executor_backend(self):
+        from tenancy.views import DynamicConfigForm
+
+        # "local" runs tenant code on the worker host; only operators set it, in the admin.
+        self.assertNotIn("executor_backend", DynamicConfigForm().fields)
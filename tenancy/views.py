@@ -108,11 +108,36 @@ class DynamicConfigForm(forms.ModelForm):
 
     class Meta:
         model = OrganizationConfig
-        fields = ["llm_provider", "llm_model_name", "llm_base_url"]
+        fields = ["llm_provider", "llm_model_name", "llm_base_url", "escalation_model", "auto_escalate", "fallback_model",
+                  "llm_rpm_limit", "llm_tpm_limit"]
         labels = {
             "llm_provider": "LLM Provider",
             "llm_model_name": "Target Model Name",
             "llm_base_url": "Base URL (Optional)",
+            "escalation_model": "Escalation Model (Optional)",
+            "auto_escalate": "Escalate retries to the stronger model",
+            "fallback_model": "Fallback Model (Optional)",
+            "llm_rpm_limit": "Key Requests / Minute (0 = learn)",
+            "llm_tpm_limit": "Key Tokens / Minute (0 = learn)",
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # One optional model override per tiered graph node, stored in ``node_models``.
+        overrides = (self.instance.node_models or {}) if self.instance else {}
+        for node in OrganizationConfig.TIERED_NODES:
+            self.fields[f"{node}_model"] = forms.CharField(
+                required=False,
+                initial=overrides.get(node, ""),
+                label=f"{node.replace('_', ' ').title()} Model (Optional)",
+                widget=forms.TextInput(attrs={"placeholder": "Leave blank to use the target model"}),
+            )
+
+    def node_models(self) -> dict:
+        return {
+            node: self.cleaned_data[f"{node}_model"].strip()
+            for node in OrganizationConfig.TIERED_NODES
+            if self.cleaned_data.get(f"{node}_model", "").strip()
         }
 
 def org_keys(request, org_id: int):
@@ -128,6 +153,12 @@ def org_keys(request, org_id: int):
             org.llm_provider = form.cleaned_data.get("llm_provider")
             org.llm_model_name = form.cleaned_data.get("llm_model_name")
             org.llm_base_url = form.cleaned_data.get("llm_base_url") or ""
+            org.escalation_model = form.cleaned_data.get("escalation_model") or ""
+            org.auto_escalate = form.cleaned_data.get("auto_escalate", False)
+            org.fallback_model = form.cleaned_data.get("fallback_model") or ""
+            org.llm_rpm_limit = form.cleaned_data.get("llm_rpm_limit") or 0
+            org.llm_tpm_limit = form.cleaned_data.get("llm_tpm_limit") or 0
+            org.node_models = form.node_models()
             
             llm_key = form.cleaned_data.get("llm_key")
             e2b_key = form.cleaned_data.get("e2b_key")
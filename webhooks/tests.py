@@ -50,10 +50,17 @@ class WebhookSignatureTests(SimpleTestCase):
         task.delay.assert_called_once()
 
     @mock.patch("webhooks.views.handle_pull_request")
-    def test_ignores_unsupported_pr_action(self, task):
+    def test_enqueues_closed_pull_request(self, task):
         payload = {"action": "closed", "pull_request": {"number": 1}}
         resp = github_webhook(self._post(payload, "pull_request"))
         self.assertEqual(resp.status_code, 200)
+        task.delay.assert_called_once()
+
+    @mock.patch("webhooks.views.handle_pull_request")
+    def test_ignores_unsupported_pr_action(self, task):
+        payload = {"action": "labeled", "pull_request": {"number": 1}}
+        resp = github_webhook(self._post(payload, "pull_request"))
+        self.assertEqual(resp.status_code, 200)
         task.delay.assert_not_called()
 
     @mock.patch("webhooks.views.handle_issue_comment")
@@ -2,7 +2,7 @@
 
 A single endpoint that must, within GitHub's 10-second delivery budget:
   1. Verify the HMAC-SHA256 payload signature.
-  2. Accept only ``pull_request`` (opened/synchronize) and ``issue_comment``
+  2. Accept only ``pull_request`` (opened/synchronize/closed) and ``issue_comment``
      / ``pull_request_review_comment`` (created) events.
   3. Enqueue the work onto Celery (Redis) and return HTTP 200 immediately.
 
@@ -57,8 +57,8 @@ def github_webhook(request):
     if event in ("issue_comment", "pull_request_review_comment"):
         print(f"\n--- INCOMING WEBHOOK: {event} | ACTION: {action} ---")
 
-    # Handles Fresh PR Opens/Syncs
-    if event == "pull_request" and action in ("opened", "synchronize"):
+    # Handles Fresh PR Opens/Syncs, and closes (which end the PR's reviews)
+    if event == "pull_request" and action in ("opened", "synchronize", "closed"):
         handle_pull_request.delay(payload)
         return JsonResponse({"status": "queued", "event": "pull_request"})
 